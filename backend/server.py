@@ -1,32 +1,62 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form, Query, Request, BackgroundTasks
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from starlette.datastructures import Headers
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, IndexModel, ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
 import os
+import re
+import asyncio
+import json
+import csv
+import base64
+import hashlib
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, ValidationError
 from typing import List, Optional
 import uuid
-from datetime import datetime, timezone, timedelta
+import time
+import zipfile
+import copy
+import functools
+import itertools
+import threading
+from collections import OrderedDict
+from xml.sax.saxutils import escape as xml_escape
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime, timezone, timedelta
+from email.utils import formatdate, parsedate_to_datetime
+from mimetypes import guess_type
+from urllib.parse import quote
 from passlib.context import CryptContext
 import jwt
 import io
-import shutil
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles import Font, Alignment, Border, Side, PatternFill, NamedStyle
+from openpyxl.utils import get_column_letter
+from reportlab import rl_config
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.units import inch
 from reportlab.pdfgen import canvas
 from reportlab.lib import colors
+from reportlab.lib.utils import ImageReader
 from reportlab.platypus import Table, TableStyle
 import barcode
 from barcode.writer import ImageWriter
 import qrcode
-from PIL import Image, ImageDraw, ImageFont
-from docxtpl import DocxTemplate
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+from lxml import etree
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -36,9 +66,38 @@ UPLOAD_DIR = ROOT_DIR / 'uploads'
 CERTIFICATES_DIR = UPLOAD_DIR / 'certificates'
 MANUALS_DIR = UPLOAD_DIR / 'manuals'
 RECEIPTS_DIR = UPLOAD_DIR / 'receipts'
+LABELS_DIR = UPLOAD_DIR / 'labels'  # Rendered QR label cache, safe to delete
+BLOBS_DIR = UPLOAD_DIR / 'blobs'  # Content-addressed attachments, see blob_gc.py
+THUMBNAILS_DIR = UPLOAD_DIR / 'thumbnails'  # Certificate previews, regenerated on demand
 CERTIFICATES_DIR.mkdir(parents=True, exist_ok=True)
 MANUALS_DIR.mkdir(parents=True, exist_ok=True)
 RECEIPTS_DIR.mkdir(parents=True, exist_ok=True)
+LABELS_DIR.mkdir(parents=True, exist_ok=True)
+BLOBS_DIR.mkdir(parents=True, exist_ok=True)
+THUMBNAILS_DIR.mkdir(parents=True, exist_ok=True)
+
+LOAN_TEMPLATE_PATH = ROOT_DIR / "templates" / "loan_template_bki_format.docx"
+
+# Upload size caps per attachment kind, in bytes
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_BYTES = {
+    "certificate": int(os.environ.get('UPLOAD_MAX_CERTIFICATE_BYTES', 20 * 1024 * 1024)),
+    "manual": int(os.environ.get('UPLOAD_MAX_MANUAL_BYTES', 100 * 1024 * 1024)),
+    "receipt": int(os.environ.get('UPLOAD_MAX_RECEIPT_BYTES', 20 * 1024 * 1024)),
+    "tool import": int(os.environ.get('UPLOAD_MAX_TOOL_IMPORT_BYTES', 20 * 1024 * 1024)),
+}
+# Upload routes and the kind whose cap bounds their whole request body, plus
+# room for the multipart framing and the small form fields sent alongside
+UPLOAD_ROUTE_KINDS = [
+    (re.compile(r"^/api/tools/[^/]+/upload-certificate$"), "certificate"),
+    (re.compile(r"^/api/tools/[^/]+/upload-manual$"), "manual"),
+    (re.compile(r"^/api/stock/[^/]+/upload-receipt$"), "receipt"),
+    (re.compile(r"^/api/tools/import$"), "tool import"),
+]
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+ATTACHMENT_READ_CHUNK_SIZE = 64 * 1024
+BLOB_GC_GRACE_SECONDS = 3600  # Unreferenced blobs and stray files younger than this are kept
+BLOB_ACQUIRE_ATTEMPTS = 5  # Waits for the collector to drop a blob it is deleting
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
@@ -52,6 +111,265 @@ SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production'
 ALGORITHM = "HS256"
 ENVIRONMENT = os.environ.get('ENVIRONMENT', 'production')  # Default to production for safety
 
+# bcrypt runs on a bounded thread pool so logins never block the event loop;
+# the worker count caps how many hashes run at once
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 4))
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+# Render pool for CPU-bound documents (labels, Excel, DOCX)
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', min(2, os.cpu_count() or 1)))
+RENDER_QUEUE_LIMIT = int(os.environ.get('RENDER_QUEUE_LIMIT', 16))
+RENDER_TIMEOUT_SECONDS = float(os.environ.get('RENDER_TIMEOUT_SECONDS', 60))
+
+# QR label cache; bump LABEL_LAYOUT_VERSION whenever render_tool_label output changes
+LABEL_LAYOUT_VERSION = 1
+LABEL_CACHE_MEMORY_ENTRIES = int(os.environ.get('LABEL_CACHE_MEMORY_ENTRIES', 256))
+# The on-disk cache is pruned back to this size, least recently used labels first
+LABEL_CACHE_MAX_BYTES = int(os.environ.get('LABEL_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+LABEL_CACHE_PRUNE_INTERVAL_SECONDS = int(os.environ.get('LABEL_CACHE_PRUNE_INTERVAL_SECONDS', 3600))
+
+# Batch label sheets
+LABEL_BATCH_MAX_TOOLS = int(os.environ.get('LABEL_BATCH_MAX_TOOLS', 2000))
+LABEL_BATCH_CHUNK_SIZE = 25
+LABEL_SHEET_COLUMNS = 2
+LABEL_SHEET_ROWS = 3
+# A sheet renders in one job; its timeout grows with the label count (about 18ms per label measured)
+LABEL_SHEET_SECONDS_PER_LABEL = float(os.environ.get('LABEL_SHEET_SECONDS_PER_LABEL', 0.05))
+# Embed images as binary streams: reportlab's ASCII85 encoder is pure Python and
+# took over half of a label sheet's render time
+rl_config.useA85 = 0
+
+# Certificate previews: longest edge in pixels, and format -> (Pillow format, media type)
+THUMBNAIL_SIZES = (160, 480, 1024)
+THUMBNAIL_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+THUMBNAIL_SOURCE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif", ".tif", ".tiff"}
+
+# Bulk loan form export
+LOAN_EXPORT_MAX_LOANS = int(os.environ.get('LOAN_EXPORT_MAX_LOANS', 500))
+
+# Tool register Excel export
+TOOL_EXPORT_HEADERS = [
+    "No.", "Equipment Name", "Brand/Type", "Serial No.", "Inventory Code", "Asset Number",
+    "Periodic Inspection Date", "Calibration Date", "Calibration Expiry Date",
+    "Status", "Condition", "Description", "Equipment Location"
+]
+TOOL_EXPORT_COLUMN_WIDTHS = [5, 25, 20, 15, 15, 15, 20, 18, 20, 15, 12, 30, 20]
+EXCEL_EXPORT_BATCH_SIZE = 1000
+TOOL_SHEET_PATH = "xl/worksheets/sheet1.xml"
+STREAM_QUEUE_CHUNKS = 8
+
+# Bulk tool import reads the export layout (xlsx or csv). No., Calibration
+# Expiry Date and Status are derived, so they are ignored on the way in.
+TOOL_IMPORT_COLUMNS = {
+    "Equipment Name": "equipment_name",
+    "Brand/Type": "brand_type",
+    "Serial No.": "serial_no",
+    "Inventory Code": "inventory_code",
+    "Asset Number": "asset_number",
+    "Periodic Inspection Date": "periodic_inspection_date",
+    "Calibration Date": "calibration_date",
+    "Calibration Validity (Months)": "calibration_validity_months",  # Optional, not exported
+    "Condition": "condition",
+    "Description": "description",
+    "Equipment Location": "equipment_location",
+}
+TOOL_IMPORT_REQUIRED_COLUMNS = [
+    "Equipment Name", "Brand/Type", "Serial No.", "Inventory Code", "Condition", "Equipment Location"
+]
+TOOL_IMPORT_MAX_ROWS = int(os.environ.get('TOOL_IMPORT_MAX_ROWS', 20000))
+TOOL_IMPORT_BATCH_SIZE = 1000
+
+# Bulk CSV/Parquet exports. Column types: string, int, date (YYYY-MM-DD) or
+# timestamp (UTC); loans are flattened to one row per borrowed equipment.
+EXPORT_BATCH_SIZE = 5000  # Also the Parquet row group size
+EXPORT_DATASETS = {
+    "tools": {
+        "collection": "tools",
+        "date_field": "created_at",
+        "sources": {
+            "status": ["status", "status_next_change", "calibration_date", "calibration_validity_months"],
+            "calibration_expiry_date": ["calibration_expiry_date", "status_next_change", "calibration_date", "calibration_validity_months"],
+        },
+        "columns": {
+            "id": "string",
+            "equipment_name": "string",
+            "brand_type": "string",
+            "serial_no": "string",
+            "inventory_code": "string",
+            "asset_number": "string",
+            "periodic_inspection_date": "date",
+            "calibration_date": "date",
+            "calibration_validity_months": "int",
+            "calibration_expiry_date": "date",
+            "status": "string",
+            "condition": "string",
+            "description": "string",
+            "equipment_location": "string",
+            "created_at": "timestamp",
+            "updated_at": "timestamp",
+        },
+    },
+    "loans": {
+        "collection": "loans",
+        "date_field": "loan_date",
+        "sources": {
+            "loan_id": ["id"],
+            "line_no": ["equipments"],
+            "equipment_name": ["equipments"],
+            "serial_no": ["equipments"],
+            "condition": ["equipments"],
+        },
+        "columns": {
+            "loan_id": "string",
+            "borrower_name": "string",
+            "loan_date": "date",
+            "return_date": "date",
+            "project_name": "string",
+            "wbs_project_no": "string",
+            "project_location": "string",
+            "line_no": "int",
+            "equipment_name": "string",
+            "serial_no": "string",
+            "condition": "string",
+            "created_by": "string",
+            "created_at": "timestamp",
+        },
+    },
+    "calibrations": {
+        "collection": "calibrations",
+        "date_field": "calibration_date",
+        "sources": {},
+        "columns": {
+            "id": "string",
+            "device_name": "string",
+            "serial_no": "string",
+            "calibration_date": "date",
+            "calibration_expiry_date": "date",
+            "device_condition": "string",
+            "calibration_agency": "string",
+            "calibration_location": "string",
+            "person_name": "string",
+            "created_by": "string",
+            "created_at": "timestamp",
+        },
+    },
+    "stock_items": {
+        "collection": "stock_items",
+        "date_field": "created_at",
+        "sources": {},
+        "columns": {
+            "id": "string",
+            "item_name": "string",
+            "brand_specifications": "string",
+            "available_quantity": "int",
+            "unit": "string",
+            "description": "string",
+            "created_at": "timestamp",
+            "updated_at": "timestamp",
+        },
+    },
+}
+
+# Authenticated user cache
+USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', 1024))
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', 60))
+
+# Calibration status
+EXPIRING_SOON_DAYS = 90
+STATUS_REFRESH_INTERVAL_SECONDS = int(os.environ.get('STATUS_REFRESH_INTERVAL_SECONDS', 3600))
+STATUS_REFRESH_BATCH_SIZE = 500
+
+# Declarative index spec, created idempotently at startup
+MONGO_INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], unique=True, name="username_unique"),
+    ],
+    "tools": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("serial_no", ASCENDING)], name="serial_no"),
+        IndexModel([("inventory_code", ASCENDING)], name="inventory_code"),
+        IndexModel([("condition", ASCENDING)], name="condition"),
+        IndexModel([("equipment_location", ASCENDING)], name="equipment_location"),
+        IndexModel([("equipment_name", ASCENDING)], name="equipment_name"),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_at_id"),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], name="status_created_at_id"),
+        IndexModel([("status_next_change", ASCENDING)], name="status_next_change"),
+        IndexModel([("calibration_expiry_date", ASCENDING), ("id", ASCENDING)], name="calibration_expiry_date_id"),
+        IndexModel(
+            [("equipment_location", ASCENDING), ("calibration_expiry_date", ASCENDING), ("id", ASCENDING)],
+            name="equipment_location_calibration_expiry_date_id"
+        ),
+    ],
+    "loans": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("loan_date", ASCENDING)], name="loan_date"),
+        IndexModel([("project_name", ASCENDING), ("loan_date", ASCENDING)], name="project_loan_date"),
+        IndexModel([("returned_at", ASCENDING), ("return_date", ASCENDING)], name="returned_at_return_date"),
+    ],
+    "analysis_reports": [
+        IndexModel([("name", ASCENDING)], unique=True, name="name_unique"),
+    ],
+    "tool_bookings": [
+        IndexModel([("loan_id", ASCENDING)], name="loan_id"),
+        IndexModel([("serial_no", ASCENDING), ("end", ASCENDING), ("start", ASCENDING)], name="serial_end_start"),
+        IndexModel([("end", ASCENDING), ("start", ASCENDING)], name="end_start"),
+    ],
+    "stock_items": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("available_quantity", ASCENDING)], name="available_quantity"),
+    ],
+    "stock_movements": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("item_id", ASCENDING), ("created_at", DESCENDING)], name="item_created_at"),
+    ],
+    "calibrations": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel(
+            [("serial_no", ASCENDING), ("calibration_date", DESCENDING), ("id", DESCENDING)],
+            name="serial_no_calibration_date_id"
+        ),
+    ],
+    "blobs": [
+        IndexModel([("sha256", ASCENDING)], unique=True, name="sha256_unique"),
+        IndexModel([("refcount", ASCENDING), ("released_at", ASCENDING)], name="refcount_released_at"),
+        IndexModel([("deleting", ASCENDING)], name="deleting", sparse=True),
+    ],
+    "analytics_counters": [
+        IndexModel([("kind", ASCENDING), ("key", ASCENDING)], unique=True, name="kind_key_unique"),
+        IndexModel([("kind", ASCENDING), ("count", ASCENDING)], name="kind_count"),
+    ],
+}
+
+# Analytics
+LOW_STOCK_THRESHOLD = 50
+
+# Lost-tool report: unreturned loans past return_date, rebuilt on a schedule.
+# Buckets are (min days overdue, max or None, label)
+LOST_TOOLS_REFRESH_INTERVAL_SECONDS = int(os.environ.get('LOST_TOOLS_REFRESH_INTERVAL_SECONDS', 900))
+# The report is one document; it keeps the most overdue rows and the largest
+# borrower/project groups so it stays far below MongoDB's 16 MB limit
+LOST_TOOLS_REPORT_MAX_ROWS = int(os.environ.get('LOST_TOOLS_REPORT_MAX_ROWS', 500))
+LOST_TOOLS_REPORT_MAX_GROUPS = 50
+OVERDUE_BUCKETS = (
+    (1, 7, "1-7 days"),
+    (8, 30, "8-30 days"),
+    (31, 90, "31-90 days"),
+    (91, None, "Over 90 days"),
+)
+
+# Long-running jobs started at startup, cancelled at shutdown
+background_tasks = []
+
+# Pagination
+TOOLS_PAGE_DEFAULT_LIMIT = 50
+TOOLS_PAGE_MAX_LIMIT = 500
+
+# Calibration planning
+CALIBRATION_TIMELINE_MAX_MONTHS = 60
+
 # Create the main app
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
@@ -136,6 +454,27 @@ class ToolResponse(BaseModel):
     equipment_location: str
     calibration_certificate: Optional[str]
     equipment_manual: Optional[str]
+    certificate_preview: bool = False  # GET /tools/{id}/certificate-preview is available
+
+class ToolPage(BaseModel):
+    items: List[ToolResponse]
+    next_cursor: Optional[str] = None
+
+class LabelBatchRequest(BaseModel):
+    tool_ids: Optional[List[str]] = None  # Takes precedence over the filters
+    condition: Optional[str] = None
+    location: Optional[str] = None
+    equipment_name: Optional[str] = None
+    status: Optional[str] = None
+    search: Optional[str] = None
+    format: str = "pdf"  # 'pdf' or 'zip'
+
+class LoanExportRequest(BaseModel):
+    project_name: Optional[str] = None
+    wbs_project_no: Optional[str] = None
+    date_from: Optional[str] = None  # Inclusive loan_date bounds, YYYY-MM-DD
+    date_to: Optional[str] = None
+    format: str = "zip"  # 'zip' or 'docx' (one merged document)
 
 class LoanEquipment(BaseModel):
     equipment_name: str
@@ -154,6 +493,8 @@ class Loan(BaseModel):
     project_location: str
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     created_by: str
+    returned_at: Optional[datetime] = None  # Null while the equipment is out
+    returned_by: Optional[str] = None
 
 class LoanCreate(BaseModel):
     borrower_name: str
@@ -164,6 +505,17 @@ class LoanCreate(BaseModel):
     wbs_project_no: str
     project_location: str
 
+# One row per (loan, serial_no): the tool is out from start to end, both inclusive
+class ToolBooking(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    loan_id: str
+    serial_no: str
+    equipment_name: str
+    start: str  # loan_date, YYYY-MM-DD
+    end: str  # return_date, YYYY-MM-DD
+    borrower_name: str
+    project_name: str
+
 class Calibration(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -178,6 +530,10 @@ class Calibration(BaseModel):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     created_by: str
 
+class CalibrationPage(BaseModel):
+    items: List[Calibration]
+    next_cursor: Optional[str] = None
+
 class CalibrationCreate(BaseModel):
     device_name: str
     serial_no: str
@@ -211,14 +567,86 @@ class StockItemCreate(BaseModel):
 class StockItemUpdate(BaseModel):
     item_name: Optional[str] = None
     brand_specifications: Optional[str] = None
-    available_quantity: Optional[int] = None
+    available_quantity: Optional[int] = None  # Added to the current quantity
     unit: Optional[str] = None
     description: Optional[str] = None
+    reason: Optional[str] = None  # Recorded in the stock ledger with a quantity change
 
 class StockConsume(BaseModel):
     item_id: str
-    quantity: int
+    quantity: int = Field(gt=0)
+    reason: Optional[str] = None
+
+class StockBatchLine(BaseModel):
+    item_id: str
+    kind: str = Field("consume", pattern="^(consume|add)$")
+    quantity: int = Field(gt=0)
+    reason: Optional[str] = None
+
+class StockBatchRequest(BaseModel):
+    lines: List[StockBatchLine] = Field(min_length=1, max_length=500)
+    reason: Optional[str] = None  # Used for lines without their own
+
+# Append-only ledger of quantity changes
+class StockMovement(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    item_id: str
+    item_name: str
+    kind: str  # 'add', 'consume' or 'adjust' (a negative addition)
+    quantity: int  # Signed change to available_quantity
+    balance_after: int
     reason: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class UserCache:
+    """Bounded LRU of user documents keyed by username, with a per-entry TTL.
+
+    Writes to a user record must call ``invalidate``; the TTL bounds how long
+    changes made outside this process (e.g. check_users.py) stay unseen.
+    """
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+    
+    def get(self, username: str) -> Optional[dict]:
+        entry = self._entries.get(username)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[username]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(username)
+        self.hits += 1
+        return dict(entry[1])
+    
+    def set(self, username: str, user: dict):
+        self._entries[username] = (time.monotonic() + self.ttl_seconds, dict(user))
+        self._entries.move_to_end(username)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def invalidate(self, username: Optional[str] = None):
+        if username is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(username, None)
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+user_cache = UserCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS)
 
 # Helper functions
 def hash_password(password: str) -> str:
@@ -227,6 +655,14 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+async def hash_password_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, verify_password, plain_password, hashed_password)
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(days=7)
@@ -246,20 +682,22 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except Exception:
         raise HTTPException(status_code=401, detail="Could not validate credentials")
     
-    user = await db.users.find_one({"username": username}, {"_id": 0})
+    user = user_cache.get(username)
     if user is None:
-        raise HTTPException(status_code=401, detail="User not found")
+        user = await db.users.find_one({"username": username}, {"_id": 0})
+        if user is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        user_cache.set(username, user)
     return user
 
-# Authentication removed - admin check disabled
-# async def get_admin_user():
-#     if current_user["role"] != "admin":
-#         raise HTTPException(status_code=403, detail="Admin access required")
-#     return current_user
+async def get_admin_user(current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
 
-def calculate_tool_status(calibration_date: Optional[str], validity_months: int):
+def calculate_calibration_expiry(calibration_date: Optional[str], validity_months: int) -> Optional[datetime]:
     if not calibration_date:
-        return "Unknown", None
+        return None
     
     try:
         # Parse calibration date (handle both with and without timezone)
@@ -268,288 +706,869 @@ def calculate_tool_status(calibration_date: Optional[str], validity_months: int)
         else:
             # Date only string - treat as UTC
             cal_date = datetime.fromisoformat(calibration_date).replace(tzinfo=timezone.utc)
+        if cal_date.tzinfo is None:
+            cal_date = cal_date.replace(tzinfo=timezone.utc)
         
-        expiry_date = cal_date + timedelta(days=validity_months * 30)
-        expiry_str = expiry_date.strftime('%Y-%m-%d')
-        
-        now = datetime.now(timezone.utc)
-        days_until_expiry = (expiry_date - now).days
-        
-        if days_until_expiry < 0:
-            return "Expired", expiry_str
-        elif days_until_expiry <= 90:  # 3 months
-            return "Expiring Soon", expiry_str
-        else:
-            return "Valid", expiry_str
-    except Exception as e:
-        return "Unknown", None
-
-# Initialize default admin user
-@app.on_event("startup")
-async def startup_db():
-    # Create default admin if not exists
-    admin_exists = await db.users.find_one({"username": "admin"})
-    if not admin_exists:
-        admin = User(
-            username="admin",
-            password_hash=hash_password("admin123"),
-            role="admin",
-            full_name="System Administrator"
-        )
-        doc = admin.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
-        await db.users.insert_one(doc)
-        logger.info("Default admin user created: username=admin, password=admin123")
+        return cal_date + timedelta(days=validity_months * 30)
+    except Exception:
+        return None
 
-# Auth endpoints
-@api_router.post("/auth/login", response_model=TokenResponse)
-async def login(user_login: UserLogin):
-    user = await db.users.find_one({"username": user_login.username}, {"_id": 0})
-    if not user or not verify_password(user_login.password, user["password_hash"]):
-        raise HTTPException(status_code=401, detail="Invalid username or password")
+def calculate_tool_status(calibration_date: Optional[str], validity_months: int):
+    expiry_date = calculate_calibration_expiry(calibration_date, validity_months)
+    if expiry_date is None:
+        return "Unknown", None
     
-    access_token = create_access_token(data={"sub": user["username"]})
-    user_response = UserResponse(
-        id=user["id"],
-        username=user["username"],
-        role=user["role"],
-        full_name=user["full_name"]
-    )
-    return TokenResponse(access_token=access_token, token_type="bearer", user=user_response)
+    expiry_str = expiry_date.strftime('%Y-%m-%d')
+    
+    now = datetime.now(timezone.utc)
+    days_until_expiry = (expiry_date - now).days
+    
+    if days_until_expiry < 0:
+        return "Expired", expiry_str
+    elif days_until_expiry <= EXPIRING_SOON_DAYS:  # 3 months
+        return "Expiring Soon", expiry_str
+    else:
+        return "Valid", expiry_str
+
+def calibration_status_fields(calibration_date: Optional[str], validity_months: int) -> dict:
+    """Status fields persisted on the tool document.
+
+    ``status_next_change`` is when the stored bucket stops being correct, so the
+    refresh job only has to revisit tools whose threshold has been crossed.
+    """
+    status, expiry_str = calculate_tool_status(calibration_date, validity_months)
+    next_change = None
+    if status == "Valid":
+        expiry_date = calculate_calibration_expiry(calibration_date, validity_months)
+        next_change = expiry_date - timedelta(days=EXPIRING_SOON_DAYS + 1)
+    elif status == "Expiring Soon":
+        next_change = calculate_calibration_expiry(calibration_date, validity_months)
+    return {
+        "status": status,
+        "calibration_expiry_date": expiry_str,
+        "status_next_change": next_change
+    }
 
-@api_router.get("/auth/me", response_model=UserResponse)
-async def get_me(current_user: dict = Depends(get_current_user)):
-    return UserResponse(
-        id=current_user["id"],
-        username=current_user["username"],
-        role=current_user["role"],
-        full_name=current_user["full_name"]
+def tool_status(tool: dict):
+    """Stored status of a tool document, recomputed only when it is stale or missing"""
+    next_change = tool.get('status_next_change')
+    if next_change is not None and next_change.tzinfo is None:
+        next_change = next_change.replace(tzinfo=timezone.utc)
+    if 'status' in tool and (next_change is None or next_change > datetime.now(timezone.utc)):
+        return tool['status'], tool.get('calibration_expiry_date')
+    return calculate_tool_status(
+        tool.get('calibration_date'),
+        tool.get('calibration_validity_months', 12)
     )
 
-# Tool endpoints
-@api_router.get("/tools", response_model=List[ToolResponse])
-async def get_tools():
-    tools = await db.tools.find({}, {"_id": 0}).to_list(1000)
-    
-    response = []
-    for tool in tools:
-        status, expiry_date = calculate_tool_status(
+async def refresh_tool_statuses():
+    """Re-bucket tools whose status threshold has passed or that have no stored status"""
+    now = datetime.now(timezone.utc)
+    query = {"$or": [
+        {"status": {"$exists": False}},
+        {"status_next_change": {"$lte": now}}
+    ]}
+    projection = {"_id": 0, "id": 1, "calibration_date": 1, "calibration_validity_months": 1}
+    
+    updates = []
+    refreshed = 0
+    async for tool in db.tools.find(query, projection):
+        fields = calibration_status_fields(
             tool.get('calibration_date'),
             tool.get('calibration_validity_months', 12)
         )
-        response.append(ToolResponse(
-            id=tool['id'],
-            equipment_name=tool['equipment_name'],
-            brand_type=tool['brand_type'],
-            serial_no=tool['serial_no'],
-            inventory_code=tool['inventory_code'],
-            asset_number=tool.get('asset_number'),
-            periodic_inspection_date=tool.get('periodic_inspection_date'),
-            calibration_date=tool.get('calibration_date'),
-            calibration_validity_months=tool.get('calibration_validity_months', 12),
-            calibration_expiry_date=expiry_date,
-            status=status,
-            condition=tool['condition'],
-            description=tool.get('description'),
-            equipment_location=tool['equipment_location'],
-            calibration_certificate=tool.get('calibration_certificate', None),
-            equipment_manual=tool.get('equipment_manual', None)
-        ))
-    
-    return response
-
-@api_router.post("/tools", response_model=ToolResponse)
-async def create_tool(tool_create: ToolCreate):
-    tool = Tool(**tool_create.model_dump())
-    doc = tool.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['updated_at'] = doc['updated_at'].isoformat()
-    
-    await db.tools.insert_one(doc)
-    
-    status, expiry_date = calculate_tool_status(
-        tool.calibration_date,
-        tool.calibration_validity_months
-    )
-    
+        updates.append(UpdateOne({"id": tool['id']}, {"$set": fields}))
+        if len(updates) >= STATUS_REFRESH_BATCH_SIZE:
+            await db.tools.bulk_write(updates, ordered=False)
+            refreshed += len(updates)
+            updates = []
+    if updates:
+        await db.tools.bulk_write(updates, ordered=False)
+        refreshed += len(updates)
+    
+    if refreshed:
+        logger.info(f"Refreshed calibration status of {refreshed} tool(s)")
+    return refreshed
+
+async def ensure_indexes():
+    """Create every index in MONGO_INDEXES; existing identical indexes are left alone"""
+    for collection_name, indexes in MONGO_INDEXES.items():
+        try:
+            await db[collection_name].create_indexes(indexes)
+        except OperationFailure as e:
+            # Duplicate keys or a conflicting definition; keep serving without it
+            logger.error(f"Could not create indexes on {collection_name}: {e}")
+
+def start_periodic_task(name: str, interval_seconds: float, job):
+    """Run ``job`` now and then every ``interval_seconds`` until shutdown"""
+    async def runner():
+        while True:
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Periodic task {name} failed")
+            await asyncio.sleep(interval_seconds)
+    
+    background_tasks.append(asyncio.create_task(runner(), name=name))
+
+def tool_to_response(tool: dict) -> ToolResponse:
+    status, expiry_date = tool_status(tool)
     return ToolResponse(
-        id=tool.id,
-        equipment_name=tool.equipment_name,
-        brand_type=tool.brand_type,
-        serial_no=tool.serial_no,
-        inventory_code=tool.inventory_code,
-        asset_number=tool.asset_number,
-        periodic_inspection_date=tool.periodic_inspection_date,
-        calibration_date=tool.calibration_date,
-        calibration_validity_months=tool.calibration_validity_months,
+        id=tool['id'],
+        equipment_name=tool['equipment_name'],
+        brand_type=tool['brand_type'],
+        serial_no=tool['serial_no'],
+        inventory_code=tool['inventory_code'],
+        asset_number=tool.get('asset_number'),
+        periodic_inspection_date=tool.get('periodic_inspection_date'),
+        calibration_date=tool.get('calibration_date'),
+        calibration_validity_months=tool.get('calibration_validity_months', 12),
         calibration_expiry_date=expiry_date,
         status=status,
-        condition=tool.condition,
-        description=tool.description,
-        equipment_location=tool.equipment_location,
-        calibration_certificate=tool.calibration_certificate,
-        equipment_manual=tool.equipment_manual
+        condition=tool['condition'],
+        description=tool.get('description'),
+        equipment_location=tool['equipment_location'],
+        calibration_certificate=tool.get('calibration_certificate'),
+        equipment_manual=tool.get('equipment_manual'),
+        certificate_preview=certificate_previewable(tool)
     )
 
-@api_router.put("/tools/{tool_id}", response_model=ToolResponse)
-async def update_tool(tool_id: str, tool_update: ToolCreate):
-    existing_tool = await db.tools.find_one({"id": tool_id}, {"_id": 0})
-    if not existing_tool:
-        raise HTTPException(status_code=404, detail="Tool not found")
-    
-    update_data = tool_update.model_dump()
-    update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
-    
-    await db.tools.update_one({"id": tool_id}, {"$set": update_data})
-    
-    status, expiry_date = calculate_tool_status(
-        update_data.get('calibration_date'),
-        update_data.get('calibration_validity_months', 12)
-    )
-    
-    return ToolResponse(
-        id=tool_id,
-        equipment_name=update_data['equipment_name'],
-        brand_type=update_data['brand_type'],
-        serial_no=update_data['serial_no'],
-        inventory_code=update_data['inventory_code'],
-        asset_number=update_data.get('asset_number'),
-        periodic_inspection_date=update_data.get('periodic_inspection_date'),
-        calibration_date=update_data.get('calibration_date'),
-        calibration_validity_months=update_data.get('calibration_validity_months', 12),
-        calibration_expiry_date=expiry_date,
-        status=status,
-        condition=update_data['condition'],
-        description=update_data.get('description'),
-        equipment_location=update_data['equipment_location'],
-        calibration_certificate=existing_tool.get('calibration_certificate'),
-        equipment_manual=existing_tool.get('equipment_manual')
+def build_tool_query(
+    condition: Optional[str] = None,
+    location: Optional[str] = None,
+    equipment_name: Optional[str] = None,
+    status: Optional[str] = None,
+    search: Optional[str] = None
+) -> dict:
+    query = {}
+    if condition:
+        query['condition'] = condition
+    if location:
+        query['equipment_location'] = location
+    if equipment_name:
+        query['equipment_name'] = equipment_name
+    if status:
+        query['status'] = status
+    if search:
+        pattern = {"$regex": re.escape(search), "$options": "i"}
+        query['$or'] = [
+            {"equipment_name": pattern},
+            {"serial_no": pattern},
+            {"inventory_code": pattern}
+        ]
+    return query
+
+def encode_cursor(*values) -> str:
+    """Pack the sort key of the last row served into an opaque page cursor"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str, length: int = 2) -> list:
+    """Unpack a page cursor holding ``length`` sort values, each a string or null"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Anything else would fail to unpack or reach the query as an operator
+    if not isinstance(values, list) or len(values) != length or not all(
+        value is None or isinstance(value, str) for value in values
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def after_cursor_query(created_at: Optional[str], record_id: str) -> dict:
+    """Match records sorted after (created_at, id) in ascending order"""
+    if created_at is None:
+        # Records without created_at sort first
+        return {"$or": [
+            {"created_at": None, "id": {"$gt": record_id}},
+            {"created_at": {"$ne": None}}
+        ]}
+    return {"$or": [
+        {"created_at": {"$gt": created_at}},
+        {"created_at": created_at, "id": {"$gt": record_id}}
+    ]}
+
+def expiry_window_query(
+    horizon_end: str,
+    location: Optional[str] = None,
+    include_expired: bool = True
+) -> dict:
+    """Tools whose stored calibration_expiry_date falls on or before horizon_end.
+
+    Matching and sorting on the stored YYYY-MM-DD string is served by the
+    (equipment_location, calibration_expiry_date, id) or
+    (calibration_expiry_date, id) index; tools without an expiry never match.
+    """
+    # Calibration lapses at midnight UTC on the expiry date
+    today = datetime.now(timezone.utc).date().isoformat()
+    lower = {"$gt": ""} if include_expired else {"$gt": today}
+    query = {"calibration_expiry_date": {**lower, "$lte": horizon_end}}
+    if location:
+        query["equipment_location"] = location
+    return query
+
+def after_expiry_cursor_query(expiry_date: str, record_id: str) -> dict:
+    """Match tools sorted after (calibration_expiry_date, id) in ascending order"""
+    return {"$or": [
+        {"calibration_expiry_date": {"$gt": expiry_date}},
+        {"calibration_expiry_date": expiry_date, "id": {"$gt": record_id}}
+    ]}
+
+def add_months(day: date, months: int) -> date:
+    month_index = day.month - 1 + months
+    return date(day.year + month_index // 12, month_index % 12 + 1, 1)
+
+# Tool bookings
+# tool_bookings mirrors every loan's equipment as date intervals per serial_no,
+# so availability and double-booking checks only touch the bookings that end
+# on or after the window instead of scanning the loan history.
+def tool_booking_docs(loan: dict, revision: str) -> List[dict]:
+    """Booking rows for a loan; raises ValueError for bad dates or a repeated serial"""
+    start = date.fromisoformat(loan['loan_date'])
+    end = date.fromisoformat(loan['return_date'])
+    if end < start:
+        raise ValueError("return_date is before loan_date")
+    
+    serials = [equipment['serial_no'] for equipment in loan['equipments']]
+    if len(set(serials)) != len(serials):
+        raise ValueError("The same serial number appears twice in the loan")
+    
+    # A returned loan holds its tools through the day before they came back,
+    # so they can go out again on the return day
+    if loan.get('returned_at'):
+        end = min(end, date.fromisoformat(str(loan['returned_at'])[:10]) - timedelta(days=1))
+        if end < start:
+            return []
+    
+    return [
+        {
+            **ToolBooking(
+                loan_id=loan['id'],
+                serial_no=equipment['serial_no'],
+                equipment_name=equipment['equipment_name'],
+                start=start.isoformat(),
+                end=end.isoformat(),
+                borrower_name=loan['borrower_name'],
+                project_name=loan['project_name']
+            ).model_dump(),
+            "revision": revision
+        }
+        for equipment in loan['equipments']
+    ]
+
+def overlapping_bookings_query(start: str, end: str, serial_no: Optional[str] = None) -> dict:
+    query = {"end": {"$gte": start}, "start": {"$lte": end}}
+    if serial_no is not None:
+        query["serial_no"] = serial_no
+    return query
+
+async def reserve_tool_bookings(loan: dict) -> str:
+    """Book the loan's tools under a new revision, or raise 409 if another loan overlaps.
+
+    The bookings are inserted before the overlap check, so two concurrent
+    loans for the same tool always see each other; at worst both are rejected.
+    """
+    revision = str(uuid.uuid4())
+    try:
+        docs = tool_booking_docs(loan, revision)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not docs:
+        return revision
+    
+    await db.tool_bookings.insert_many(docs)
+    conflicts = await db.tool_bookings.find({
+        "loan_id": {"$ne": loan['id']},
+        "$or": [overlapping_bookings_query(doc['start'], doc['end'], doc['serial_no']) for doc in docs]
+    }, {"_id": 0}).to_list(None)
+    if conflicts:
+        await db.tool_bookings.delete_many({"loan_id": loan['id'], "revision": revision})
+        raise HTTPException(
+            status_code=409,
+            detail="; ".join(
+                f"{booking['equipment_name']} ({booking['serial_no']}) is on loan to "
+                f"{booking['borrower_name']} from {booking['start']} to {booking['end']}"
+                for booking in conflicts
+            )
+        )
+    return revision
+
+async def release_tool_bookings(loan_id: str, keep_revision: Optional[str] = None):
+    query = {"loan_id": loan_id}
+    if keep_revision:
+        query["revision"] = {"$ne": keep_revision}
+    await db.tool_bookings.delete_many(query)
+
+async def rebuild_tool_bookings() -> int:
+    """Recreate every booking from the loans, skipping loans with unusable dates"""
+    docs = []
+    skipped = 0
+    async for loan in db.loans.find({}, {"_id": 0}):
+        try:
+            docs += tool_booking_docs(loan, "rebuild")
+        except (KeyError, ValueError):
+            skipped += 1
+    
+    await db.tool_bookings.delete_many({})
+    if docs:
+        await db.tool_bookings.insert_many(docs)
+    logger.info(f"Rebuilt {len(docs)} tool booking(s), skipped {skipped} loan(s)")
+    return len(docs)
+
+async def end_tool_bookings(loan_id: str, returned_on: date):
+    """Free a returned loan's tools from ``returned_on`` on, the return day included"""
+    last_day = (returned_on - timedelta(days=1)).isoformat()
+    await db.tool_bookings.delete_many({"loan_id": loan_id, "start": {"$gt": last_day}})
+    await db.tool_bookings.update_many(
+        {"loan_id": loan_id, "end": {"$gt": last_day}},
+        {"$set": {"end": last_day}}
     )
 
-@api_router.delete("/tools/{tool_id}")
-async def delete_tool(tool_id: str):
-    tool = await db.tools.find_one({"id": tool_id}, {"_id": 0})
-    if tool:
-        # Delete associated files
-        if tool.get('calibration_certificate'):
-            cert_path = ROOT_DIR / tool['calibration_certificate']
-            if cert_path.exists():
-                cert_path.unlink()
-        if tool.get('equipment_manual'):
-            manual_path = ROOT_DIR / tool['equipment_manual']
-            if manual_path.exists():
-                manual_path.unlink()
-    
-    result = await db.tools.delete_one({"id": tool_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Tool not found")
-    return {"message": "Tool deleted successfully"}
+def parse_booking_window(date_from: Optional[str], date_to: Optional[str]) -> tuple:
+    """Inclusive YYYY-MM-DD bounds, defaulting to today"""
+    try:
+        start = date.fromisoformat(date_from) if date_from else date.today()
+        end = date.fromisoformat(date_to) if date_to else start
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if end < start:
+        raise HTTPException(status_code=400, detail="date_to is before date_from")
+    return start.isoformat(), end.isoformat()
+
+# Lost-tool report
+def overdue_bucket(days: int) -> str:
+    for low, high, label in OVERDUE_BUCKETS:
+        if days >= low and (high is None or days <= high):
+            return label
+    return OVERDUE_BUCKETS[-1][2]
+
+def count_by(rows: List[dict], field: str) -> List[dict]:
+    counts = {}
+    for row in rows:
+        counts[row[field]] = counts.get(row[field], 0) + 1
+    return [
+        {field: key, "count": count}
+        for key, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    ]
 
-@api_router.post("/tools/{tool_id}/upload-certificate")
-async def upload_certificate(
-    tool_id: str,
-    file: UploadFile = File(...),
-    
-):
-    tool = await db.tools.find_one({"id": tool_id}, {"_id": 0})
-    if not tool:
-        raise HTTPException(status_code=404, detail="Tool not found")
+async def build_lost_tools_report() -> dict:
+    """Equipment on unreturned loans past return_date, joined to the tool register by serial_no.
+
+    Bucket counts and total cover every row; the row list holds the
+    LOST_TOOLS_REPORT_MAX_ROWS most overdue.
+    """
+    today = date.today()
+    pipeline = [
+        # Served by the (returned_at, return_date) index; null matches missing too
+        {"$match": {"returned_at": None, "return_date": {"$lt": today.isoformat()}}},
+        {"$unwind": "$equipments"},
+        # Served by the tools serial_no index
+        {"$lookup": {
+            "from": "tools",
+            "localField": "equipments.serial_no",
+            "foreignField": "serial_no",
+            "as": "tool"
+        }},
+        {"$project": {
+            "_id": 0,
+            "loan_id": "$id",
+            "borrower_name": 1,
+            "project_name": 1,
+            "wbs_project_no": 1,
+            "return_date": 1,
+            "equipment_name": "$equipments.equipment_name",
+            "serial_no": "$equipments.serial_no",
+            "tool": {"$arrayElemAt": ["$tool", 0]}
+        }}
+    ]
     
-    # Save file
-    file_extension = Path(file.filename).suffix
-    filename = f"{tool_id}_certificate{file_extension}"
-    file_path = CERTIFICATES_DIR / filename
+    lost = []
+    async for row in db.loans.aggregate(pipeline):
+        try:
+            days_overdue = (today - date.fromisoformat(row['return_date'])).days
+        except ValueError:
+            continue
+        tool = row.get('tool') or {}
+        lost.append({
+            "loan_id": row['loan_id'],
+            "equipment_name": row['equipment_name'],
+            "serial_no": row['serial_no'],
+            "brand_type": tool.get('brand_type'),
+            "location": tool.get('equipment_location'),
+            "in_register": bool(tool),
+            "borrower_name": row['borrower_name'],
+            "project_name": row['project_name'],
+            "wbs_project_no": row['wbs_project_no'],
+            "return_date": row['return_date'],
+            "days_overdue": days_overdue,
+            "overdue_bucket": overdue_bucket(days_overdue)
+        })
+    lost.sort(key=lambda row: (-row['days_overdue'], row['serial_no']))
     
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    by_bucket = {label: 0 for _, _, label in OVERDUE_BUCKETS}
+    for row in lost:
+        by_bucket[row['overdue_bucket']] += 1
     
-    # Update database
-    relative_path = f"uploads/certificates/{filename}"
-    await db.tools.update_one(
-        {"id": tool_id},
-        {"$set": {"calibration_certificate": relative_path, "updated_at": datetime.now(timezone.utc).isoformat()}}
+    return {
+        "potential_lost": lost[:LOST_TOOLS_REPORT_MAX_ROWS],
+        "total": len(lost),
+        "truncated": len(lost) > LOST_TOOLS_REPORT_MAX_ROWS,
+        "by_days_overdue": [{"bucket": label, "count": count} for label, count in by_bucket.items()],
+        "by_borrower": count_by(lost, "borrower_name")[:LOST_TOOLS_REPORT_MAX_GROUPS],
+        "by_project": count_by(lost, "project_name")[:LOST_TOOLS_REPORT_MAX_GROUPS],
+        "generated_at": datetime.now(timezone.utc).isoformat()
+    }
+
+async def refresh_lost_tools_report() -> dict:
+    """Rebuild the materialized lost-tool report read by the analysis dashboard"""
+    report = await build_lost_tools_report()
+    await db.analysis_reports.replace_one(
+        {"name": "tools_lost"},
+        {"name": "tools_lost", **report},
+        upsert=True
     )
-    
-    return {"message": "Certificate uploaded successfully", "file_path": relative_path}
+    return report
+
+# Analytics rollup
+# analytics_counters holds one {kind, key, count} document per counter. Write
+# endpoints apply $inc deltas so dashboard reads never rescan the collections.
+def tool_counter_deltas(tool: dict, sign: int = 1) -> List[tuple]:
+    deltas = [("totals", "tools", sign)]
+    if tool.get('condition') == 'Damaged':
+        deltas += [
+            ("totals", "damaged_tools", sign),
+            ("damaged_type", tool['equipment_name'], sign),
+            ("damaged_brand", tool['brand_type'], sign)
+        ]
+    elif tool.get('condition') == 'Good':
+        deltas.append(("totals", "good_tools", sign))
+    return deltas
+
+def loan_counter_deltas(loan: dict, sign: int = 1) -> List[tuple]:
+    deltas = [("totals", "loans", sign)]
+    for equipment in loan.get('equipments', []):
+        deltas.append(("loan_usage", equipment['equipment_name'], sign))
+    return deltas
+
+def stock_counter_deltas(item: dict, sign: int = 1) -> List[tuple]:
+    deltas = [("totals", "stock_items", sign)]
+    if item.get('available_quantity', 0) < LOW_STOCK_THRESHOLD:
+        deltas.append(("totals", "low_stock_items", sign))
+    return deltas
+
+def stock_quantity_deltas(item_after: dict, change: int) -> List[tuple]:
+    """Counter deltas for a quantity change, given the item as it is after the change"""
+    before = {"available_quantity": item_after['available_quantity'] - change}
+    return stock_counter_deltas(before, -1) + stock_counter_deltas(item_after)
+
+def stock_movement_doc(item: dict, kind: str, quantity: int, balance_after: int, reason: Optional[str] = None) -> dict:
+    movement = StockMovement(
+        item_id=item['id'],
+        item_name=item['item_name'],
+        kind=kind,
+        quantity=quantity,
+        balance_after=balance_after,
+        reason=reason
+    )
+    doc = movement.model_dump()
+    doc['created_at'] = doc['created_at'].isoformat()
+    return doc
 
-@api_router.post("/tools/{tool_id}/upload-manual")
-async def upload_manual(
-    tool_id: str,
-    file: UploadFile = File(...),
-    
-):
-    tool = await db.tools.find_one({"id": tool_id}, {"_id": 0})
-    if not tool:
-        raise HTTPException(status_code=404, detail="Tool not found")
-    
-    # Save file
-    file_extension = Path(file.filename).suffix
-    filename = f"{tool_id}_manual{file_extension}"
-    file_path = MANUALS_DIR / filename
-    
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Update database
-    relative_path = f"uploads/manuals/{filename}"
-    await db.tools.update_one(
-        {"id": tool_id},
-        {"$set": {"equipment_manual": relative_path, "updated_at": datetime.now(timezone.utc).isoformat()}}
+async def record_stock_movement(item: dict, kind: str, quantity: int, reason: Optional[str] = None, session=None):
+    """Append a ledger entry for a change already applied to item (as returned after the update).
+
+    Call it through run_stock_write so the entry commits with the change.
+    Without transaction support the ledger is best-effort: a failure between
+    the two writes leaves the quantity changed with no entry for it.
+    """
+    await db.stock_movements.insert_one(
+        stock_movement_doc(item, kind, quantity, item['available_quantity'], reason), session=session
     )
-    
-    return {"message": "Manual uploaded successfully", "file_path": relative_path}
 
-@api_router.get("/tools/{tool_id}/download-certificate")
-async def download_certificate(tool_id: str):
-    tool = await db.tools.find_one({"id": tool_id}, {"_id": 0})
-    if not tool or not tool.get('calibration_certificate'):
-        raise HTTPException(status_code=404, detail="Certificate not found")
-    
-    file_path = ROOT_DIR / tool['calibration_certificate']
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    return FileResponse(file_path, filename=f"{tool['equipment_name']}_certificate{file_path.suffix}")
+_transactions_supported: Optional[bool] = None
+
+async def transactions_supported() -> bool:
+    """Multi-document transactions need a replica set or a sharded cluster"""
+    global _transactions_supported
+    if _transactions_supported is None:
+        try:
+            hello = await client.admin.command("hello")
+            _transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception:
+            _transactions_supported = False
+    return _transactions_supported
+
+async def run_stock_write(write):
+    """Await write(session) in a transaction when the deployment supports them,
+    retrying transient conflicts; otherwise write(None) runs its writes one by one"""
+    if not await transactions_supported():
+        return await write(None)
+    async with await client.start_session() as session:
+        return await session.with_transaction(write)
+
+async def apply_counter_deltas(*delta_lists: List[tuple]):
+    """Merge (kind, key, delta) triples and apply the non-zero ones with $inc"""
+    merged = {}
+    for deltas in delta_lists:
+        for kind, key, delta in deltas:
+            merged[(kind, key)] = merged.get((kind, key), 0) + delta
+    
+    ops = [
+        UpdateOne({"kind": kind, "key": key}, {"$inc": {"count": delta}}, upsert=True)
+        for (kind, key), delta in merged.items()
+        if delta
+    ]
+    if ops:
+        await db.analytics_counters.bulk_write(ops, ordered=False)
+
+async def get_counters(kind: str, limit: Optional[int] = None) -> List[dict]:
+    cursor = db.analytics_counters.find(
+        {"kind": kind, "count": {"$gt": 0}},
+        {"_id": 0, "key": 1, "count": 1}
+    ).sort([("count", -1), ("key", 1)])
+    if limit:
+        cursor = cursor.limit(limit)
+    return await cursor.to_list(None)
+
+async def get_totals() -> dict:
+    rows = await db.analytics_counters.find({"kind": "totals"}, {"_id": 0, "key": 1, "count": 1}).to_list(None)
+    return {row['key']: row['count'] for row in rows}
+
+async def rebuild_analytics_counters() -> int:
+    """Recompute every rollup counter from the source collections"""
+    deltas = []
+    async for tool in db.tools.find({}, {"_id": 0, "condition": 1, "equipment_name": 1, "brand_type": 1}):
+        deltas += tool_counter_deltas(tool)
+    async for loan in db.loans.find({}, {"_id": 0, "equipments.equipment_name": 1}):
+        deltas += loan_counter_deltas(loan)
+    async for item in db.stock_items.find({}, {"_id": 0, "available_quantity": 1}):
+        deltas += stock_counter_deltas(item)
+    
+    counts = {}
+    for kind, key, delta in deltas:
+        counts[(kind, key)] = counts.get((kind, key), 0) + delta
+    
+    await db.analytics_counters.delete_many({})
+    if counts:
+        await db.analytics_counters.insert_many([
+            {"kind": kind, "key": key, "count": count}
+            for (kind, key), count in counts.items()
+        ])
+    logger.info(f"Rebuilt {len(counts)} analytics counter(s)")
+    return len(counts)
+
+# Document rendering
+# QR labels, Excel exports and loan forms are CPU-bound; they run in worker
+# processes so a large export never freezes the event loop.
+class RenderPool:
+    """Process pool with a cap on queued jobs and a per-job timeout.
+
+    A timed-out job is abandoned rather than killed, so its worker stays busy
+    until the render finishes; keep the timeout generous.
+    """
+    def __init__(self, workers: int, max_pending: int, timeout_seconds: float, initializer=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout_seconds = timeout_seconds
+        self.initializer = initializer
+        self.pending = 0
+        self._executor = None
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=self.initializer
+            )
+        return self._executor
+    
+    async def run(self, fn, *args, timeout: Optional[float] = None):
+        """Run fn(*args) in a worker; timeout overrides the pool's per-job timeout"""
+        if self.pending >= self.max_pending:
+            raise HTTPException(status_code=503, detail="Rendering queue is full, please retry shortly")
+        
+        executor = self._get_executor()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(executor, fn, *args)
+            return await asyncio.wait_for(future, timeout or self.timeout_seconds)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Rendering timed out")
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); start a fresh pool on the next job.
+            # Other jobs on the same pool fail together, and the first of them
+            # may already have replaced it, so only discard the pool this job ran on.
+            if executor is self._executor:
+                logger.error("Render pool is broken, restarting it")
+                self.shutdown()
+            raise HTTPException(status_code=503, detail="Rendering worker crashed, please retry")
+        finally:
+            self.pending -= 1
+    
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+def warm_render_worker():
+    """Runs once in each render worker so the first export doesn't pay for parsing the template"""
+    if LOAN_TEMPLATE_PATH.exists():
+        loan_template.compiled()
+
+render_pool = RenderPool(RENDER_WORKERS, RENDER_QUEUE_LIMIT, RENDER_TIMEOUT_SECONDS, warm_render_worker)
+
+def label_cache_key(label: dict) -> str:
+    """Content hash of everything a rendered label depends on"""
+    raw = json.dumps({**label, "layout": LABEL_LAYOUT_VERSION}, sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+class LabelCache:
+    """Rendered label PNGs keyed by label_cache_key: an in-memory LRU in front
+    of a directory of ``<key>.png`` files that survives restarts. prune()
+    trims the directory to max_bytes; a file's mtime is its last use."""
+    def __init__(self, directory: Path, max_entries: int, max_bytes: int):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+    
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.png"
+    
+    def _remember(self, key: str, png: bytes):
+        self._entries[key] = png
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def contains(self, key: str) -> bool:
+        return key in self._entries or self._path(key).exists()
+    
+    async def get(self, key: str) -> Optional[bytes]:
+        png = self._entries.get(key)
+        if png is not None:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return png
+        
+        path = self._path(key)
+        
+        def read():
+            png = path.read_bytes()
+            os.utime(path)
+            return png
+        
+        try:
+            png = await asyncio.to_thread(read)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self._remember(key, png)
+        return png
+    
+    async def put(self, key: str, png: bytes):
+        self._remember(key, png)
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        
+        def write():
+            tmp_path.write_bytes(png)
+            os.replace(tmp_path, path)
+        
+        await asyncio.to_thread(write)
+    
+    def _prune_directory(self) -> dict:
+        removed = {"files": 0, "bytes": 0}
+        # Temp files from writes that never finished
+        stale_before = time.time() - 3600
+        for path in self.directory.glob("*.tmp"):
+            try:
+                if path.stat().st_mtime < stale_before:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+        
+        files = []
+        for path in self.directory.glob("*.png"):
+            try:
+                stat_result = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat_result.st_mtime, stat_result.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed["files"] += 1
+            removed["bytes"] += size
+        return removed
+    
+    async def prune(self) -> dict:
+        """Delete least recently used label files until the directory fits in max_bytes"""
+        removed = await asyncio.to_thread(self._prune_directory)
+        if removed["files"]:
+            logger.info(f"Pruned {removed['files']} cached label(s), {removed['bytes'] / (1024 * 1024):.1f} MB")
+        return removed
+    
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses
+        }
 
-@api_router.get("/tools/{tool_id}/download-manual")
-async def download_manual(tool_id: str):
-    tool = await db.tools.find_one({"id": tool_id}, {"_id": 0})
-    if not tool or not tool.get('equipment_manual'):
-        raise HTTPException(status_code=404, detail="Manual not found")
-    
-    file_path = ROOT_DIR / tool['equipment_manual']
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    return FileResponse(file_path, filename=f"{tool['equipment_name']}_manual{file_path.suffix}")
+label_cache = LabelCache(LABELS_DIR, LABEL_CACHE_MEMORY_ENTRIES, LABEL_CACHE_MAX_BYTES)
+
+async def get_tool_label_png(label: dict, key: Optional[str] = None) -> bytes:
+    key = key or label_cache_key(label)
+    png = await label_cache.get(key)
+    if png is None:
+        png = await render_pool.run(render_tool_label, label)
+        await label_cache.put(key, png)
+    return png
+
+async def iter_tool_label_pngs(labels: List[dict]):
+    """Yield (index, png) for each label as it becomes available.
+
+    Misses are rendered in chunks spread over the render workers. The first
+    rendered chunk is yielded before the cache hits, so a caller holding the
+    first label knows the render pool accepted the work; output order is not
+    the input order.
+    """
+    hits, misses = [], []
+    for index, label in enumerate(labels):
+        key = label_cache_key(label)
+        (hits if label_cache.contains(key) else misses).append((index, key, label))
+    
+    chunks = [misses[i:i + LABEL_BATCH_CHUNK_SIZE] for i in range(0, len(misses), LABEL_BATCH_CHUNK_SIZE)]
+    slots = asyncio.Semaphore(render_pool.workers)
+    
+    async def render_chunk(chunk):
+        async with slots:
+            pngs = await render_pool.run(render_tool_labels, [label for _, _, label in chunk])
+        for (_, key, _), png in zip(chunk, pngs):
+            await label_cache.put(key, png)
+        return [(index, png) for (index, _, _), png in zip(chunk, pngs)]
+    
+    tasks = [asyncio.create_task(render_chunk(chunk)) for chunk in chunks]
+    try:
+        completed = asyncio.as_completed(tasks)
+        if tasks:
+            for index, png in await next(completed):
+                yield index, png
+        for index, key, label in hits:
+            # Rendered again if the file was pruned since
+            yield index, await get_tool_label_png(label, key)
+        for task in completed:
+            for index, png in await task:
+                yield index, png
+    finally:
+        for task in tasks:
+            task.cancel()
+
+class _ChunkWriter:
+    """Write-only file object whose written bytes are drained in chunks"""
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+async def started_stream(items):
+    """Pull the first item of an async iterator and return an iterator over all of them.
+
+    Awaited before a StreamingResponse is returned, so a render error hit
+    while producing the first chunk (a full queue, a timeout) is answered
+    with its own status instead of a 200 with an empty body.
+    """
+    iterator = aiter(items)
+    try:
+        first = await anext(iterator)
+    except StopAsyncIteration:
+        first = None
+        iterator = None
+    
+    async def resumed():
+        if iterator is None:
+            return
+        yield first
+        async for item in iterator:
+            yield item
+    
+    return resumed()
+
+async def stream_zip(entries, compression: int = zipfile.ZIP_DEFLATED):
+    """Build a ZIP from an async iterator of (name, bytes), yielding it as it grows"""
+    writer = _ChunkWriter()
+    with zipfile.ZipFile(writer, 'w', compression=compression) as archive:
+        async for name, data in entries:
+            archive.writestr(name, data)
+            yield writer.drain()
+    yield writer.drain()
+
+def unique_archive_name(name: str, used: set) -> str:
+    name = re.sub(r'[^\w.\-]', '_', name)
+    stem, suffix = os.path.splitext(name)
+    candidate, counter = name, 1
+    while candidate in used:
+        counter += 1
+        candidate = f"{stem}_{counter}{suffix}"
+    used.add(candidate)
+    return candidate
+
+@functools.lru_cache(maxsize=1)
+def load_label_fonts():
+    """Label fonts, loaded once per render worker"""
+    try:
+        font_large = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 22)
+        font_medium = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 16)
+        font_small = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 14)
+    except OSError:
+        font_large = ImageFont.load_default()
+        font_medium = ImageFont.load_default()
+        font_small = ImageFont.load_default()
+    return font_large, font_medium, font_small
 
-@api_router.get("/tools/{tool_id}/barcode")
-async def generate_barcode(tool_id: str):
-    tool = await db.tools.find_one({"id": tool_id}, {"_id": 0})
-    if not tool:
-        raise HTTPException(status_code=404, detail="Tool not found")
-    
-    # Calculate status
-    status, expiry_date = calculate_tool_status(
-        tool.get('calibration_date'),
-        tool.get('calibration_validity_months', 12)
-    )
-    
+def render_tool_label(label: dict) -> bytes:
+    """Draw the QR label PNG for a tool; runs in the render pool"""
     # Create QR code data
     qr_data_parts = [
         "Equipment Information:",
-        f"Device Name: {tool['equipment_name']}",
-        f"Serial Number: {tool['serial_no']}"
+        f"Device Name: {label['equipment_name']}",
+        f"Serial Number: {label['serial_no']}"
     ]
     
     # Add Asset Number if available
-    if tool.get('asset_number'):
-        qr_data_parts.append(f"Asset Number: {tool['asset_number']}")
+    if label.get('asset_number'):
+        qr_data_parts.append(f"Asset Number: {label['asset_number']}")
     
     qr_data_parts.extend([
         "Owner: PT Biro Klasifikasi Indonesia",
-        f"Calibration Expiry: {expiry_date or 'N/A'}",
-        f"Status: {status}"
+        f"Calibration Expiry: {label['expiry_date'] or 'N/A'}",
+        f"Status: {label['status']}"
     ])
     
     qr_data = "\n".join(qr_data_parts)
@@ -578,20 +1597,13 @@ async def generate_barcode(tool_id: str):
     img.paste(qr_img, qr_position)
     
     # Add text information below QR code
-    try:
-        font_large = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 22)
-        font_medium = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 16)
-        font_small = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 14)
-    except:
-        font_large = ImageFont.load_default()
-        font_medium = ImageFont.load_default()
-        font_small = ImageFont.load_default()
+    font_large, font_medium, font_small = load_label_fonts()
     
     # Draw text information
     y_pos = 420
     
     # Equipment name (centered)
-    text = f"{tool['equipment_name']}"
+    text = f"{label['equipment_name']}"
     bbox = draw.textbbox((0, 0), text, font=font_large)
     text_width = bbox[2] - bbox[0]
     x_centered = (img_width - text_width) // 2
@@ -599,7 +1611,7 @@ async def generate_barcode(tool_id: str):
     y_pos += 40
     
     # Serial number
-    text = f"Serial No: {tool['serial_no']}"
+    text = f"Serial No: {label['serial_no']}"
     bbox = draw.textbbox((0, 0), text, font=font_medium)
     text_width = bbox[2] - bbox[0]
     x_centered = (img_width - text_width) // 2
@@ -607,8 +1619,8 @@ async def generate_barcode(tool_id: str):
     y_pos += 35
     
     # Asset number (if available)
-    if tool.get('asset_number'):
-        text = f"Asset No: {tool['asset_number']}"
+    if label.get('asset_number'):
+        text = f"Asset No: {label['asset_number']}"
         bbox = draw.textbbox((0, 0), text, font=font_medium)
         text_width = bbox[2] - bbox[0]
         x_centered = (img_width - text_width) // 2
@@ -616,8 +1628,9 @@ async def generate_barcode(tool_id: str):
         y_pos += 35
     
     # Expiry date
+    status = label['status']
     expiry_color = 'red' if status == 'Expired' else 'green' if status == 'Valid' else 'orange'
-    text = f"Expiry: {expiry_date or 'N/A'}"
+    text = f"Expiry: {label['expiry_date'] or 'N/A'}"
     bbox = draw.textbbox((0, 0), text, font=font_medium)
     text_width = bbox[2] - bbox[0]
     x_centered = (img_width - text_width) // 2
@@ -642,88 +1655,1641 @@ async def generate_barcode(tool_id: str):
     # Save to buffer
     buffer = io.BytesIO()
     img.save(buffer, format='PNG')
-    buffer.seek(0)
+    return buffer.getvalue()
+
+def render_tool_labels(labels: List[dict]) -> List[bytes]:
+    """Render a chunk of labels in one job to amortize the worker round trip"""
+    return [render_tool_label(label) for label in labels]
+
+def certificate_previewable(tool: dict) -> bool:
+    certificate = tool.get('calibration_certificate')
+    if not certificate:
+        return False
+    name = tool.get('calibration_certificate_name') or certificate
+    return Path(name).suffix.lower() in THUMBNAIL_SOURCE_SUFFIXES
+
+def certificate_preview_key(tool: dict) -> str:
+    """The certificate's content hash; older uploads are keyed by path, size and mtime"""
+    if tool.get('calibration_certificate_sha256'):
+        return tool['calibration_certificate_sha256']
+    stat_result = (ROOT_DIR / tool['calibration_certificate']).stat()
+    identity = f"{tool['calibration_certificate']}:{stat_result.st_size}:{stat_result.st_mtime_ns}"
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+def thumbnail_path(key: str, size: int, image_format: str) -> Path:
+    return THUMBNAILS_DIR / key[:2] / f"{key}_{size}.{image_format}"
+
+def render_thumbnails(source: str, key: str):
+    """Write every preview size and format for an image; runs in the render pool"""
+    with Image.open(source) as original:
+        # Lets JPEG decode straight at a reduced scale; a no-op for other formats
+        original.draft("RGB", (max(THUMBNAIL_SIZES), max(THUMBNAIL_SIZES)))
+        image = ImageOps.exif_transpose(original)
+        if image.mode in ("RGBA", "LA", "P", "PA"):
+            image = image.convert("RGBA")
+            flattened = Image.new("RGB", image.size, "white")
+            flattened.paste(image, mask=image.getchannel("A"))
+            image = flattened
+        else:
+            image = image.convert("RGB")
+    
+    # Largest first, so each size is scaled down from the previous one
+    for size in sorted(THUMBNAIL_SIZES, reverse=True):
+        image.thumbnail((size, size), Image.LANCZOS)
+        for image_format, (pil_format, _) in THUMBNAIL_FORMATS.items():
+            target = thumbnail_path(key, size, image_format)
+            target.parent.mkdir(exist_ok=True)
+            temp_path = target.with_name(f".{target.name}.{uuid.uuid4().hex}.part")
+            if image_format == "webp":
+                image.save(temp_path, pil_format, quality=80, method=4)
+            else:
+                image.save(temp_path, pil_format, quality=82, optimize=True, progressive=True)
+            os.replace(temp_path, target)
+
+async def ensure_certificate_previews(tool: dict) -> str:
+    """Render a certificate's previews unless they're on disk already; returns their key"""
+    key = certificate_preview_key(tool)
+    if not all(
+        thumbnail_path(key, size, image_format).exists()
+        for size in THUMBNAIL_SIZES for image_format in THUMBNAIL_FORMATS
+    ):
+        await render_pool.run(render_thumbnails, str(ROOT_DIR / tool['calibration_certificate']), key)
+    return key
+
+async def pregenerate_certificate_previews(tool: dict):
+    """Upload follow-up; a failure here only means the first preview request renders them"""
+    try:
+        await ensure_certificate_previews(tool)
+    except Exception as e:
+        logger.warning(f"Could not generate certificate previews for tool {tool.get('id')}: {e}")
+
+def render_label_sheet(pngs: List[bytes]) -> bytes:
+    """Lay label PNGs out on A4 pages, LABEL_SHEET_COLUMNS x LABEL_SHEET_ROWS per page"""
+    page_width, page_height = A4
+    margin = 0.5 * inch
+    gap = 0.2 * inch
+    cell_width = (page_width - 2 * margin - (LABEL_SHEET_COLUMNS - 1) * gap) / LABEL_SHEET_COLUMNS
+    cell_height = (page_height - 2 * margin - (LABEL_SHEET_ROWS - 1) * gap) / LABEL_SHEET_ROWS
+    # Labels are 800x650 px; fit them inside the cell keeping the aspect ratio
+    label_width = min(cell_width, cell_height * 800 / 650)
+    label_height = label_width * 650 / 800
+    per_page = LABEL_SHEET_COLUMNS * LABEL_SHEET_ROWS
     
-    return StreamingResponse(buffer, media_type="image/png", headers={
-        "Content-Disposition": f"attachment; filename=qrcode_{tool['serial_no']}.png"
-    })
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    for index, png in enumerate(pngs):
+        if index and index % per_page == 0:
+            pdf.showPage()
+        slot = index % per_page
+        column, row = slot % LABEL_SHEET_COLUMNS, slot // LABEL_SHEET_COLUMNS
+        x = margin + column * (cell_width + gap) + (cell_width - label_width) / 2
+        y = page_height - margin - row * (cell_height + gap) - (cell_height + label_height) / 2
+        pdf.drawImage(ImageReader(io.BytesIO(png)), x, y, width=label_width, height=label_height)
+        pdf.setStrokeColor(colors.lightgrey)
+        pdf.rect(x, y, label_width, label_height)
+    pdf.save()
+    return buffer.getvalue()
+
+def tool_export_row(row_num: int, tool: dict) -> list:
+    status, expiry_date = tool_status(tool)
+    return [
+        row_num,
+        tool['equipment_name'],
+        tool['brand_type'],
+        tool['serial_no'],
+        tool['inventory_code'],
+        tool.get('asset_number', ''),
+        tool.get('periodic_inspection_date', ''),
+        tool.get('calibration_date', ''),
+        expiry_date or '',
+        status,
+        tool['condition'],
+        tool.get('description', ''),
+        tool['equipment_location']
+    ]
 
-@api_router.get("/tools/export/excel")
-async def export_tools_excel():
-    tools = await db.tools.find({}, {"_id": 0}).to_list(1000)
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Tool Status"
+def tool_import_value(value):
+    """Normalize a spreadsheet cell: blanks to None, dates to YYYY-MM-DD, 123.0 to '123'"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value).strip()
+    return value or None
+
+def read_tool_import_rows(path: str, file_format: str) -> List[tuple]:
+    """Stream (row number, fields) pairs out of an uploaded register; runs in a render worker.
+
+    The first row holds the headers. Blank rows are skipped; a missing
+    required column or more than TOOL_IMPORT_MAX_ROWS rows raises ValueError.
+    """
+    if file_format == "xlsx":
+        # A file object, since openpyxl refuses paths without an Excel extension
+        handle = open(path, "rb")
+        wb = load_workbook(handle, read_only=True, data_only=True)
+        rows = wb.active.iter_rows(values_only=True)
+    else:
+        handle = open(path, newline="", encoding="utf-8-sig")
+        rows = csv.reader(handle)
     
-    # Headers
-    headers = [
-        "No.", "Equipment Name", "Brand/Type", "Serial No.", "Inventory Code", "Asset Number",
-        "Periodic Inspection Date", "Calibration Date", "Calibration Expiry Date",
-        "Status", "Condition", "Description", "Equipment Location"
+    try:
+        headers = [tool_import_value(header) for header in next(rows, [])]
+        missing = [column for column in TOOL_IMPORT_REQUIRED_COLUMNS if column not in headers]
+        if missing:
+            raise ValueError(f"Missing column(s): {', '.join(missing)}")
+        positions = [
+            (index, TOOL_IMPORT_COLUMNS[header])
+            for index, header in enumerate(headers)
+            if header in TOOL_IMPORT_COLUMNS
+        ]
+        
+        parsed = []
+        for row_number, row in enumerate(rows, 2):
+            fields = {
+                field: tool_import_value(row[index]) if index < len(row) else None
+                for index, field in positions
+            }
+            if not any(fields.values()):
+                continue
+            if len(parsed) >= TOOL_IMPORT_MAX_ROWS:
+                raise ValueError(f"At most {TOOL_IMPORT_MAX_ROWS} rows per import")
+            parsed.append((row_number, fields))
+        return parsed
+    finally:
+        if file_format == "xlsx":
+            wb.close()
+        handle.close()
+
+def tool_import_errors(error: ValidationError) -> List[str]:
+    return [
+        f"{'.'.join(str(part) for part in item['loc']) or 'row'}: {item['msg']}"
+        for item in error.errors()
     ]
-    
-    # Style headers
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
+
+def tool_workbook_styles() -> List[NamedStyle]:
     thin_border = Border(
         left=Side(style='thin'),
         right=Side(style='thin'),
         top=Side(style='thin'),
         bottom=Side(style='thin')
     )
+    header = NamedStyle(
+        name="tool_header",
+        fill=PatternFill(start_color="366092", end_color="366092", fill_type="solid"),
+        font=Font(bold=True, color="FFFFFF"),
+        border=thin_border,
+        alignment=Alignment(horizontal='center', vertical='center')
+    )
+    cell = NamedStyle(
+        name="tool_cell",
+        border=thin_border,
+        alignment=Alignment(horizontal='left', vertical='center')
+    )
+    return [header, cell]
+
+@functools.lru_cache(maxsize=None)
+def tool_workbook_parts() -> tuple:
+    """(other entries, sheet head, sheet tail, cell style id) of the tool status workbook.
+
+    openpyxl writes a workbook with the header and one sample row once per
+    process; exports reuse every part of it and put their own rows between
+    the sheet's head and tail.
+    """
+    wb = Workbook(write_only=True)
+    for style in tool_workbook_styles():
+        wb.add_named_style(style)
+    ws = wb.create_sheet("Tool Status")
+    for col_num, width in enumerate(TOOL_EXPORT_COLUMN_WIDTHS, 1):
+        ws.column_dimensions[get_column_letter(col_num)].width = width
+    
+    def styled(value, style):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        return cell
+    
+    ws.append([styled(header, "tool_header") for header in TOOL_EXPORT_HEADERS])
+    ws.append([styled("", "tool_cell") for _ in TOOL_EXPORT_HEADERS])
+    buffer = io.BytesIO()
+    wb.save(buffer)
     
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = thin_border
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    # Data rows
-    for row_num, tool in enumerate(tools, 2):
-        status, expiry_date = calculate_tool_status(
-            tool.get('calibration_date'),
-            tool.get('calibration_validity_months', 12)
-        )
+    with zipfile.ZipFile(buffer) as archive:
+        entries = [
+            (info.filename, archive.read(info))
+            for info in archive.infolist() if info.filename != TOOL_SHEET_PATH
+        ]
+        sheet = archive.read(TOOL_SHEET_PATH).decode()
+    head, sample = sheet.split('<row r="2"', 1)
+    tail = sample.split("</row>", 1)[1]
+    style_id = re.search(r'\bs="(\d+)"', sample).group(1)
+    return entries, head.encode(), tail.encode(), style_id
+
+def tool_sheet_rows_xml(rows: List[list], first_row: int) -> bytes:
+    """Sheet XML for rows of tool_export_row values, the first at sheet row first_row"""
+    style_id = tool_workbook_parts()[3]
+    parts = []
+    for row_index, values in enumerate(rows, first_row):
+        parts.append(f'<row r="{row_index}">')
+        for column, value in enumerate(values, 1):
+            ref = f'{get_column_letter(column)}{row_index}'
+            if value is None or value == '':
+                parts.append(f'<c r="{ref}" s="{style_id}"/>')
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                parts.append(f'<c r="{ref}" s="{style_id}" t="n"><v>{value}</v></c>')
+            else:
+                text = ILLEGAL_CHARACTERS_RE.sub('', str(value))
+                space = ' xml:space="preserve"' if text != text.strip() else ''
+                parts.append(f'<c r="{ref}" s="{style_id}" t="inlineStr"><is><t{space}>{xml_escape(text)}</t></is></c>')
+        parts.append('</row>')
+    return "".join(parts).encode()
+
+def render_tool_sheet_rows(tools: List[dict], first_number: int) -> bytes:
+    """Render worker job: sheet XML for a batch of tools numbered from first_number"""
+    rows = [tool_export_row(number, tool) for number, tool in enumerate(tools, first_number)]
+    return tool_sheet_rows_xml(rows, first_number + 1)
+
+class ToolWorkbookStream:
+    """The tool status workbook as a ZIP written front to back.
+
+    Every part but the sheet comes from tool_workbook_parts(); the sheet
+    entry stays open while row XML is appended, so each batch of rows can be
+    sent as soon as it is rendered.
+    """
+    def __init__(self):
+        self._output = _ChunkWriter()
+        self._archive = zipfile.ZipFile(self._output, "w", zipfile.ZIP_DEFLATED)
+        self._sheet = None
+    
+    def start(self) -> bytes:
+        entries, head, _, _ = tool_workbook_parts()
+        for name, data in entries:
+            self._archive.writestr(name, data)
+        self._sheet = self._archive.open(TOOL_SHEET_PATH, "w")
+        self._sheet.write(head)
+        return self._output.drain()
+    
+    def write_rows(self, rows_xml: bytes) -> bytes:
+        self._sheet.write(rows_xml)
+        return self._output.drain()
+    
+    def finish(self) -> bytes:
+        self._sheet.write(tool_workbook_parts()[2])
+        self._sheet.close()
+        self._archive.close()
+        return self._output.drain()
+
+def write_tools_workbook(batches, fileobj):
+    """Write the tool status workbook from an iterable of row batches, in-process"""
+    workbook = ToolWorkbookStream()
+    fileobj.write(workbook.start())
+    next_row = 2
+    for batch in batches:
+        fileobj.write(workbook.write_rows(tool_sheet_rows_xml(batch, next_row)))
+        next_row += len(batch)
+    fileobj.write(workbook.finish())
+
+class _QueueWriter:
+    """File object used from a worker thread that hands ~64KB chunks to an
+    asyncio queue; blocks while the queue is full so a slow client throttles
+    the writer."""
+    chunk_size = 64 * 1024
+    
+    def __init__(self, loop, queue: asyncio.Queue, cancelled: threading.Event):
+        self._loop = loop
+        self._queue = queue
+        self._cancelled = cancelled
+        self._buffer = bytearray()
+        self._position = 0
+        self.closed = False
+    
+    def _put(self, chunk: bytes):
+        if self._cancelled.is_set():
+            raise IOError("Client went away")
+        asyncio.run_coroutine_threadsafe(self._queue.put(chunk), self._loop).result()
+    
+    def tell(self) -> int:
+        return self._position
+    
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        if len(self._buffer) >= self.chunk_size:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+    
+    def flush(self):
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+
+async def stream_from_thread(produce):
+    """Run ``produce(fileobj)`` in a thread and yield what it writes as it writes it"""
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue(maxsize=STREAM_QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    done = object()
+    
+    def run():
+        writer = _QueueWriter(loop, chunks, cancelled)
+        try:
+            produce(writer)
+            writer.flush()
+        finally:
+            if not cancelled.is_set():
+                asyncio.run_coroutine_threadsafe(chunks.put(done), loop).result()
+    
+    task = loop.run_in_executor(None, run)
+    try:
+        while True:
+            chunk = await chunks.get()
+            if chunk is done:
+                break
+            yield chunk
+        await task
+    finally:
+        if not task.done():
+            # Client disconnected: unblock the writer so the thread can exit
+            cancelled.set()
+            while not task.done():
+                while not chunks.empty():
+                    chunks.get_nowait()
+                await asyncio.sleep(0.01)
+
+def iter_cursor_batches(loop, cursor, size: int):
+    """Pull a Motor cursor in batches from a worker thread; each fetch runs on the event loop"""
+    while True:
+        batch = asyncio.run_coroutine_threadsafe(cursor.to_list(size), loop).result()
+        if not batch:
+            return
+        yield batch
+
+EXPORT_ARROW_TYPES = {
+    "string": pa.string(),
+    "int": pa.int64(),
+    "date": pa.date32(),
+    "timestamp": pa.timestamp("us", tz="UTC"),
+}
+
+def export_projection(dataset: str, columns: List[str]) -> dict:
+    """Mongo projection covering the stored fields the selected columns are built from"""
+    sources = EXPORT_DATASETS[dataset]["sources"]
+    projection = {"_id": 0}
+    for column in columns:
+        for field in sources.get(column, [column]):
+            projection[field] = 1
+    return projection
+
+def export_records(dataset: str, doc: dict) -> List[dict]:
+    """Turn one stored document into its export row(s)"""
+    if dataset == "tools":
+        status, expiry_date = tool_status(doc)
+        return [dict(doc, status=status, calibration_expiry_date=expiry_date)]
+    if dataset == "loans":
+        loan = {key: value for key, value in doc.items() if key != "equipments"}
+        loan["loan_id"] = doc.get("id")
+        equipments = doc.get("equipments") or []
+        if not equipments:
+            return [loan]
+        return [
+            dict(
+                loan,
+                line_no=line_no,
+                equipment_name=item.get("equipment_name"),
+                serial_no=item.get("serial_no"),
+                condition=item.get("condition")
+            )
+            for line_no, item in enumerate(equipments, 1)
+        ]
+    return [doc]
+
+def export_frame(dataset: str, docs: List[dict], columns: List[str]) -> pd.DataFrame:
+    """Build a typed DataFrame for one batch of stored documents"""
+    types = EXPORT_DATASETS[dataset]["columns"]
+    records = [record for doc in docs for record in export_records(dataset, doc)]
+    frame = pd.DataFrame.from_records(records, columns=columns)
+    for column in columns:
+        kind = types[column]
+        if kind == "int":
+            frame[column] = pd.to_numeric(frame[column], errors="coerce").astype("Int64")
+        elif kind == "date":
+            parsed = pd.to_datetime(frame[column], errors="coerce", format="ISO8601", utc=True)
+            frame[column] = parsed.dt.date.astype(object).where(parsed.notna(), None)
+        elif kind == "timestamp":
+            frame[column] = pd.to_datetime(frame[column], errors="coerce", format="ISO8601", utc=True)
+        else:
+            frame[column] = frame[column].astype("string")
+    return frame
+
+def write_export(dataset: str, columns: List[str], export_format: str, batches, fileobj):
+    """Write CSV or Parquet from batches of stored documents, one batch in memory at a time"""
+    if export_format == "csv":
+        header = True
+        for docs in batches:
+            frame = export_frame(dataset, docs, columns)
+            fileobj.write(frame.to_csv(
+                index=False, header=header, date_format="%Y-%m-%dT%H:%M:%S.%fZ"
+            ).encode("utf-8"))
+            header = False
+        if header:
+            fileobj.write((",".join(columns) + "\n").encode("utf-8"))
+        return
+    
+    types = EXPORT_DATASETS[dataset]["columns"]
+    schema = pa.schema([(column, EXPORT_ARROW_TYPES[types[column]]) for column in columns])
+    with pq.ParquetWriter(fileobj, schema) as writer:
+        for docs in batches:
+            frame = export_frame(dataset, docs, columns)
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+WORDPROCESSING_DRAWING_NS = "{http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing}"
+XML_NS = "{http://www.w3.org/XML/1998/namespace}"
+TEMPLATE_FIELD = re.compile(r"\{\{\s*([\w.]+)\s*\}\}")
+TEMPLATE_LOOP_TAG = re.compile(r"\{%[^%]*%\}")
+TEMPLATE_MARKER = re.compile(r"\{\{.*?\}\}|\{%.*?%\}")
+
+class LoanTemplate:
+    """The BKI loan form, parsed once per process and reloaded when the file changes.
+
+    Uses the template's jinja-style markers without a jinja pass: every part
+    except word/document.xml is zipped once up front, and each render
+    deep-copies the parsed document tree, fills the {{ field }} markers and
+    writes one equipment row per item from the table row holding the
+    {% for %} marker, then appends the document to a copy of that zip.
+    Markers Word split across text runs are joined back into their first
+    run on load.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self._mtime = None
+        self._base_zip = None
+        self._document = None
+        self._lock = threading.Lock()
+    
+    def compiled(self):
+        mtime = self.path.stat().st_mtime_ns
+        with self._lock:
+            if mtime != self._mtime:
+                self._base_zip, self._document = self._load()
+                self._mtime = mtime
+            return self._base_zip, self._document
+    
+    def _load(self):
+        base = io.BytesIO()
+        document = None
+        with zipfile.ZipFile(self.path) as source, zipfile.ZipFile(base, "w") as target:
+            for info in source.infolist():
+                if info.filename == "word/document.xml":
+                    document = etree.fromstring(source.read(info))
+                else:
+                    target.writestr(info, source.read(info))
+        if document is None:
+            raise ValueError(f"{self.path.name} has no word/document.xml")
+        
+        joined = sum(self._join_split_markers(paragraph) for paragraph in document.iter(f"{WORD_NS}p"))
+        if joined:
+            logger.info(f"Joined {joined} template markers split across runs in {self.path.name}")
+        logger.info(f"Loaded loan template {self.path.name}")
+        return base.getvalue(), document
+    
+    @staticmethod
+    def _join_split_markers(paragraph) -> int:
+        """Move each marker Word split over several text runs into the run it starts in"""
+        nodes = list(paragraph.iter(f"{WORD_NS}t"))
+        texts = [node.text or "" for node in nodes]
+        owners = [(index, offset) for index, text in enumerate(texts) for offset in range(len(text))]
+        full_text = "".join(texts)
+        
+        joined = 0
+        # Last marker first, so a run's earlier offsets stay valid after each move
+        for match in reversed(list(TEMPLATE_MARKER.finditer(full_text))):
+            first, start = owners[match.start()]
+            last, end = owners[match.end() - 1]
+            if first == last:
+                continue
+            texts[first] = texts[first][:start] + match.group(0)
+            for index in range(first + 1, last):
+                texts[index] = ""
+            texts[last] = texts[last][end + 1:]
+            joined += 1
+        
+        if joined:
+            for node, text in zip(nodes, texts):
+                if node.text != text:
+                    node.text = text
+                    node.set(f"{XML_NS}space", "preserve")
+        return joined
+    
+    @staticmethod
+    def _fill(element, values: dict):
+        for node in element.iter(f"{WORD_NS}t"):
+            if node.text and "{" in node.text:
+                text = TEMPLATE_LOOP_TAG.sub("", node.text)
+                node.text = TEMPLATE_FIELD.sub(lambda match: str(values.get(match.group(1), "")), text)
+    
+    def render(self, context: dict, items: List[dict]) -> bytes:
+        base_zip, document = self.compiled()
+        return self._package(base_zip, self._fill_form(document, context, items))
+    
+    def render_merged(self, forms: List[tuple]) -> bytes:
+        """One document holding a form per (context, items), each starting on a new page"""
+        base_zip, document = self.compiled()
+        root = copy.deepcopy(document)
+        body = root.find(f"{WORD_NS}body")
+        section = body.find(f"{WORD_NS}sectPr")
+        for child in list(body):
+            body.remove(child)
         
-        row_data = [
-            row_num - 1,
-            tool['equipment_name'],
-            tool['brand_type'],
-            tool['serial_no'],
-            tool['inventory_code'],
-            tool.get('asset_number', ''),
-            tool.get('periodic_inspection_date', ''),
-            tool.get('calibration_date', ''),
-            expiry_date or '',
-            status,
-            tool['condition'],
-            tool.get('description', ''),
-            tool['equipment_location']
+        for number, (context, items) in enumerate(forms):
+            if number:
+                page_break = etree.SubElement(body, f"{WORD_NS}p")
+                etree.SubElement(etree.SubElement(page_break, f"{WORD_NS}r"), f"{WORD_NS}br").set(f"{WORD_NS}type", "page")
+            form_body = self._fill_form(document, context, items).find(f"{WORD_NS}body")
+            for child in form_body:
+                if child.tag != f"{WORD_NS}sectPr":
+                    body.append(child)
+        if section is not None:
+            body.append(section)
+        
+        # Drawing ids must stay unique across the merged forms
+        for drawing_id, properties in enumerate(root.iter(f"{WORDPROCESSING_DRAWING_NS}docPr"), 1):
+            properties.set("id", str(drawing_id))
+        return self._package(base_zip, root)
+    
+    @staticmethod
+    def _package(base_zip: bytes, root) -> bytes:
+        output = io.BytesIO(base_zip)
+        output.seek(0, io.SEEK_END)
+        with zipfile.ZipFile(output, "a", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(
+                "word/document.xml",
+                etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+            )
+        return output.getvalue()
+    
+    def _fill_form(self, document, context: dict, items: List[dict]):
+        root = copy.deepcopy(document)
+        
+        loop_rows = [
+            row for row in root.iter(f"{WORD_NS}tr")
+            if any("{%" in (node.text or "") for node in row.iter(f"{WORD_NS}t"))
         ]
+        for template_row in loop_rows:
+            previous = template_row
+            for item in items or [{}]:
+                row = copy.deepcopy(template_row)
+                self._fill(row, {f"item.{key}": value for key, value in item.items()})
+                previous.addnext(row)
+                previous = row
+            template_row.getparent().remove(template_row)
+            
+            # Extra items take the place of the form's blank lines
+            for _ in range(len(items) - 1):
+                blank = previous.getnext()
+                if blank is None or blank.tag != f"{WORD_NS}tr" or "".join(blank.itertext()).strip():
+                    break
+                blank.getparent().remove(blank)
         
-        for col_num, value in enumerate(row_data, 1):
-            cell = ws.cell(row=row_num, column=col_num, value=value)
-            cell.border = thin_border
-            cell.alignment = Alignment(horizontal='left', vertical='center')
-    
-    # Adjust column widths
-    column_widths = [5, 25, 20, 15, 15, 15, 20, 18, 20, 15, 12, 30, 20]
-    for col_num, width in enumerate(column_widths, 1):
-        ws.column_dimensions[ws.cell(row=1, column=col_num).column_letter].width = width
-    
-    # Save to bytes
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    return StreamingResponse(
-        output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        self._fill(root, context)
+        return root
+
+loan_template = LoanTemplate(LOAN_TEMPLATE_PATH)
+
+def loan_form_fields(loan: dict):
+    """Template context and equipment rows for a loan's BKI form"""
+    items = [
+        {
+            'no': idx,
+            'equipment_name': equipment['equipment_name'],
+            'serial_no': equipment['serial_no'],
+            'quantity': '1',  # Hardcoded as per requirement
+            'condition': equipment['condition']
+        }
+        for idx, equipment in enumerate(loan['equipments'], 1)
+    ]
+    context = {
+        'WBS': loan.get('wbs_project_no', 'N/A'),
+        'project_name': loan['project_name'],
+        'project_location': loan['project_location'],
+        'loan_date': loan['loan_date'],
+        'return_date': loan['return_date'],
+        'borrower_name': loan['borrower_name']
+    }
+    return context, items
+
+def render_loan_document(loan: dict) -> bytes:
+    """Fill the BKI loan form template for a loan; runs in the render pool"""
+    return loan_template.render(*loan_form_fields(loan))
+
+def render_merged_loan_documents(loans: List[dict]) -> bytes:
+    """All the loans' forms in one document; runs in the render pool"""
+    return loan_template.render_merged([loan_form_fields(loan) for loan in loans])
+
+def loan_document_filename(loan: dict) -> str:
+    return f"loan_{loan['borrower_name'].replace(' ', '_')}_{loan['loan_date']}.docx"
+
+async def iter_loan_documents(loans: List[dict]):
+    """Yield (index, docx) for each loan as its form is rendered.
+
+    Only a couple of renders per worker are in flight at once, so however
+    many loans are exported only a handful of documents are held in memory.
+    Output order is not the input order.
+    """
+    window = max(1, min(render_pool.workers * 2, render_pool.max_pending))
+    queued = iter(enumerate(loans))
+    pending = set()
+    
+    async def render(index, loan):
+        return index, await render_pool.run(render_loan_document, loan)
+    
+    try:
+        while True:
+            for index, loan in itertools.islice(queued, window - len(pending)):
+                pending.add(asyncio.create_task(render(index, loan)))
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+def _write_upload_chunk(buffer, digest, chunk: bytes):
+    digest.update(chunk)
+    buffer.write(chunk)
+
+def _finish_upload(buffer):
+    buffer.flush()
+    os.fsync(buffer.fileno())
+    buffer.close()
+
+def upload_too_large(kind: str) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File exceeds the {UPLOAD_MAX_BYTES[kind] // (1024 * 1024)} MB limit for a {kind}"
+    )
+
+class UploadSizeLimitMiddleware:
+    """Refuse upload request bodies over their kind's cap as they arrive.
+
+    FastAPI parses the whole multipart form, spooling each file to disk,
+    before the endpoint runs, so spool_upload's check alone only limits what
+    is kept. A Content-Length over the cap is refused before anything is
+    read, and a body without one is cut off once it passes the cap.
+    """
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        kind = None
+        if scope["type"] == "http" and scope["method"] == "POST":
+            kind = next((kind for pattern, kind in UPLOAD_ROUTE_KINDS if pattern.match(scope["path"])), None)
+        if kind is None:
+            await self.app(scope, receive, send)
+            return
+        
+        max_bytes = UPLOAD_MAX_BYTES[kind] + UPLOAD_FORM_OVERHEAD_BYTES
+        too_large = upload_too_large(kind)
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > max_bytes:
+            response = JSONResponse({"detail": too_large.detail}, status_code=413)
+            await response(scope, receive, send)
+            return
+        
+        received = 0
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    # Re-raised by FastAPI's body parsing, answered by the exception handler
+                    raise too_large
+            return message
+        
+        await self.app(scope, limited_receive, send)
+
+async def spool_upload(file: UploadFile, kind: str) -> dict:
+    """Copy an upload to a temp file in the blob store in chunks, hashing it on the way.
+
+    File I/O and hashing run on the default thread pool so a large manual
+    doesn't stall the loop; anything over the kind's size cap is discarded
+    with a 413. The caller moves temp_path into place.
+    """
+    max_bytes = UPLOAD_MAX_BYTES[kind]
+    too_large = upload_too_large(kind)
+    if file.size is not None and file.size > max_bytes:
+        raise too_large
+    
+    loop = asyncio.get_running_loop()
+    temp_path = BLOBS_DIR / f".{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    buffer = await loop.run_in_executor(None, temp_path.open, "wb")
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise too_large
+            await loop.run_in_executor(None, _write_upload_chunk, buffer, digest, chunk)
+        await loop.run_in_executor(None, _finish_upload, buffer)
+    except BaseException:
+        buffer.close()
+        temp_path.unlink(missing_ok=True)
+        raise
+    
+    return {"temp_path": temp_path, "sha256": digest.hexdigest(), "size": size}
+
+# Content-addressed attachment store. Attachment fields hold the blob's
+# relative path, so downloads read it like any other upload; each record
+# pointing at a blob holds one reference in the blobs collection.
+BLOB_PATH_PREFIX = "uploads/blobs/"
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+def blob_relative_path(sha256: str) -> str:
+    return f"{BLOB_PATH_PREFIX}{sha256[:2]}/{sha256}"
+
+async def acquire_blob(sha256: str, size: int):
+    """Take a reference to a blob record, creating it if needed.
+
+    A record the collector has marked deleting is never revived, since its
+    file may already be gone: the upsert then hits the unique index, and we
+    wait for the collector to drop the record and start a fresh one.
+    """
+    for attempt in range(BLOB_ACQUIRE_ATTEMPTS):
+        try:
+            await db.blobs.update_one(
+                {"sha256": sha256, "deleting": {"$ne": True}},
+                {
+                    "$inc": {"refcount": 1},
+                    "$setOnInsert": {"size": size, "created_at": datetime.now(timezone.utc).isoformat()},
+                    "$unset": {"released_at": ""}
+                },
+                upsert=True
+            )
+            return
+        except DuplicateKeyError:
+            await asyncio.sleep(0.1 * (attempt + 1))
+    raise HTTPException(status_code=503, detail="Attachment store is busy, please retry")
+
+async def release_attachment(relative_path: Optional[str]):
+    """Drop a record's reference to its attachment.
+
+    Blobs are only dereferenced; blob_gc.py removes them once unused. Files
+    from before the blob store belong to a single record and are deleted.
+    """
+    if not relative_path:
+        return
+    if relative_path.startswith(BLOB_PATH_PREFIX):
+        await db.blobs.update_one(
+            {"sha256": Path(relative_path).name},
+            {"$inc": {"refcount": -1}, "$set": {"released_at": datetime.now(timezone.utc).isoformat()}}
+        )
+    else:
+        (ROOT_DIR / relative_path).unlink(missing_ok=True)
+
+async def store_attachment(kind: str, file: Optional[UploadFile], sha256: Optional[str], filename: Optional[str]) -> dict:
+    """Take a reference to the blob for an upload.
+
+    Clients that already know the file's SHA-256 may send just the hash; if
+    the store has that content the upload is skipped entirely, otherwise
+    they get a 404 and send the file.
+    """
+    if file is None:
+        if not sha256 or not SHA256_PATTERN.match(sha256):
+            raise HTTPException(status_code=400, detail="Send a file or the SHA-256 of a stored one")
+        not_stored = HTTPException(status_code=404, detail="No stored file with that hash, upload the file")
+        # Reference first, then check the file: once referenced the collector can't claim it
+        blob = await db.blobs.find_one_and_update(
+            {"sha256": sha256, "deleting": {"$ne": True}},
+            {"$inc": {"refcount": 1}, "$unset": {"released_at": ""}},
+            projection={"_id": 0, "size": 1}
+        )
+        if blob is None:
+            raise not_stored
+        if not (ROOT_DIR / blob_relative_path(sha256)).exists():
+            await release_attachment(blob_relative_path(sha256))
+            raise not_stored
+        return {"sha256": sha256, "size": blob["size"], "name": filename or sha256}
+    
+    spooled = await spool_upload(file, kind)
+    sha256 = spooled["sha256"]
+    # Reference first, then place the file, so the collector never sees a
+    # placed blob without a reference
+    await acquire_blob(sha256, spooled["size"])
+    blob_path = ROOT_DIR / blob_relative_path(sha256)
+    blob_path.parent.mkdir(exist_ok=True)
+    os.replace(spooled["temp_path"], blob_path)
+    return {"sha256": sha256, "size": spooled["size"], "name": file.filename or filename or sha256}
+
+async def attach_blob(collection, record_id: str, field: str, stored: dict) -> Optional[dict]:
+    """Point a record's attachment field at a stored blob, releasing what it pointed at before"""
+    relative_path = blob_relative_path(stored["sha256"])
+    previous = await collection.find_one_and_update(
+        {"id": record_id},
+        {"$set": {
+            field: relative_path,
+            f"{field}_sha256": stored["sha256"],
+            f"{field}_size": stored["size"],
+            f"{field}_name": stored["name"],
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }},
+        projection={"_id": 0, "id": 1, field: 1}
+    )
+    if previous is None:
+        # Record deleted meanwhile
+        await release_attachment(relative_path)
+        return None
+    if previous.get(field) != relative_path:
+        await release_attachment(previous.get(field))
+    else:
+        # Same content re-uploaded; keep a single reference
+        await release_attachment(relative_path)
+    return {"file_path": relative_path, **stored}
+
+def attachment_download_name(record: dict, field: str, label: str) -> str:
+    file_path = Path(record[field])
+    suffix = Path(record.get(f"{field}_name") or file_path.name).suffix
+    return f"{label}{suffix}"
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison against an If-None-Match list"""
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+def parse_byte_range(header: str, size: int) -> Optional[tuple]:
+    """Inclusive (start, end) for a single "bytes=" range, or None to send the whole file.
+
+    Multiple ranges and malformed headers are answered with the whole file,
+    which RFC 9110 allows; a range past the end of the file is a 416.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    unsatisfiable = HTTPException(
+        status_code=416, detail="Requested range not satisfiable",
+        headers={"Content-Range": f"bytes */{size}"}
+    )
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # Suffix range: the last N bytes
+            suffix_length = int(end_text)
+            if suffix_length == 0:
+                raise unsatisfiable
+            start, end = max(size - suffix_length, 0), size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise unsatisfiable
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+def _read_file_range(path: Path, start: int, length: int) -> bytes:
+    with path.open("rb") as handle:
+        handle.seek(start)
+        return handle.read(length)
+
+async def iter_file_range(path: Path, start: int, end: int):
+    loop = asyncio.get_running_loop()
+    position = start
+    while position <= end:
+        length = min(ATTACHMENT_READ_CHUNK_SIZE, end - position + 1)
+        chunk = await loop.run_in_executor(None, _read_file_range, path, position, length)
+        if not chunk:
+            return
+        position += len(chunk)
+        yield chunk
+
+async def attachment_response(request: Request, record: dict, field: str, label: str) -> Response:
+    """Serve a record's attachment with validators, 304s and single byte ranges.
+
+    The ETag is the stored SHA-256 when there is one, so it is strong and
+    stays the same wherever the content lives; older uploads fall back to
+    mtime and size.
+    """
+    file_path = ROOT_DIR / record[field]
+    try:
+        stat_result = await asyncio.get_running_loop().run_in_executor(None, file_path.stat)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    size = stat_result.st_size
+    sha256 = record.get(f"{field}_sha256")
+    filename = attachment_download_name(record, field, label)
+    headers = {
+        "ETag": f'"{sha256}"' if sha256 else f'"{stat_result.st_mtime_ns:x}-{size:x}"',
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache"
+    }
+    
+    # If-None-Match takes precedence over If-Modified-Since
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+    elif request.headers.get("if-modified-since"):
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"])
+        except (TypeError, ValueError):
+            since = None
+        if since is not None:
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+            if int(stat_result.st_mtime) <= since.timestamp():
+                return Response(status_code=304, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range in (None, headers["ETag"], headers["Last-Modified"]):
+        byte_range = parse_byte_range(range_header, size)
+        if byte_range is not None:
+            start, end = byte_range
+            headers.update({
+                "Content-Range": f"bytes {start}-{end}/{size}",
+                "Content-Length": str(end - start + 1),
+                "Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}"
+            })
+            return StreamingResponse(
+                iter_file_range(file_path, start, end),
+                status_code=206,
+                media_type=guess_type(filename)[0] or "application/octet-stream",
+                headers=headers
+            )
+    
+    return FileResponse(file_path, filename=filename, headers=headers, stat_result=stat_result)
+
+async def collect_blob_garbage(grace_seconds: float = BLOB_GC_GRACE_SECONDS) -> dict:
+    """Remove unreferenced blobs, blob files without a record and abandoned uploads"""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+    removed = {"blobs": 0, "orphan_files": 0, "partial_uploads": 0, "bytes": 0}
+    
+    # Blobs marked deleting are left over from an interrupted run
+    async for blob in db.blobs.find(
+        {"$or": [
+            {"refcount": {"$lte": 0}, "released_at": {"$lt": cutoff.isoformat()}},
+            {"deleting": True}
+        ]},
+        {"_id": 0, "sha256": 1}
+    ):
+        # Claim the blob before touching its file: acquire_blob never revives a
+        # record marked deleting, so no record can reference the file while it
+        # is unlinked, and a new upload of it waits until the record is gone
+        claimed = await db.blobs.update_one(
+            {"sha256": blob["sha256"], "refcount": {"$lte": 0}},
+            {"$set": {"deleting": True}}
+        )
+        if not claimed.matched_count:
+            continue
+        path = ROOT_DIR / blob_relative_path(blob["sha256"])
+        if path.exists():
+            removed["bytes"] += path.stat().st_size
+            path.unlink(missing_ok=True)
+        await db.blobs.delete_one({"sha256": blob["sha256"], "deleting": True})
+        removed["blobs"] += 1
+    
+    known = set(await db.blobs.distinct("sha256"))
+    cutoff_timestamp = cutoff.timestamp()
+    for path in BLOBS_DIR.glob("*/*"):
+        if path.name not in known and path.stat().st_mtime < cutoff_timestamp:
+            removed["bytes"] += path.stat().st_size
+            path.unlink()
+            removed["orphan_files"] += 1
+    for path in BLOBS_DIR.glob(".*.part"):
+        if path.stat().st_mtime < cutoff_timestamp:
+            path.unlink()
+            removed["partial_uploads"] += 1
+    return removed
+
+# Initialize default admin user
+@app.on_event("startup")
+async def startup_db():
+    await ensure_indexes()
+    
+    # Create default admin if not exists
+    admin_exists = await db.users.find_one({"username": "admin"})
+    if not admin_exists:
+        admin = User(
+            username="admin",
+            password_hash=await hash_password_async("admin123"),
+            role="admin",
+            full_name="System Administrator"
+        )
+        doc = admin.model_dump()
+        doc['created_at'] = doc['created_at'].isoformat()
+        await db.users.insert_one(doc)
+        user_cache.invalidate("admin")
+        logger.info("Default admin user created: username=admin, password=admin123")
+    
+    if await db.analytics_counters.estimated_document_count() == 0:
+        await rebuild_analytics_counters()
+    if await db.tool_bookings.estimated_document_count() == 0:
+        await rebuild_tool_bookings()
+    
+    start_periodic_task("tool-status-refresh", STATUS_REFRESH_INTERVAL_SECONDS, refresh_tool_statuses)
+    start_periodic_task("lost-tools-report", LOST_TOOLS_REFRESH_INTERVAL_SECONDS, refresh_lost_tools_report)
+    start_periodic_task("label-cache-prune", LABEL_CACHE_PRUNE_INTERVAL_SECONDS, label_cache.prune)
+
+# Auth endpoints
+@api_router.post("/auth/login", response_model=TokenResponse)
+async def login(user_login: UserLogin):
+    user = await db.users.find_one({"username": user_login.username}, {"_id": 0})
+    if not user or not await verify_password_async(user_login.password, user["password_hash"]):
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+    
+    user_cache.set(user["username"], user)
+    access_token = create_access_token(data={"sub": user["username"]})
+    user_response = UserResponse(
+        id=user["id"],
+        username=user["username"],
+        role=user["role"],
+        full_name=user["full_name"]
+    )
+    return TokenResponse(access_token=access_token, token_type="bearer", user=user_response)
+
+@api_router.get("/auth/me", response_model=UserResponse)
+async def get_me(current_user: dict = Depends(get_current_user)):
+    return UserResponse(
+        id=current_user["id"],
+        username=current_user["username"],
+        role=current_user["role"],
+        full_name=current_user["full_name"]
+    )
+
+# Tool endpoints
+@api_router.get("/tools", response_model=ToolPage)
+async def get_tools(
+    limit: int = Query(TOOLS_PAGE_DEFAULT_LIMIT, ge=1, le=TOOLS_PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    condition: Optional[str] = None,
+    location: Optional[str] = None,
+    equipment_name: Optional[str] = None,
+    status: Optional[str] = None,
+    search: Optional[str] = None
+):
+    """List tools a page at a time, ordered by (created_at, id).
+
+    Pass the returned ``next_cursor`` back as ``cursor`` to fetch the next page;
+    it is null once the last page has been served.
+    """
+    query = build_tool_query(condition, location, equipment_name, status, search)
+    if cursor:
+        created_at, tool_id = decode_cursor(cursor)
+        query = {"$and": [query, after_cursor_query(created_at, tool_id)]}
+    
+    tools = await db.tools.find(query, {"_id": 0}).sort(
+        [("created_at", 1), ("id", 1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    has_more = len(tools) > limit
+    tools = tools[:limit]
+    items = [tool_to_response(tool) for tool in tools]
+    last_tool = tools[-1] if tools else None
+    
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(last_tool.get('created_at'), last_tool['id'])
+    
+    return ToolPage(items=items, next_cursor=next_cursor)
+
+@api_router.get("/tools/calibration-due", response_model=ToolPage)
+async def get_calibration_due_queue(
+    horizon_days: int = Query(EXPIRING_SOON_DAYS, ge=0, le=3650),
+    location: Optional[str] = None,
+    include_expired: bool = True,
+    limit: int = Query(TOOLS_PAGE_DEFAULT_LIMIT, ge=1, le=TOOLS_PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None
+):
+    """Tools whose calibration expires within ``horizon_days``, soonest first.
+
+    Expired tools lead the queue unless ``include_expired`` is false. Pass the
+    returned ``next_cursor`` back as ``cursor`` to fetch the next page.
+    """
+    horizon_end = (datetime.now(timezone.utc).date() + timedelta(days=horizon_days)).isoformat()
+    query = expiry_window_query(horizon_end, location, include_expired)
+    if cursor:
+        expiry_date, tool_id = decode_cursor(cursor)
+        query = {"$and": [query, after_expiry_cursor_query(expiry_date, tool_id)]}
+    
+    tools = await db.tools.find(query, {"_id": 0}).sort(
+        [("calibration_expiry_date", 1), ("id", 1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    has_more = len(tools) > limit
+    tools = tools[:limit]
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(tools[-1]['calibration_expiry_date'], tools[-1]['id'])
+    
+    return ToolPage(items=[tool_to_response(tool) for tool in tools], next_cursor=next_cursor)
+
+@api_router.get("/tools/calibration-timeline")
+async def get_calibration_timeline(
+    horizon_months: int = Query(12, ge=1, le=CALIBRATION_TIMELINE_MAX_MONTHS),
+    location: Optional[str] = None
+):
+    """Count of tools expiring in each month from this one through ``horizon_months``
+    ahead, plus those already expired; answered from the expiry indexes alone"""
+    today = datetime.now(timezone.utc).date()
+    first_month = today.replace(day=1)
+    horizon_end = (add_months(first_month, horizon_months) - timedelta(days=1)).isoformat()
+    
+    pipeline = [
+        {"$match": expiry_window_query(horizon_end, location)},
+        {"$project": {"_id": 0, "calibration_expiry_date": 1}},
+        {"$group": {
+            "_id": {"$cond": [
+                {"$lte": ["$calibration_expiry_date", today.isoformat()]},
+                "expired",
+                {"$substr": ["$calibration_expiry_date", 0, 7]}
+            ]},
+            "count": {"$sum": 1}
+        }}
+    ]
+    counts = {row['_id']: row['count'] async for row in db.tools.aggregate(pipeline)}
+    
+    months = [
+        add_months(first_month, offset).strftime('%Y-%m')
+        for offset in range(horizon_months)
+    ]
+    return {
+        "expired": counts.get("expired", 0),
+        "months": [{"month": month, "count": counts.get(month, 0)} for month in months],
+        "total": sum(counts.values()),
+        "horizon_end": horizon_end
+    }
+
+@api_router.get("/tools/bookings", response_model=List[ToolBooking])
+async def get_tool_bookings(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    serial_no: Optional[str] = None
+):
+    """Loan bookings overlapping the inclusive window (default: today), i.e. the tools out"""
+    start, end = parse_booking_window(date_from, date_to)
+    bookings = await db.tool_bookings.find(
+        overlapping_bookings_query(start, end, serial_no), {"_id": 0, "revision": 0}
+    ).sort([("start", 1), ("serial_no", 1)]).to_list(None)
+    return bookings
+
+@api_router.get("/tools/equipment-names", response_model=List[str])
+async def get_tool_equipment_names():
+    """Every distinct equipment name in the register, for the list filter"""
+    names = await db.tools.distinct("equipment_name")
+    return sorted(name for name in names if name)
+
+@api_router.get("/tools/counts")
+async def get_tool_counts():
+    """Register size by stored status and by condition, without reading the tools"""
+    async def count_by_field(field: str) -> dict:
+        rows = await db.tools.aggregate([{"$group": {"_id": f"${field}", "count": {"$sum": 1}}}]).to_list(None)
+        return {row["_id"]: row["count"] for row in rows if row["_id"] is not None}
+    
+    return {
+        "total": await db.tools.count_documents({}),
+        "by_status": await count_by_field("status"),
+        "by_condition": await count_by_field("condition")
+    }
+
+@api_router.get("/tools/availability", response_model=ToolPage)
+async def get_available_tools(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    limit: int = Query(TOOLS_PAGE_DEFAULT_LIMIT, ge=1, le=TOOLS_PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    condition: Optional[str] = None,
+    location: Optional[str] = None,
+    equipment_name: Optional[str] = None,
+    status: Optional[str] = None,
+    search: Optional[str] = None
+):
+    """Tools with no booking in the inclusive window (default: today), paged like /tools"""
+    start, end = parse_booking_window(date_from, date_to)
+    booked = await db.tool_bookings.distinct("serial_no", overlapping_bookings_query(start, end))
+    
+    query = {"$and": [
+        build_tool_query(condition, location, equipment_name, status, search),
+        {"serial_no": {"$nin": booked}}
+    ]}
+    if cursor:
+        created_at, tool_id = decode_cursor(cursor)
+        query["$and"].append(after_cursor_query(created_at, tool_id))
+    
+    tools = await db.tools.find(query, {"_id": 0}).sort(
+        [("created_at", 1), ("id", 1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    has_more = len(tools) > limit
+    tools = tools[:limit]
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(tools[-1].get('created_at'), tools[-1]['id'])
+    
+    return ToolPage(items=[tool_to_response(tool) for tool in tools], next_cursor=next_cursor)
+
+@api_router.post("/tools", response_model=ToolResponse)
+async def create_tool(tool_create: ToolCreate):
+    tool = Tool(**tool_create.model_dump())
+    doc = tool.model_dump()
+    doc['created_at'] = doc['created_at'].isoformat()
+    doc['updated_at'] = doc['updated_at'].isoformat()
+    doc.update(calibration_status_fields(tool.calibration_date, tool.calibration_validity_months))
+    
+    await db.tools.insert_one(doc)
+    await apply_counter_deltas(tool_counter_deltas(doc))
+    
+    return tool_to_response(doc)
+
+@api_router.post("/tools/import")
+async def import_tools(
+    file: UploadFile = File(...),
+    dry_run: bool = Form(False),
+    current_user: dict = Depends(get_admin_user)
+):
+    """Create tools from an xlsx or csv in the Excel export's column layout.
+
+    Every row is validated against ToolCreate and deduplicated on serial_no and
+    inventory_code, both within the file and against the register; valid rows
+    are inserted TOOL_IMPORT_BATCH_SIZE at a time and the rest are reported
+    by row number. With ``dry_run`` nothing is inserted.
+    """
+    file_format = Path(file.filename or "").suffix.lower().lstrip(".")
+    if file_format not in ("xlsx", "csv"):
+        raise HTTPException(status_code=400, detail="Upload an .xlsx or .csv file")
+    
+    spooled = await spool_upload(file, "tool import")
+    try:
+        rows = await render_pool.run(read_tool_import_rows, str(spooled['temp_path']), file_format)
+    except (ValueError, KeyError, zipfile.BadZipFile, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read the file: {e}")
+    finally:
+        spooled['temp_path'].unlink(missing_ok=True)
+    
+    errors = []
+    imported = 0
+    seen_serials = {}
+    seen_codes = {}
+    for start in range(0, len(rows), TOOL_IMPORT_BATCH_SIZE):
+        batch = rows[start:start + TOOL_IMPORT_BATCH_SIZE]
+        
+        valid = []
+        for row_number, fields in batch:
+            try:
+                tool_create = ToolCreate(**{key: value for key, value in fields.items() if value is not None})
+            except ValidationError as e:
+                errors.append({"row": row_number, "serial_no": fields.get('serial_no'), "errors": tool_import_errors(e)})
+                continue
+            valid.append((row_number, tool_create))
+        
+        existing = await db.tools.find(
+            {"$or": [
+                {"serial_no": {"$in": [tool.serial_no for _, tool in valid]}},
+                {"inventory_code": {"$in": [tool.inventory_code for _, tool in valid]}}
+            ]},
+            {"_id": 0, "serial_no": 1, "inventory_code": 1}
+        ).to_list(None) if valid else []
+        existing_serials = {tool['serial_no'] for tool in existing}
+        existing_codes = {tool['inventory_code'] for tool in existing}
+        
+        docs = []
+        for row_number, tool_create in valid:
+            row_errors = []
+            if tool_create.serial_no in existing_serials:
+                row_errors.append(f"serial_no: {tool_create.serial_no} is already in the register")
+            elif tool_create.serial_no in seen_serials:
+                row_errors.append(f"serial_no: {tool_create.serial_no} repeats row {seen_serials[tool_create.serial_no]}")
+            if tool_create.inventory_code in existing_codes:
+                row_errors.append(f"inventory_code: {tool_create.inventory_code} is already in the register")
+            elif tool_create.inventory_code in seen_codes:
+                row_errors.append(f"inventory_code: {tool_create.inventory_code} repeats row {seen_codes[tool_create.inventory_code]}")
+            seen_serials.setdefault(tool_create.serial_no, row_number)
+            seen_codes.setdefault(tool_create.inventory_code, row_number)
+            if row_errors:
+                errors.append({"row": row_number, "serial_no": tool_create.serial_no, "errors": row_errors})
+                continue
+            
+            tool = Tool(**tool_create.model_dump())
+            doc = tool.model_dump()
+            doc['created_at'] = doc['created_at'].isoformat()
+            doc['updated_at'] = doc['updated_at'].isoformat()
+            doc.update(calibration_status_fields(tool.calibration_date, tool.calibration_validity_months))
+            docs.append(doc)
+        
+        if docs and not dry_run:
+            await db.tools.insert_many(docs, ordered=False)
+            await apply_counter_deltas(*[tool_counter_deltas(doc) for doc in docs])
+        imported += len(docs)
+    
+    if imported and not dry_run:
+        logger.info(f"{current_user['username']} imported {imported} tool(s)")
+    return {
+        "total_rows": len(rows),
+        "imported": imported,
+        "failed": len(errors),
+        "dry_run": dry_run,
+        "errors": sorted(errors, key=lambda error: error['row'])
+    }
+
+@api_router.put("/tools/{tool_id}", response_model=ToolResponse)
+async def update_tool(tool_id: str, tool_update: ToolCreate):
+    existing_tool = await db.tools.find_one({"id": tool_id}, {"_id": 0})
+    if not existing_tool:
+        raise HTTPException(status_code=404, detail="Tool not found")
+    
+    update_data = tool_update.model_dump()
+    update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_data.update(calibration_status_fields(
+        update_data.get('calibration_date'),
+        update_data.get('calibration_validity_months', 12)
+    ))
+    
+    await db.tools.update_one({"id": tool_id}, {"$set": update_data})
+    await apply_counter_deltas(
+        tool_counter_deltas(existing_tool, -1),
+        tool_counter_deltas(update_data)
+    )
+    
+    return tool_to_response({**existing_tool, **update_data})
+
+@api_router.delete("/tools/{tool_id}")
+async def delete_tool(tool_id: str):
+    tool = await db.tools.find_one_and_delete({"id": tool_id}, {"_id": 0})
+    if not tool:
+        raise HTTPException(status_code=404, detail="Tool not found")
+    
+    # Release associated files
+    await release_attachment(tool.get('calibration_certificate'))
+    await release_attachment(tool.get('equipment_manual'))
+    await apply_counter_deltas(tool_counter_deltas(tool, -1))
+    return {"message": "Tool deleted successfully"}
+
+@api_router.post("/tools/{tool_id}/upload-certificate")
+async def upload_certificate(
+    tool_id: str,
+    tasks: BackgroundTasks,
+    file: Optional[UploadFile] = File(None),
+    sha256: Optional[str] = Form(None),
+    filename: Optional[str] = Form(None)
+):
+    tool = await db.tools.find_one({"id": tool_id}, {"_id": 0})
+    if not tool:
+        raise HTTPException(status_code=404, detail="Tool not found")
+    
+    stored = await store_attachment("certificate", file, sha256, filename)
+    attached = await attach_blob(db.tools, tool_id, "calibration_certificate", stored)
+    if attached is None:
+        raise HTTPException(status_code=404, detail="Tool not found")
+    
+    # Previews are rendered after the response is sent
+    certificate = {
+        "id": tool_id,
+        "calibration_certificate": attached["file_path"],
+        "calibration_certificate_sha256": stored["sha256"],
+        "calibration_certificate_name": stored["name"]
+    }
+    if certificate_previewable(certificate):
+        tasks.add_task(pregenerate_certificate_previews, certificate)
+    
+    return {"message": "Certificate uploaded successfully", **attached}
+
+@api_router.get("/tools/{tool_id}/certificate-preview")
+async def get_certificate_preview(
+    tool_id: str,
+    request: Request,
+    size: int = Query(480),
+    format: Optional[str] = Query(None, description="webp or jpeg; picked from the Accept header when omitted")
+):
+    """Downscaled preview of an image certificate"""
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {', '.join(map(str, THUMBNAIL_SIZES))}")
+    if format is None:
+        format = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+    elif format not in THUMBNAIL_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be 'webp' or 'jpeg'")
+    
+    tool = await db.tools.find_one({"id": tool_id}, {"_id": 0})
+    if not tool or not tool.get('calibration_certificate'):
+        raise HTTPException(status_code=404, detail="Certificate not found")
+    if not certificate_previewable(tool):
+        raise HTTPException(status_code=404, detail="No preview for this certificate type")
+    if not (ROOT_DIR / tool['calibration_certificate']).exists():
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    key = certificate_preview_key(tool)
+    headers = {"ETag": f'"{key}-{size}.{format}"', "Cache-Control": "private, no-cache", "Vary": "Accept"}
+    if etag_matches(request.headers.get("if-none-match", ""), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    
+    path = thumbnail_path(key, size, format)
+    if not path.exists():
+        try:
+            await ensure_certificate_previews(tool)
+        except (OSError, Image.DecompressionBombError):
+            raise HTTPException(status_code=415, detail="Certificate image could not be read")
+    
+    return FileResponse(path, media_type=THUMBNAIL_FORMATS[format][1], headers=headers)
+
+@api_router.post("/tools/{tool_id}/upload-manual")
+async def upload_manual(
+    tool_id: str,
+    file: Optional[UploadFile] = File(None),
+    sha256: Optional[str] = Form(None),
+    filename: Optional[str] = Form(None)
+):
+    tool = await db.tools.find_one({"id": tool_id}, {"_id": 0})
+    if not tool:
+        raise HTTPException(status_code=404, detail="Tool not found")
+    
+    stored = await store_attachment("manual", file, sha256, filename)
+    attached = await attach_blob(db.tools, tool_id, "equipment_manual", stored)
+    if attached is None:
+        raise HTTPException(status_code=404, detail="Tool not found")
+    
+    return {"message": "Manual uploaded successfully", **attached}
+
+@api_router.get("/tools/{tool_id}/download-certificate")
+async def download_certificate(tool_id: str, request: Request):
+    tool = await db.tools.find_one({"id": tool_id}, {"_id": 0})
+    if not tool or not tool.get('calibration_certificate'):
+        raise HTTPException(status_code=404, detail="Certificate not found")
+    
+    return await attachment_response(request, tool, "calibration_certificate", f"{tool['equipment_name']}_certificate")
+
+@api_router.get("/tools/{tool_id}/download-manual")
+async def download_manual(tool_id: str, request: Request):
+    tool = await db.tools.find_one({"id": tool_id}, {"_id": 0})
+    if not tool or not tool.get('equipment_manual'):
+        raise HTTPException(status_code=404, detail="Manual not found")
+    
+    return await attachment_response(request, tool, "equipment_manual", f"{tool['equipment_name']}_manual")
+
+@api_router.get("/tools/{tool_id}/barcode")
+async def generate_barcode(tool_id: str, request: Request):
+    tool = await db.tools.find_one({"id": tool_id}, {"_id": 0})
+    if not tool:
+        raise HTTPException(status_code=404, detail="Tool not found")
+    
+    status, expiry_date = tool_status(tool)
+    label = {
+        "equipment_name": tool['equipment_name'],
+        "serial_no": tool['serial_no'],
+        "asset_number": tool.get('asset_number'),
+        "expiry_date": expiry_date,
+        "status": status
+    }
+    key = label_cache_key(label)
+    headers = {
+        "ETag": f'"{key}"',
+        "Cache-Control": "no-cache",
+        "Content-Disposition": f"attachment; filename=qrcode_{tool['serial_no']}.png"
+    }
+    
+    if etag_matches(request.headers.get("if-none-match", ""), headers["ETag"]):
+        return Response(status_code=304, headers={"ETag": headers["ETag"], "Cache-Control": headers["Cache-Control"]})
+    
+    png = await get_tool_label_png(label, key)
+    return Response(content=png, media_type="image/png", headers=headers)
+
+@api_router.post("/tools/labels/batch")
+async def generate_label_batch(batch: LabelBatchRequest):
+    """Print QR labels for many tools at once, as a PDF label sheet or a ZIP of PNGs"""
+    if batch.format not in ("pdf", "zip"):
+        raise HTTPException(status_code=400, detail="format must be 'pdf' or 'zip'")
+    
+    if batch.tool_ids is not None:
+        query = {"id": {"$in": batch.tool_ids}}
+    else:
+        query = build_tool_query(batch.condition, batch.location, batch.equipment_name, batch.status, batch.search)
+    
+    tools = await db.tools.find(query, {"_id": 0}).sort(
+        [("created_at", 1), ("id", 1)]
+    ).to_list(LABEL_BATCH_MAX_TOOLS + 1)
+    if not tools:
+        raise HTTPException(status_code=404, detail="No tools matched")
+    if len(tools) > LABEL_BATCH_MAX_TOOLS:
+        raise HTTPException(status_code=400, detail=f"At most {LABEL_BATCH_MAX_TOOLS} labels per batch")
+    
+    labels = []
+    for tool in tools:
+        status, expiry_date = tool_status(tool)
+        labels.append({
+            "equipment_name": tool['equipment_name'],
+            "serial_no": tool['serial_no'],
+            "asset_number": tool.get('asset_number'),
+            "expiry_date": expiry_date,
+            "status": status
+        })
+    
+    if batch.format == "zip":
+        async def entries():
+            used_names = set()
+            async for index, png in iter_tool_label_pngs(labels):
+                yield unique_archive_name(f"qrcode_{labels[index]['serial_no']}.png", used_names), png
+        
+        return StreamingResponse(
+            stream_zip(await started_stream(entries()), compression=zipfile.ZIP_STORED),
+            media_type="application/zip",
+            headers={"Content-Disposition": "attachment; filename=qr_labels.zip"}
+        )
+    
+    pngs = [None] * len(labels)
+    async for index, png in iter_tool_label_pngs(labels):
+        pngs[index] = png
+    sheet = await render_pool.run(
+        render_label_sheet, pngs,
+        timeout=max(RENDER_TIMEOUT_SECONDS, len(pngs) * LABEL_SHEET_SECONDS_PER_LABEL)
+    )
+    
+    return Response(content=sheet, media_type="application/pdf", headers={
+        "Content-Disposition": "attachment; filename=qr_labels.pdf"
+    })
+
+@api_router.get("/tools/export/excel")
+async def export_tools_excel():
+    """Tools are read in batches and each batch is rendered to sheet XML in
+    the render pool, then appended to the workbook and sent"""
+    cursor = db.tools.find({}, {"_id": 0}).sort([("created_at", 1), ("id", 1)])
+    
+    async def content():
+        workbook = ToolWorkbookStream()
+        tools = await cursor.to_list(EXCEL_EXPORT_BATCH_SIZE)
+        rows_xml = await render_pool.run(render_tool_sheet_rows, tools, 1)
+        yield workbook.start()
+        
+        number = 1
+        while tools:
+            yield await asyncio.to_thread(workbook.write_rows, rows_xml)
+            number += len(tools)
+            tools = await cursor.to_list(EXCEL_EXPORT_BATCH_SIZE)
+            if tools:
+                rows_xml = await render_pool.run(render_tool_sheet_rows, tools, number)
+        yield workbook.finish()
+    
+    return StreamingResponse(
+        await started_stream(content()),
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         headers={"Content-Disposition": "attachment; filename=tool_status.xlsx"}
     )
 
+@api_router.get("/export/{dataset}")
+async def export_dataset(
+    dataset: str,
+    format: str = Query("csv"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns, defaults to all"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+):
+    """Stream a whole collection as CSV or Parquet.
+
+    The date range is inclusive and applies to the dataset's date field
+    (tools/stock_items: created_at, loans: loan_date, calibrations:
+    calibration_date).
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise HTTPException(status_code=404, detail="Unknown export dataset")
+    if format not in ("csv", "parquet"):
+        raise HTTPException(status_code=400, detail="Format must be 'csv' or 'parquet'")
+    spec = EXPORT_DATASETS[dataset]
+    
+    columns = list(spec["columns"])
+    if fields:
+        columns = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [column for column in columns if column not in spec["columns"]]
+        if unknown or not columns:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    
+    query = {}
+    date_range = {}
+    if date_from:
+        date_range["$gte"] = date_from.isoformat()
+    if date_to:
+        # Stored values may be dates or full timestamps, so bound by the next day
+        date_range["$lt"] = (date_to + timedelta(days=1)).isoformat()
+    if date_range:
+        query[spec["date_field"]] = date_range
+    
+    loop = asyncio.get_running_loop()
+    cursor = db[spec["collection"]].find(query, export_projection(dataset, columns)).sort("_id", 1)
+    batches = iter_cursor_batches(loop, cursor, EXPORT_BATCH_SIZE)
+    
+    media_type = "text/csv" if format == "csv" else "application/vnd.apache.parquet"
+    return StreamingResponse(
+        stream_from_thread(lambda fileobj: write_export(dataset, columns, format, batches, fileobj)),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={dataset}.{format}"}
+    )
+
 # Loan endpoints
 @api_router.get("/loans", response_model=List[Loan])
 async def get_loans():
@@ -739,7 +3305,13 @@ async def create_loan(loan_create: LoanCreate, current_user: dict = Depends(get_
     doc = loan.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     
-    await db.loans.insert_one(doc)
+    await reserve_tool_bookings(doc)
+    try:
+        await db.loans.insert_one(doc)
+    except BaseException:
+        await release_tool_bookings(loan.id)
+        raise
+    await apply_counter_deltas(loan_counter_deltas(doc))
     return loan
 
 @api_router.put("/loans/{loan_id}")
@@ -755,113 +3327,122 @@ async def update_loan(loan_id: str, loan_update: LoanCreate, current_user: dict
         "updated_by": current_user['username']
     }
     
+    # The new bookings are checked before the loan changes; the old ones go after
+    revision = await reserve_tool_bookings({**existing_loan, **update_doc})
     await db.loans.update_one(
         {"id": loan_id},
         {"$set": update_doc}
     )
+    await release_tool_bookings(loan_id, keep_revision=revision)
+    await apply_counter_deltas(
+        loan_counter_deltas(existing_loan, -1),
+        loan_counter_deltas(update_doc)
+    )
     
     updated_loan = await db.loans.find_one({"id": loan_id}, {"_id": 0})
     return updated_loan
 
+@api_router.post("/loans/{loan_id}/return")
+async def return_loan(loan_id: str, tasks: BackgroundTasks, current_user: dict = Depends(get_current_user)):
+    """Mark a loan's equipment as returned, freeing its tools from today"""
+    now = datetime.now(timezone.utc)
+    returned = {"returned_at": now.isoformat(), "returned_by": current_user['username']}
+    loan = await db.loans.find_one_and_update(
+        {"id": loan_id, "returned_at": None},
+        {"$set": returned},
+        projection={"_id": 0}
+    )
+    if loan is None:
+        if await db.loans.count_documents({"id": loan_id}, limit=1):
+            raise HTTPException(status_code=400, detail="Loan already returned")
+        raise HTTPException(status_code=404, detail="Loan not found")
+    loan.update(returned)
+    
+    await end_tool_bookings(loan_id, now.date())
+    if loan['return_date'] < now.date().isoformat():
+        tasks.add_task(refresh_lost_tools_report)
+    return loan
+
 @api_router.delete("/loans/{loan_id}")
 async def delete_loan(loan_id: str):
     """Delete a loan record"""
-    result = await db.loans.delete_one({"id": loan_id})
-    if result.deleted_count == 0:
+    loan = await db.loans.find_one_and_delete({"id": loan_id}, {"_id": 0})
+    if not loan:
         raise HTTPException(status_code=404, detail="Loan not found")
+    await release_tool_bookings(loan_id)
+    await apply_counter_deltas(loan_counter_deltas(loan, -1))
     return {"message": "Loan deleted successfully"}
 
 @api_router.get("/loans/{loan_id}/export")
 async def export_loan_document(loan_id: str):
     """Export loan document using DOCX template and convert to PDF"""
-    import subprocess
-    import tempfile
-    
     loan = await db.loans.find_one({"id": loan_id}, {"_id": 0})
     if not loan:
         raise HTTPException(status_code=404, detail="Loan not found")
     
-    # Load BKI format template
-    template_path = ROOT_DIR / "templates" / "loan_template_bki_format.docx"
-    if not template_path.exists():
+    if not LOAN_TEMPLATE_PATH.exists():
         raise HTTPException(status_code=500, detail="Template file not found")
     
-    doc = DocxTemplate(str(template_path))
-    
-    # Prepare items list for table
-    items = []
-    for idx, equipment in enumerate(loan['equipments'], 1):
-        items.append({
-            'no': idx,
-            'equipment_name': equipment['equipment_name'],
-            'serial_no': equipment['serial_no'],
-            'quantity': '1',  # Hardcoded as per requirement
-            'condition': equipment['condition']
-        })
-    
-    # Prepare context for template with all required variables
-    context = {
-        'WBS': loan.get('wbs_project_no', 'N/A'),  # WBS number
-        'project_name': loan['project_name'],
-        'project_location': loan['project_location'],
-        'loan_date': loan['loan_date'],
-        'return_date': loan['return_date'],
-        'borrower_name': loan['borrower_name'],
-        'items': items
-    }
-    
-    # Render the template
-    doc.render(context)
-    
-    # Manually handle table rows for multiple equipment items
-    # docxtpl's {%tr} syntax is tricky, so we'll add rows programmatically
-    from docx import Document as DocxDocument
-    from docx.oxml import OxmlElement
-    from copy import deepcopy
-    
-    # Save rendered doc to temp buffer first
-    temp_buffer = io.BytesIO()
-    doc.save(temp_buffer)
-    temp_buffer.seek(0)
-    
-    # Re-open as python-docx Document to manipulate table
-    rendered_doc = DocxDocument(temp_buffer)
-    
-    # Find the equipment table (first table in document)
-    if rendered_doc.tables:
-        equipment_table = rendered_doc.tables[0]
-        
-        # Row 1 has the first equipment item
-        # We need to duplicate this row for remaining items
-        if len(context['items']) > 1:
-            template_row = equipment_table.rows[1]
-            
-            # Add additional rows for remaining equipment
-            for item in context['items'][1:]:  # Skip first item (already in row 1)
-                # Add new row
-                new_row = equipment_table.add_row()
-                
-                # Copy formatting and fill with data
-                new_row.cells[0].text = str(item['no'])
-                new_row.cells[1].text = item['equipment_name']
-                new_row.cells[2].text = item['serial_no']
-                new_row.cells[3].text = item['quantity']
-                new_row.cells[4].text = item['condition']
-    
-    # Save the manipulated document to a buffer
-    final_buffer = io.BytesIO()
-    rendered_doc.save(final_buffer)
-    final_buffer.seek(0)
+    document = await render_pool.run(render_loan_document, loan)
     
     # Return DOCX file (more reliable than PDF conversion)
     return StreamingResponse(
-        final_buffer,
+        io.BytesIO(document),
         media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
         headers={
-            "Content-Disposition": f"attachment; filename=loan_{loan['borrower_name'].replace(' ', '_')}_{loan['loan_date']}.docx"
+            "Content-Disposition": f"attachment; filename={loan_document_filename(loan)}"
         }
     )
 
+@api_router.post("/loans/export/batch")
+async def export_loan_documents(batch: LoanExportRequest, current_user: dict = Depends(get_admin_user)):
+    """Export the loan forms matching a filter as a ZIP of DOCX files or one merged DOCX"""
+    if batch.format not in ("zip", "docx"):
+        raise HTTPException(status_code=400, detail="format must be 'zip' or 'docx'")
+    if not LOAN_TEMPLATE_PATH.exists():
+        raise HTTPException(status_code=500, detail="Template file not found")
+    
+    query = {}
+    if batch.project_name:
+        query["project_name"] = batch.project_name
+    if batch.wbs_project_no:
+        query["wbs_project_no"] = batch.wbs_project_no
+    date_range = {}
+    if batch.date_from:
+        date_range["$gte"] = batch.date_from
+    if batch.date_to:
+        date_range["$lte"] = batch.date_to
+    if date_range:
+        query["loan_date"] = date_range
+    
+    loans = await db.loans.find(query, {"_id": 0}).sort(
+        [("loan_date", 1), ("created_at", 1)]
+    ).to_list(LOAN_EXPORT_MAX_LOANS + 1)
+    if not loans:
+        raise HTTPException(status_code=404, detail="No loans matched")
+    if len(loans) > LOAN_EXPORT_MAX_LOANS:
+        raise HTTPException(status_code=400, detail=f"At most {LOAN_EXPORT_MAX_LOANS} loans per export")
+    
+    if batch.format == "docx":
+        document = await render_pool.run(render_merged_loan_documents, loans)
+        return StreamingResponse(
+            io.BytesIO(document),
+            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            headers={"Content-Disposition": "attachment; filename=loan_forms.docx"}
+        )
+    
+    async def entries():
+        used_names = set()
+        async for index, document in iter_loan_documents(loans):
+            yield unique_archive_name(loan_document_filename(loans[index]), used_names), document
+    
+    # DOCX files are already deflated
+    return StreamingResponse(
+        stream_zip(await started_stream(entries()), compression=zipfile.ZIP_STORED),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=loan_forms.zip"}
+    )
+
 # Keep old endpoint for backward compatibility (redirects to new one)
 @api_router.get("/loans/{loan_id}/pdf")
 async def get_loan_pdf_legacy(loan_id: str):
@@ -882,17 +3463,66 @@ async def create_calibration(cal_create: CalibrationCreate, current_user: dict =
     
     await db.calibrations.insert_one(doc)
     
-    # Update tool calibration if exists
-    await db.tools.update_one(
-        {"serial_no": cal_create.serial_no},
-        {"$set": {
-            "calibration_date": cal_create.calibration_date,
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
-    )
+    # Move the tool's calibration forward only; back-filled older records are
+    # history. The date guard is repeated in the update so a concurrent newer
+    # record can't be overwritten. Dates compare as YYYY-MM-DD strings.
+    newer_than_tool = {"$or": [
+        {"calibration_date": {"$lt": cal_create.calibration_date}},
+        {"calibration_date": None},
+        {"calibration_date": ""}
+    ]}
+    async for tool in db.tools.find(
+        {"serial_no": cal_create.serial_no, **newer_than_tool},
+        {"_id": 0, "id": 1, "calibration_validity_months": 1}
+    ):
+        await db.tools.update_one(
+            {"id": tool['id'], **newer_than_tool},
+            {"$set": {
+                "calibration_date": cal_create.calibration_date,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+                **calibration_status_fields(
+                    cal_create.calibration_date,
+                    tool.get('calibration_validity_months', 12)
+                )
+            }}
+        )
     
     return calibration
 
+@api_router.get("/tools/{tool_id}/calibrations", response_model=CalibrationPage)
+async def get_tool_calibrations(
+    tool_id: str,
+    limit: int = Query(20, ge=1, le=TOOLS_PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None
+):
+    """Calibration records for a tool's serial number, newest first.
+
+    Pass the returned ``next_cursor`` back as ``cursor`` to fetch older records.
+    """
+    tool = await db.tools.find_one({"id": tool_id}, {"_id": 0, "serial_no": 1})
+    if not tool:
+        raise HTTPException(status_code=404, detail="Tool not found")
+    
+    query = {"serial_no": tool['serial_no']}
+    if cursor:
+        calibration_date, calibration_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"calibration_date": {"$lt": calibration_date}},
+            {"calibration_date": calibration_date, "id": {"$lt": calibration_id}}
+        ]
+    
+    calibrations = await db.calibrations.find(query, {"_id": 0}).sort(
+        [("calibration_date", -1), ("id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    has_more = len(calibrations) > limit
+    calibrations = calibrations[:limit]
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(calibrations[-1]['calibration_date'], calibrations[-1]['id'])
+    
+    return CalibrationPage(items=calibrations, next_cursor=next_cursor)
+
 # Stock Management endpoints
 @api_router.get("/stock", response_model=List[StockItem])
 async def get_stock_items():
@@ -906,7 +3536,13 @@ async def create_stock_item(item_create: StockItemCreate):
     doc['created_at'] = doc['created_at'].isoformat()
     doc['updated_at'] = doc['updated_at'].isoformat()
     
-    await db.stock_items.insert_one(doc)
+    async def create(session):
+        await db.stock_items.insert_one(doc, session=session)
+        if doc['available_quantity']:
+            await record_stock_movement(doc, "add", doc['available_quantity'], "Initial stock", session)
+    
+    await run_stock_write(create)
+    await apply_counter_deltas(stock_counter_deltas(doc))
     return item
 
 @api_router.put("/stock/{item_id}", response_model=StockItem)
@@ -915,199 +3551,306 @@ async def update_stock_item(
     item_update: StockItemUpdate, 
     
 ):
-    existing_item = await db.stock_items.find_one({"id": item_id}, {"_id": 0})
-    if not existing_item:
-        raise HTTPException(status_code=404, detail="Stock item not found")
-    
-    # If quantity is being updated, add to existing quantity (stock addition)
     update_data = item_update.model_dump(exclude_unset=True)
-    if 'available_quantity' in update_data:
-        update_data['available_quantity'] = existing_item['available_quantity'] + update_data['available_quantity']
-    
+    reason = update_data.pop('reason', None)
+    added = update_data.pop('available_quantity', None) or 0
     update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
     
-    await db.stock_items.update_one({"id": item_id}, {"$set": update_data})
+    # A quantity is a stock addition, applied atomically to the current value;
+    # a negative one may not take the stock below zero
+    query = {"id": item_id}
+    update = {"$set": update_data}
+    if added:
+        update["$inc"] = {"available_quantity": added}
+        if added < 0:
+            query["available_quantity"] = {"$gte": -added}
+    
+    async def update_item(session):
+        item = await db.stock_items.find_one_and_update(
+            query, update, projection={"_id": 0}, return_document=ReturnDocument.AFTER, session=session
+        )
+        if item is not None and added:
+            await record_stock_movement(item, "add" if added > 0 else "adjust", added, reason, session)
+        return item
+    
+    updated_item = await run_stock_write(update_item)
+    if updated_item is None:
+        existing_item = await db.stock_items.find_one({"id": item_id}, {"_id": 0})
+        if not existing_item:
+            raise HTTPException(status_code=404, detail="Stock item not found")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Insufficient stock. Available: {existing_item['available_quantity']} {existing_item['unit']}"
+        )
     
-    updated_item = await db.stock_items.find_one({"id": item_id}, {"_id": 0})
+    if added:
+        await apply_counter_deltas(stock_quantity_deltas(updated_item, added))
     return StockItem(**updated_item)
 
 @api_router.delete("/stock/{item_id}")
 async def delete_stock_item(item_id: str):
-    item = await db.stock_items.find_one({"id": item_id}, {"_id": 0})
-    if item:
-        # Delete associated receipt file
-        if item.get('purchase_receipt'):
-            receipt_path = ROOT_DIR / item['purchase_receipt']
-            if receipt_path.exists():
-                receipt_path.unlink()
-    
-    result = await db.stock_items.delete_one({"id": item_id})
-    if result.deleted_count == 0:
+    item = await db.stock_items.find_one_and_delete({"id": item_id}, {"_id": 0})
+    if not item:
         raise HTTPException(status_code=404, detail="Stock item not found")
+    
+    # Release associated receipt file
+    await release_attachment(item.get('purchase_receipt'))
+    await apply_counter_deltas(stock_counter_deltas(item, -1))
     return {"message": "Stock item deleted successfully"}
 
 @api_router.post("/stock/consume")
 async def consume_stock(consume: StockConsume):
     """Reduce stock quantity when consuming items"""
-    item = await db.stock_items.find_one({"id": consume.item_id}, {"_id": 0})
-    if not item:
-        raise HTTPException(status_code=404, detail="Stock item not found")
-    
-    if item['available_quantity'] < consume.quantity:
+    # The quantity guard and the decrement are one atomic update, so
+    # concurrent consumers can't both spend the same stock
+    async def consume_item(session):
+        item = await db.stock_items.find_one_and_update(
+            {"id": consume.item_id, "available_quantity": {"$gte": consume.quantity}},
+            {
+                "$inc": {"available_quantity": -consume.quantity},
+                "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
+            },
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if item is not None:
+            await record_stock_movement(item, "consume", -consume.quantity, consume.reason, session)
+        return item
+    
+    item = await run_stock_write(consume_item)
+    if item is None:
+        existing_item = await db.stock_items.find_one({"id": consume.item_id}, {"_id": 0})
+        if not existing_item:
+            raise HTTPException(status_code=404, detail="Stock item not found")
         raise HTTPException(
             status_code=400,
-            detail=f"Insufficient stock. Available: {item['available_quantity']} {item['unit']}"
+            detail=f"Insufficient stock. Available: {existing_item['available_quantity']} {existing_item['unit']}"
         )
     
-    new_quantity = item['available_quantity'] - consume.quantity
-    
-    await db.stock_items.update_one(
-        {"id": consume.item_id},
-        {"$set": {
-            "available_quantity": new_quantity,
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
-    )
+    await apply_counter_deltas(stock_quantity_deltas(item, -consume.quantity))
     
     return {
         "message": "Stock consumed successfully",
         "item_name": item['item_name'],
         "consumed_quantity": consume.quantity,
-        "remaining_quantity": new_quantity,
+        "remaining_quantity": item['available_quantity'],
         "unit": item['unit']
     }
 
+class StockBatchConflict(Exception):
+    """A line's guard no longer matched when the batch was applied"""
+
+async def apply_stock_batch_transaction(updates: List[tuple], movements: List[tuple], item_ids: List[str]) -> dict:
+    """Apply the batch in one bulk_write and insert its ledger in the same transaction"""
+    async with await client.start_session() as session:
+        async with session.start_transaction():
+            if updates:
+                result = await db.stock_items.bulk_write(
+                    [UpdateOne(query, update) for query, update in updates], ordered=True, session=session
+                )
+                if result.matched_count != len(updates):
+                    raise StockBatchConflict()
+            items = await db.stock_items.find(
+                {"id": {"$in": item_ids}}, {"_id": 0}, session=session
+            ).to_list(None)
+            after = {item['id']: item for item in items}
+            await db.stock_movements.insert_many(
+                stock_batch_movement_docs(movements, after), session=session
+            )
+    return after
+
+async def apply_stock_batch_compensating(updates: List[tuple], movements: List[tuple], item_ids: List[str]) -> dict:
+    """Without transactions, apply updates one by one and undo the applied ones on a conflict"""
+    after = {}
+    applied = []
+    try:
+        for query, update in updates:
+            item = await db.stock_items.find_one_and_update(
+                query, update, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+            )
+            if item is None:
+                raise StockBatchConflict()
+            applied.append((item['id'], update["$inc"]["available_quantity"]))
+            after[item['id']] = item
+    except BaseException:
+        for item_id, change in reversed(applied):
+            await db.stock_items.update_one({"id": item_id}, {"$inc": {"available_quantity": -change}})
+        raise
+    
+    for item in await db.stock_items.find(
+        {"id": {"$in": [i for i in item_ids if i not in after]}}, {"_id": 0}
+    ).to_list(None):
+        after[item['id']] = item
+    await db.stock_movements.insert_many(stock_batch_movement_docs(movements, after))
+    return after
+
+def stock_batch_movement_docs(movements: List[tuple], after: dict) -> List[dict]:
+    """Ledger entries for (line, signed quantity) pairs in request order, with running balances"""
+    balances = {item_id: item['available_quantity'] for item_id, item in after.items()}
+    for line, change in movements:
+        balances[line.item_id] -= change
+    docs = []
+    for line, change in movements:
+        balances[line.item_id] += change
+        docs.append(stock_movement_doc(
+            after[line.item_id], line.kind, change, balances[line.item_id], line.reason
+        ))
+    return docs
+
+@api_router.post("/stock/batch")
+async def apply_stock_batch(batch: StockBatchRequest):
+    """Consume and restock several items at once; either every line applies or none do"""
+    for line in batch.lines:
+        if line.reason is None:
+            line.reason = batch.reason
+    movements = [
+        (line, -line.quantity if line.kind == "consume" else line.quantity)
+        for line in batch.lines
+    ]
+    changes = {}
+    for line, change in movements:
+        changes[line.item_id] = changes.get(line.item_id, 0) + change
+    item_ids = list(changes)
+    
+    items = await db.stock_items.find({"id": {"$in": item_ids}}, {"_id": 0}).to_list(None)
+    before = {item['id']: item for item in items}
+    
+    # Validate every line before touching anything
+    results = []
+    for line in batch.lines:
+        item = before.get(line.item_id)
+        result = {"item_id": line.item_id, "kind": line.kind, "quantity": line.quantity, "status": "ok"}
+        if item is None:
+            result.update(status="error", error="Stock item not found")
+        elif item['available_quantity'] + changes[line.item_id] < 0:
+            result.update(
+                status="error",
+                error=f"Insufficient stock. Available: {item['available_quantity']} {item['unit']}"
+            )
+        results.append(result)
+    if any(result['status'] == "error" for result in results):
+        raise HTTPException(
+            status_code=400,
+            detail={"message": "Batch rejected; no stock was changed", "lines": results}
+        )
+    
+    # The guards repeat the check atomically, in case stock moved since the read
+    now = datetime.now(timezone.utc).isoformat()
+    updates = []
+    for item_id, change in changes.items():
+        if not change:
+            continue
+        query = {"id": item_id}
+        if change < 0:
+            query["available_quantity"] = {"$gte": -change}
+        updates.append((query, {"$inc": {"available_quantity": change}, "$set": {"updated_at": now}}))
+    
+    apply = (
+        apply_stock_batch_transaction if await transactions_supported()
+        else apply_stock_batch_compensating
+    )
+    try:
+        after = await apply(updates, movements, item_ids)
+    except PyMongoError as e:
+        # Write conflicts with concurrent updates abort the transaction
+        if not e.has_error_label("TransientTransactionError"):
+            raise
+        raise HTTPException(
+            status_code=409,
+            detail="Stock changed while the batch was applied; no stock was changed, please retry"
+        )
+    except StockBatchConflict:
+        raise HTTPException(
+            status_code=409,
+            detail="Stock changed while the batch was applied; no stock was changed, please retry"
+        )
+    
+    await apply_counter_deltas(*[
+        stock_quantity_deltas(after[item_id], change)
+        for item_id, change in changes.items() if change
+    ])
+    
+    for result in results:
+        item = after[result['item_id']]
+        result.update(item_name=item['item_name'], remaining_quantity=item['available_quantity'], unit=item['unit'])
+    return {"message": f"Applied {len(results)} stock line(s)", "lines": results}
+
+@api_router.get("/stock/{item_id}/movements", response_model=List[StockMovement])
+async def get_stock_movements(item_id: str, limit: int = Query(100, ge=1, le=1000)):
+    """Ledger entries for a stock item, newest first"""
+    movements = await db.stock_movements.find({"item_id": item_id}, {"_id": 0}).sort(
+        "created_at", -1
+    ).to_list(limit)
+    return movements
+
 @api_router.post("/stock/{item_id}/upload-receipt")
 async def upload_receipt(
     item_id: str,
-    file: UploadFile = File(...),
-    
+    file: Optional[UploadFile] = File(None),
+    sha256: Optional[str] = Form(None),
+    filename: Optional[str] = Form(None)
 ):
     item = await db.stock_items.find_one({"id": item_id}, {"_id": 0})
     if not item:
         raise HTTPException(status_code=404, detail="Stock item not found")
     
-    # Save file
-    file_extension = Path(file.filename).suffix
-    filename = f"{item_id}_receipt{file_extension}"
-    file_path = RECEIPTS_DIR / filename
-    
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Update database
-    relative_path = f"uploads/receipts/{filename}"
-    await db.stock_items.update_one(
-        {"id": item_id},
-        {"$set": {"purchase_receipt": relative_path, "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
+    stored = await store_attachment("receipt", file, sha256, filename)
+    attached = await attach_blob(db.stock_items, item_id, "purchase_receipt", stored)
+    if attached is None:
+        raise HTTPException(status_code=404, detail="Stock item not found")
     
-    return {"message": "Receipt uploaded successfully", "file_path": relative_path}
+    return {"message": "Receipt uploaded successfully", **attached}
 
 @api_router.get("/stock/{item_id}/download-receipt")
-async def download_receipt(item_id: str):
+async def download_receipt(item_id: str, request: Request):
     item = await db.stock_items.find_one({"id": item_id}, {"_id": 0})
     if not item or not item.get('purchase_receipt'):
         raise HTTPException(status_code=404, detail="Receipt not found")
     
-    file_path = ROOT_DIR / item['purchase_receipt']
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    return FileResponse(file_path, filename=f"{item['item_name']}_receipt{file_path.suffix}")
+    return await attachment_response(request, item, "purchase_receipt", f"{item['item_name']}_receipt")
 
 # Analysis endpoints
+
 @api_router.get("/analysis/tools-usage")
 async def get_tools_usage_analysis():
     """Analyze which tools are frequently used based on loan records"""
-    loans = await db.loans.find({}, {"_id": 0}).to_list(1000)
-    
-    tool_usage = {}
-    for loan in loans:
-        for equipment in loan.get('equipments', []):
-            name = equipment['equipment_name']
-            if name in tool_usage:
-                tool_usage[name] += 1
-            else:
-                tool_usage[name] = 1
-    
-    # Sort by frequency
-    sorted_usage = sorted(tool_usage.items(), key=lambda x: x[1], reverse=True)
-    return [{"equipment_name": name, "usage_count": count} for name, count in sorted_usage[:10]]
+    usage = await get_counters("loan_usage", limit=10)
+    return [{"equipment_name": row['key'], "usage_count": row['count']} for row in usage]
 
 @api_router.get("/analysis/tools-damaged")
 async def get_tools_damaged_analysis():
     """Analyze damaged tools by type and brand"""
-    tools = await db.tools.find({"condition": "Damaged"}, {"_id": 0}).to_list(1000)
-    
-    by_type = {}
-    by_brand = {}
-    
-    for tool in tools:
-        # Count by equipment name (type)
-        name = tool['equipment_name']
-        if name in by_type:
-            by_type[name] += 1
-        else:
-            by_type[name] = 1
-        
-        # Count by brand
-        brand = tool['brand_type']
-        if brand in by_brand:
-            by_brand[brand] += 1
-        else:
-            by_brand[brand] = 1
+    by_type, by_brand, totals = await asyncio.gather(
+        get_counters("damaged_type"),
+        get_counters("damaged_brand"),
+        get_totals()
+    )
     
     return {
-        "by_type": [{"type": k, "count": v} for k, v in sorted(by_type.items(), key=lambda x: x[1], reverse=True)],
-        "by_brand": [{"brand": k, "count": v} for k, v in sorted(by_brand.items(), key=lambda x: x[1], reverse=True)],
-        "total_damaged": len(tools)
+        "by_type": [{"type": row['key'], "count": row['count']} for row in by_type],
+        "by_brand": [{"brand": row['key'], "count": row['count']} for row in by_brand],
+        "total_damaged": totals.get('damaged_tools', 0)
     }
 
 @api_router.get("/analysis/tools-lost")
 async def get_tools_lost_analysis():
-    """Analyze lost tools - tools with status Unknown or never returned from loans"""
-    # For now, we'll identify potentially lost tools as those with Unknown status
-    tools = await db.tools.find({}, {"_id": 0}).to_list(1000)
-    
-    lost_candidates = []
-    for tool in tools:
-        status, _ = calculate_tool_status(
-            tool.get('calibration_date'),
-            tool.get('calibration_validity_months', 12)
-        )
-        if status == "Unknown":
-            lost_candidates.append({
-                "equipment_name": tool['equipment_name'],
-                "serial_no": tool['serial_no'],
-                "brand_type": tool['brand_type'],
-                "location": tool['equipment_location']
-            })
-    
-    return {
-        "potential_lost": lost_candidates,
-        "total": len(lost_candidates)
-    }
+    """Equipment on loans past their return date, bucketed by days overdue, borrower and project"""
+    report = await db.analysis_reports.find_one({"name": "tools_lost"}, {"_id": 0, "name": 0})
+    if report is None:
+        # First request before the scheduled refresh has run
+        report = await refresh_lost_tools_report()
+    return report
 
 @api_router.get("/analysis/stock-requested")
 async def get_stock_requested_analysis():
     """Analyze frequently requested stock items based on low quantities"""
-    stock_items = await db.stock_items.find({}, {"_id": 0}).to_list(1000)
-    
-    # Items with low stock are frequently requested
-    low_stock_items = [
-        {
-            "item_name": item['item_name'],
-            "brand_specifications": item['brand_specifications'],
-            "available_quantity": item['available_quantity'],
-            "unit": item['unit']
-        }
-        for item in stock_items
-        if item['available_quantity'] < 50
-    ]
-    
-    # Sort by lowest quantity (most requested)
-    low_stock_items.sort(key=lambda x: x['available_quantity'])
+    # Items with low stock are frequently requested; lowest quantity first
+    projection = {"_id": 0, "item_name": 1, "brand_specifications": 1, "available_quantity": 1, "unit": 1}
+    low_stock_items = await db.stock_items.find(
+        {"available_quantity": {"$lt": LOW_STOCK_THRESHOLD}},
+        projection
+    ).sort("available_quantity", 1).to_list(None)
     
     return {
         "frequently_requested": low_stock_items,
@@ -1117,59 +3860,90 @@ async def get_stock_requested_analysis():
 @api_router.get("/analysis/stock-purchased")
 async def get_stock_purchased_analysis():
     """Analyze frequently purchased items by brand and name"""
-    stock_items = await db.stock_items.find({}, {"_id": 0}).to_list(1000)
-    
-    by_brand = {}
-    by_item = {}
-    
-    for item in stock_items:
-        # Count by brand
-        brand = item['brand_specifications']
-        if brand in by_brand:
-            by_brand[brand] += 1
-        else:
-            by_brand[brand] = 1
-        
-        # Count by item name
-        name = item['item_name']
-        if name in by_item:
-            by_item[name] += 1
-        else:
-            by_item[name] = 1
+    pipeline = [
+        {"$project": {"_id": 0, "item_name": 1, "brand_specifications": 1}},
+        {"$facet": {
+            "by_brand": [
+                {"$group": {"_id": "$brand_specifications", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1, "_id": 1}},
+                {"$limit": 10}
+            ],
+            "by_item": [
+                {"$group": {"_id": "$item_name", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1, "_id": 1}},
+                {"$limit": 10}
+            ],
+            "total": [{"$count": "count"}]
+        }}
+    ]
+    result = (await db.stock_items.aggregate(pipeline).to_list(1))[0]
     
     return {
-        "by_brand": [{"brand": k, "count": v} for k, v in sorted(by_brand.items(), key=lambda x: x[1], reverse=True)[:10]],
-        "by_item": [{"item_name": k, "count": v} for k, v in sorted(by_item.items(), key=lambda x: x[1], reverse=True)[:10]],
-        "total_items": len(stock_items)
+        "by_brand": [{"brand": row['_id'], "count": row['count']} for row in result['by_brand']],
+        "by_item": [{"item_name": row['_id'], "count": row['count']} for row in result['by_item']],
+        "total_items": result['total'][0]['count'] if result['total'] else 0
     }
 
 @api_router.get("/analysis/summary")
 async def get_analysis_summary():
     """Get overall summary statistics for analysis dashboard"""
-    tools = await db.tools.find({}, {"_id": 0}).to_list(1000)
-    loans = await db.loans.find({}, {"_id": 0}).to_list(1000)
-    stock_items = await db.stock_items.find({}, {"_id": 0}).to_list(1000)
+    totals = await get_totals()
     
-    # Calculate statistics
-    damaged_tools = len([t for t in tools if t['condition'] == 'Damaged'])
-    good_tools = len([t for t in tools if t['condition'] == 'Good'])
-    total_loans = len(loans)
-    low_stock = len([s for s in stock_items if s['available_quantity'] < 50])
+    total_tools = totals.get('tools', 0)
+    damaged_tools = totals.get('damaged_tools', 0)
+    total_stock = totals.get('stock_items', 0)
+    low_stock = totals.get('low_stock_items', 0)
     
     return {
-        "total_tools": len(tools),
+        "total_tools": total_tools,
         "damaged_tools": damaged_tools,
-        "good_tools": good_tools,
-        "damage_rate": round((damaged_tools / len(tools) * 100) if len(tools) > 0 else 0, 1),
-        "total_loans": total_loans,
-        "total_stock_items": len(stock_items),
+        "good_tools": totals.get('good_tools', 0),
+        "damage_rate": round((damaged_tools / total_tools * 100) if total_tools > 0 else 0, 1),
+        "total_loans": totals.get('loans', 0),
+        "total_stock_items": total_stock,
         "low_stock_items": low_stock,
-        "low_stock_rate": round((low_stock / len(stock_items) * 100) if len(stock_items) > 0 else 0, 1)
+        "low_stock_rate": round((low_stock / total_stock * 100) if total_stock > 0 else 0, 1)
     }
 
+# Admin endpoints
+@api_router.get("/admin/index-stats")
+async def get_index_stats(current_user: dict = Depends(get_admin_user)):
+    """Report per-index usage counters and any declared index that is missing"""
+    report = {}
+    for collection_name, indexes in MONGO_INDEXES.items():
+        stats = await db[collection_name].aggregate([{"$indexStats": {}}]).to_list(None)
+        present = {stat['name'] for stat in stats}
+        declared = {index.document['name'] for index in indexes}
+        report[collection_name] = {
+            "indexes": [
+                {
+                    "name": stat['name'],
+                    "key": stat['key'],
+                    "ops": stat['accesses']['ops'],
+                    "since": stat['accesses']['since'].isoformat(),
+                    "unused": stat['accesses']['ops'] == 0 and stat['name'] != "_id_"
+                }
+                for stat in sorted(stats, key=lambda x: x['name'])
+            ],
+            "missing": sorted(declared - present)
+        }
+    return report
+
+@api_router.get("/admin/cache-stats")
+async def get_cache_stats(current_user: dict = Depends(get_admin_user)):
+    """Hit/miss counters of the in-process caches"""
+    return {"users": user_cache.stats(), "labels": label_cache.stats()}
+
+@api_router.post("/admin/analytics/rebuild")
+async def rebuild_analytics(current_user: dict = Depends(get_admin_user)):
+    """Recompute the analytics rollup from scratch"""
+    counters = await rebuild_analytics_counters()
+    return {"message": "Analytics rollup rebuilt", "counters": counters}
+
 # Include router
 app.include_router(api_router)
 
+app.add_middleware(UploadSizeLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -1187,4 +3961,10 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    password_executor.shutdown(wait=False)
+    render_pool.shutdown()
     client.close()
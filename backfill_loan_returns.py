@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Backfill Loan Returns
+Loans recorded before returns were tracked have no returned_at, so every one
+past its return date would show up in the lost-tool report. Run once when
+deploying return tracking: loans due back before the cutover (today by
+default) are marked returned on their return date, later ones are marked
+still out. Tool bookings and the lost-tool report are rebuilt afterwards.
+
+Usage: python backfill_loan_returns.py [--before YYYY-MM-DD] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import sys
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+import server
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--before", type=date.fromisoformat, default=date.today(),
+                        help="Loans due back before this date count as returned")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the loans that would change")
+    args = parser.parse_args()
+
+    print(f"Backfilling loan returns in database: {server.db.name}")
+    legacy = {"returned_at": {"$exists": False}}
+    ended = {**legacy, "return_date": {"$lt": args.before.isoformat()}}
+    ended_count = await server.db.loans.count_documents(ended)
+    open_count = await server.db.loans.count_documents(legacy) - ended_count
+    print(f"   {ended_count} loan(s) due back before {args.before} -> returned on their return date")
+    print(f"   {open_count} loan(s) due back later -> still out")
+    if args.dry_run:
+        server.client.close()
+        return
+
+    async for loan in server.db.loans.find(ended, {"_id": 0, "id": 1, "return_date": 1}):
+        await server.db.loans.update_one(
+            {"id": loan["id"], "returned_at": {"$exists": False}},
+            {"$set": {"returned_at": f"{loan['return_date']}T00:00:00+00:00", "returned_by": "backfill"}}
+        )
+    await server.db.loans.update_many(legacy, {"$set": {"returned_at": None, "returned_by": None}})
+
+    bookings = await server.rebuild_tool_bookings()
+    report = await server.refresh_lost_tools_report()
+    print(f"\n✅ Rebuilt {bookings} tool booking(s); {report['total']} tool(s) now overdue")
+    server.client.close()
+
+asyncio.run(main())
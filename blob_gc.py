@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Attachment Blob Garbage Collection
+Removes attachment blobs no tool or stock item references any more, blob
+files without a blobs record, and abandoned partial uploads. Anything
+released or written within the last hour is kept so in-flight uploads are
+never collected.
+
+With --migrate, attachments stored before the blob store
+(uploads/certificates, uploads/manuals, uploads/receipts) are first moved
+into it, so identical files are kept once.
+
+Usage: python blob_gc.py [--migrate] [--grace-seconds 3600]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+import server
+
+ATTACHMENT_FIELDS = [
+    ("tools", "calibration_certificate"),
+    ("tools", "equipment_manual"),
+    ("stock_items", "purchase_receipt"),
+]
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(server.UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+async def migrate_legacy_attachments():
+    migrated = 0
+    for collection_name, field in ATTACHMENT_FIELDS:
+        collection = server.db[collection_name]
+        query = {field: {"$nin": [None, ""], "$not": re.compile(f"^{re.escape(server.BLOB_PATH_PREFIX)}")}}
+        async for record in collection.find(query, {"_id": 0, "id": 1, field: 1}):
+            legacy_path = server.ROOT_DIR / record[field]
+            if not legacy_path.exists():
+                print(f"   ⚠️  {collection_name} {record['id']}: {record[field]} is missing, skipped")
+                continue
+
+            sha256 = file_sha256(legacy_path)
+            size = legacy_path.stat().st_size
+            await server.acquire_blob(sha256, size)
+            blob_path = server.ROOT_DIR / server.blob_relative_path(sha256)
+            blob_path.parent.mkdir(exist_ok=True)
+            os.replace(legacy_path, blob_path)
+            await collection.update_one({"id": record["id"]}, {"$set": {
+                field: server.blob_relative_path(sha256),
+                f"{field}_sha256": sha256,
+                f"{field}_size": size,
+                f"{field}_name": legacy_path.name
+            }})
+            migrated += 1
+    return migrated
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--migrate", action="store_true", help="Move pre-blob-store attachments into the store first")
+    parser.add_argument("--grace-seconds", type=float, default=server.BLOB_GC_GRACE_SECONDS)
+    args = parser.parse_args()
+
+    print(f"Collecting attachment blobs in database: {server.db.name}")
+    if args.migrate:
+        migrated = await migrate_legacy_attachments()
+        print(f"   Migrated {migrated} legacy attachment(s) into the blob store")
+
+    removed = await server.collect_blob_garbage(args.grace_seconds)
+    print(f"\n✅ Removed {removed['blobs']} unreferenced blob(s), {removed['orphan_files']} orphan file(s) "
+          f"and {removed['partial_uploads']} partial upload(s), freeing {removed['bytes'] / (1024 * 1024):.1f} MB")
+    server.client.close()
+
+asyncio.run(main())
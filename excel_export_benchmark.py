@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Excel Export Benchmark
+Compares the previous in-memory tool workbook (one Border/Alignment object per
+cell, whole file built in a BytesIO) with the streamed workbook used by
+/api/tools/export/excel, which appends each batch's sheet XML to an open ZIP
+entry. Each variant runs in its own subprocess on
+synthetic rows so peak RSS is measured independently.
+
+Usage: python excel_export_benchmark.py [--rows 50000]
+"""
+
+import argparse
+import io
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+BATCH_SIZE = 1000
+
+def synthetic_rows(count):
+    for number in range(1, count + 1):
+        yield [
+            number, f"Pressure Gauge {number}", "Wika 232.50", f"SN-{number:07d}",
+            f"INV-{number:07d}", f"AST-{number:07d}", "2026-01-15", "2026-02-01",
+            "2027-02-01", "Valid", "Good", "Bourdon tube gauge, 0-100 bar",
+            "Workshop Jakarta"
+        ]
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def legacy_workbook(rows):
+    """The export as it was before streaming: every cell styled individually, built in memory"""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+    import server
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Tool Status"
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF")
+    thin_border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+    for col_num, header in enumerate(server.TOOL_EXPORT_HEADERS, 1):
+        cell = ws.cell(row=1, column=col_num, value=header)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.border = thin_border
+        cell.alignment = Alignment(horizontal='center', vertical='center')
+    for row_num, row_data in enumerate(rows, 2):
+        for col_num, value in enumerate(row_data, 1):
+            cell = ws.cell(row=row_num, column=col_num, value=value)
+            cell.border = thin_border
+            cell.alignment = Alignment(horizontal='left', vertical='center')
+    for col_num, width in enumerate(server.TOOL_EXPORT_COLUMN_WIDTHS, 1):
+        ws.column_dimensions[ws.cell(row=1, column=col_num).column_letter].width = width
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+class CountingWriter:
+    """Discarding sink that records size and time to the first byte"""
+    def __init__(self, started):
+        self.started = started
+        self.size = 0
+        self.first_byte = None
+
+    def write(self, data):
+        if self.first_byte is None:
+            self.first_byte = time.perf_counter() - self.started
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+def run_variant(variant, rows):
+    import server
+
+    started = time.perf_counter()
+    if variant == "legacy":
+        # The old endpoint materialised every row before building the workbook
+        payload = legacy_workbook(list(synthetic_rows(rows)))
+        size, first_byte = len(payload), time.perf_counter() - started
+    else:
+        sink = CountingWriter(started)
+        server.write_tools_workbook(batched(synthetic_rows(rows), BATCH_SIZE), sink)
+        size, first_byte = sink.size, sink.first_byte
+    elapsed = time.perf_counter() - started
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{elapsed:.3f} {first_byte:.3f} {peak_kb} {size}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--variant", choices=["legacy", "streaming"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.rows)
+        return 0
+
+    print("=" * 60)
+    print(f"EXCEL EXPORT BENCHMARK ({args.rows} rows)")
+    print("=" * 60)
+
+    results = {}
+    for variant in ("legacy", "streaming"):
+        print(f"\n⏱  Running {variant}...")
+        output = subprocess.run(
+            [sys.executable, __file__, "--rows", str(args.rows), "--variant", variant],
+            capture_output=True, text=True
+        )
+        if output.returncode != 0:
+            print(output.stderr)
+            return 1
+        elapsed, first_byte, peak_kb, size = output.stdout.split()[-4:]
+        results[variant] = (float(elapsed), float(first_byte), int(peak_kb), int(size))
+        print(f"   wall={float(elapsed):.2f}s  first byte={float(first_byte):.2f}s  "
+              f"peak RSS={int(peak_kb) / 1024:.0f}MB  size={int(size) / 1024:.0f}KB")
+
+    legacy, streaming = results["legacy"], results["streaming"]
+    print(f"\n📈 Streaming: {legacy[0] / streaming[0]:.1f}x faster, "
+          f"{legacy[2] / streaming[2]:.1f}x lower peak RSS")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
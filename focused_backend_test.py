@@ -124,7 +124,8 @@ class FocusedAPITester:
         
         if response and response.status_code == 200:
             try:
-                tools = response.json()
+                page = response.json()
+                tools = page.get('items') if isinstance(page, dict) else None
                 if isinstance(tools, list):
                     tool_count = len(tools)
                     self.log_test(
@@ -156,7 +157,7 @@ class FocusedAPITester:
                     
                     return True
                 else:
-                    self.log_test("GET /api/tools", False, "Response is not a list")
+                    self.log_test("GET /api/tools", False, "Response has no items list")
             except Exception as e:
                 self.log_test("GET /api/tools", False, f"JSON parsing error: {str(e)}")
         else:
@@ -220,9 +221,9 @@ class FocusedAPITester:
                         )
                     
                     # Test tool retrieval to confirm it was saved
-                    get_response = self.make_request('GET', 'tools')
+                    get_response = self.make_request('GET', f"tools?search={created_tool['serial_no']}")
                     if get_response and get_response.status_code == 200:
-                        tools = get_response.json()
+                        tools = get_response.json()['items']
                         tool_found = any(tool['id'] == tool_id for tool in tools)
                         self.log_test(
                             "Tool persistence verification", 
@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
+import { uploadAttachment } from '../lib/api';
 import { Dialog, DialogContent, DialogHeader, DialogTitle } from './ui/dialog';
 import { Button } from './ui/button';
 import { Input } from './ui/input';
@@ -49,15 +50,9 @@ export default function StockDialog({ open, onOpenChange, item, isEditMode, onSu
     if (!receiptFile) return;
 
     const token = localStorage.getItem('token');
-    const fileFormData = new FormData();
-    fileFormData.append('file', receiptFile);
-    
     try {
-      await axios.post(`${API}/stock/${itemId}/upload-receipt`, fileFormData, {
-        headers: {
-          Authorization: `Bearer ${token}`,
-          'Content-Type': 'multipart/form-data'
-        }
+      await uploadAttachment(`${API}/stock/${itemId}/upload-receipt`, receiptFile, {
+        Authorization: `Bearer ${token}`
       });
       toast.success('Receipt uploaded successfully');
     } catch (error) {
@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
+import { uploadAttachment } from '../lib/api';
 import { Dialog, DialogContent, DialogHeader, DialogTitle } from './ui/dialog';
 import { Button } from './ui/button';
 import { Input } from './ui/input';
@@ -29,6 +30,8 @@ export default function ToolDialog({ open, onOpenChange, tool, onSuccess }) {
   const [manualFile, setManualFile] = useState(null);
   const [loading, setLoading] = useState(false);
   const [uploadingFiles, setUploadingFiles] = useState(false);
+  const [calibrations, setCalibrations] = useState([]);
+  const [calibrationsCursor, setCalibrationsCursor] = useState(null);
 
   useEffect(() => {
     if (tool) {
@@ -62,21 +65,34 @@ export default function ToolDialog({ open, onOpenChange, tool, onSuccess }) {
     }
     setCertificateFile(null);
     setManualFile(null);
+    setCalibrations([]);
+    setCalibrationsCursor(null);
+    if (tool && open) {
+      fetchCalibrations(tool.id);
+    }
   }, [tool, open]);
 
+  const fetchCalibrations = async (toolId, cursor = null) => {
+    try {
+      const token = localStorage.getItem('token');
+      const response = await axios.get(`${API}/tools/${toolId}/calibrations`, {
+        headers: { Authorization: `Bearer ${token}` },
+        params: { limit: 5, ...(cursor ? { cursor } : {}) }
+      });
+      setCalibrations((previous) => (cursor ? [...previous, ...response.data.items] : response.data.items));
+      setCalibrationsCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error('Failed to fetch calibration history:', error);
+    }
+  };
+
   const handleFileUpload = async (toolId) => {
     const token = localStorage.getItem('token');
     
     if (certificateFile) {
-      const certFormData = new FormData();
-      certFormData.append('file', certificateFile);
-      
       try {
-        await axios.post(`${API}/tools/${toolId}/upload-certificate`, certFormData, {
-          headers: {
-            Authorization: `Bearer ${token}`,
-            'Content-Type': 'multipart/form-data'
-          }
+        await uploadAttachment(`${API}/tools/${toolId}/upload-certificate`, certificateFile, {
+          Authorization: `Bearer ${token}`
         });
         toast.success('Certificate uploaded successfully');
       } catch (error) {
@@ -85,15 +101,9 @@ export default function ToolDialog({ open, onOpenChange, tool, onSuccess }) {
     }
     
     if (manualFile) {
-      const manualFormData = new FormData();
-      manualFormData.append('file', manualFile);
-      
       try {
-        await axios.post(`${API}/tools/${toolId}/upload-manual`, manualFormData, {
-          headers: {
-            Authorization: `Bearer ${token}`,
-            'Content-Type': 'multipart/form-data'
-          }
+        await uploadAttachment(`${API}/tools/${toolId}/upload-manual`, manualFile, {
+          Authorization: `Bearer ${token}`
         });
         toast.success('Manual uploaded successfully');
       } catch (error) {
@@ -315,6 +325,37 @@ export default function ToolDialog({ open, onOpenChange, tool, onSuccess }) {
                 </div>
               </div>
             </div>
+            
+            {/* Calibration History */}
+            {tool && (
+              <div className="space-y-2 col-span-2 pt-4 border-t border-slate-200">
+                <h3 className="font-semibold text-slate-700">Calibration History</h3>
+                {calibrations.length === 0 ? (
+                  <p className="text-sm text-slate-500">No calibration records</p>
+                ) : (
+                  <div className="divide-y divide-slate-200 border border-slate-200 rounded-lg">
+                    {calibrations.map((calibration) => (
+                      <div key={calibration.id} className="flex items-center justify-between px-3 py-2 text-sm">
+                        <span className="font-medium text-slate-800">{calibration.calibration_date}</span>
+                        <span className="text-slate-600">{calibration.calibration_agency}</span>
+                        <span className="text-slate-600">{calibration.device_condition}</span>
+                      </div>
+                    ))}
+                  </div>
+                )}
+                {calibrationsCursor && (
+                  <Button
+                    type="button"
+                    variant="outline"
+                    size="sm"
+                    onClick={() => fetchCalibrations(tool.id, calibrationsCursor)}
+                    className="border-slate-300"
+                  >
+                    Load older records
+                  </Button>
+                )}
+              </div>
+            )}
           </div>
           <div className="flex justify-end space-x-3 pt-4">
             <Button
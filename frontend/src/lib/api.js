@@ -0,0 +1,43 @@
+import axios from 'axios';
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const API = `${BACKEND_URL}/api`;
+
+// Walk the cursor-paginated /tools listing and collect every page
+export async function fetchAllTools(headers, params = {}) {
+  const tools = [];
+  let cursor = null;
+  do {
+    const response = await axios.get(`${API}/tools`, {
+      headers,
+      params: { ...params, limit: 500, ...(cursor ? { cursor } : {}) }
+    });
+    tools.push(...response.data.items);
+    cursor = response.data.next_cursor;
+  } while (cursor);
+  return tools;
+}
+
+async function sha256Hex(file) {
+  const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest)).map((b) => b.toString(16).padStart(2, '0')).join('');
+}
+
+// Upload an attachment, sending only its hash first so files the server
+// already stores (e.g. the same vendor manual for many tools) aren't re-sent
+export async function uploadAttachment(url, file, headers) {
+  if (window.crypto?.subtle) {
+    const hashForm = new FormData();
+    hashForm.append('sha256', await sha256Hex(file));
+    hashForm.append('filename', file.name);
+    try {
+      return await axios.post(url, hashForm, { headers });
+    } catch (error) {
+      if (error.response?.status !== 404) throw error;
+    }
+  }
+
+  const fileForm = new FormData();
+  fileForm.append('file', file);
+  return axios.post(url, fileForm, { headers });
+}
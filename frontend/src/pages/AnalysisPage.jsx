@@ -219,35 +219,53 @@ export default function AnalysisPage({ user }) {
       <Card className="shadow-lg">
         <CardHeader className="bg-gradient-to-r from-purple-50 to-slate-50 border-b">
           <CardTitle className="text-lg font-bold text-slate-800">
-            Potentially Lost/Missing Tools ({toolsLost?.total || 0})
+            Overdue Loaned Tools ({toolsLost?.total || 0})
           </CardTitle>
         </CardHeader>
         <CardContent className="p-6">
           {toolsLost?.total === 0 ? (
             <p className="text-center text-slate-500 py-8">No missing tools detected</p>
           ) : (
-            <div className="overflow-x-auto">
-              <table className="w-full">
-                <thead className="bg-slate-100 border-b">
-                  <tr>
-                    <th className="px-4 py-2 text-left text-xs font-semibold text-slate-700">Equipment Name</th>
-                    <th className="px-4 py-2 text-left text-xs font-semibold text-slate-700">Serial No.</th>
-                    <th className="px-4 py-2 text-left text-xs font-semibold text-slate-700">Brand/Type</th>
-                    <th className="px-4 py-2 text-left text-xs font-semibold text-slate-700">Last Location</th>
-                  </tr>
-                </thead>
-                <tbody className="divide-y divide-slate-200">
-                  {toolsLost?.potential_lost.map((tool, index) => (
-                    <tr key={index} className="hover:bg-slate-50">
-                      <td className="px-4 py-3 text-sm font-medium text-slate-900">{tool.equipment_name}</td>
-                      <td className="px-4 py-3 text-sm text-slate-700">{tool.serial_no}</td>
-                      <td className="px-4 py-3 text-sm text-slate-700">{tool.brand_type}</td>
-                      <td className="px-4 py-3 text-sm text-slate-700">{tool.location}</td>
+            <>
+              <div className="flex flex-wrap gap-2 mb-4">
+                {toolsLost?.by_days_overdue.filter((row) => row.count > 0).map((row) => (
+                  <span key={row.bucket} className="px-3 py-1 text-xs font-medium rounded-full bg-purple-50 text-purple-700 border border-purple-200">
+                    {row.bucket}: {row.count}
+                  </span>
+                ))}
+              </div>
+              <div className="overflow-x-auto">
+                <table className="w-full">
+                  <thead className="bg-slate-100 border-b">
+                    <tr>
+                      <th className="px-4 py-2 text-left text-xs font-semibold text-slate-700">Equipment Name</th>
+                      <th className="px-4 py-2 text-left text-xs font-semibold text-slate-700">Serial No.</th>
+                      <th className="px-4 py-2 text-left text-xs font-semibold text-slate-700">Borrower</th>
+                      <th className="px-4 py-2 text-left text-xs font-semibold text-slate-700">Project</th>
+                      <th className="px-4 py-2 text-left text-xs font-semibold text-slate-700">Due</th>
+                      <th className="px-4 py-2 text-left text-xs font-semibold text-slate-700">Days Overdue</th>
                     </tr>
-                  ))}
-                </tbody>
-              </table>
-            </div>
+                  </thead>
+                  <tbody className="divide-y divide-slate-200">
+                    {toolsLost?.potential_lost.map((tool, index) => (
+                      <tr key={index} className="hover:bg-slate-50">
+                        <td className="px-4 py-3 text-sm font-medium text-slate-900">{tool.equipment_name}</td>
+                        <td className="px-4 py-3 text-sm text-slate-700">{tool.serial_no}</td>
+                        <td className="px-4 py-3 text-sm text-slate-700">{tool.borrower_name}</td>
+                        <td className="px-4 py-3 text-sm text-slate-700">{tool.project_name}</td>
+                        <td className="px-4 py-3 text-sm text-slate-700">{tool.return_date}</td>
+                        <td className="px-4 py-3 text-sm font-semibold text-red-600">{tool.days_overdue}</td>
+                      </tr>
+                    ))}
+                  </tbody>
+                </table>
+              </div>
+              {toolsLost?.truncated && (
+                <p className="text-xs text-slate-500 mt-3">
+                  Showing the {toolsLost.potential_lost.length} most overdue of {toolsLost.total} tools
+                </p>
+              )}
+            </>
           )}
         </CardContent>
       </Card>
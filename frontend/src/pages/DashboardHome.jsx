@@ -29,28 +29,20 @@ export default function DashboardHome({ user, onNavigate }) {
       const token = localStorage.getItem('token');
       const headers = { Authorization: `Bearer ${token}` };
 
-      // Fetch tools
-      const toolsResponse = await axios.get(`${API}/tools`, { headers });
-      const tools = toolsResponse.data;
-
-      // Calculate statistics
-      const expired = tools.filter(t => t.status === 'Expired').length;
-      const expiring = tools.filter(t => t.status === 'Expiring Soon').length;
-      const valid = tools.filter(t => t.status === 'Valid').length;
-      const good = tools.filter(t => t.condition === 'Good').length;
-      const damaged = tools.filter(t => t.condition === 'Damaged').length;
+      // Tool counts by stored status and condition
+      const { data: toolCounts } = await axios.get(`${API}/tools/counts`, { headers });
 
       // Fetch loans and calibrations
       const loansResponse = await axios.get(`${API}/loans`, { headers });
       const calibrationsResponse = await axios.get(`${API}/calibrations`, { headers });
 
       setStats({
-        totalTools: tools.length,
-        expiredTools: expired,
-        expiringSoon: expiring,
-        validTools: valid,
-        goodCondition: good,
-        damagedCondition: damaged,
+        totalTools: toolCounts.total,
+        expiredTools: toolCounts.by_status['Expired'] || 0,
+        expiringSoon: toolCounts.by_status['Expiring Soon'] || 0,
+        validTools: toolCounts.by_status['Valid'] || 0,
+        goodCondition: toolCounts.by_condition['Good'] || 0,
+        damagedCondition: toolCounts.by_condition['Damaged'] || 0,
         totalLoans: loansResponse.data.length,
         totalCalibrations: calibrationsResponse.data.length
       });
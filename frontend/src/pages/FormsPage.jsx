@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
+import { fetchAllTools } from '../lib/api';
 import { Card, CardContent, CardHeader, CardTitle } from '../components/ui/card';
 import { Button } from '../components/ui/button';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '../components/ui/select';
@@ -35,10 +36,8 @@ export default function FormsPage({ user }) {
   const fetchTools = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await axios.get(`${API}/tools`, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
-      setTools(response.data);
+      const allTools = await fetchAllTools({ Authorization: `Bearer ${token}` });
+      setTools(allTools);
     } catch (error) {
       console.error('Failed to fetch tools:', error);
     }
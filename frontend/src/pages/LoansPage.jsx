@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
+import { fetchAllTools } from '../lib/api';
 import { Card, CardContent, CardHeader, CardTitle } from '../components/ui/card';
 import { Badge } from '../components/ui/badge';
 import { Input } from '../components/ui/input';
@@ -64,12 +65,7 @@ export default function LoansPage({ user }) {
   const fetchTools = async () => {
     try {
       const token = localStorage.getItem('token');
-      console.log('[LoansPage] Fetching tools for loan form...');
-      const response = await axios.get(`${API}/tools`, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
-      console.log('[LoansPage] Fetched', response.data.length, 'tools');
-      setTools(response.data || []);
+      setTools(await fetchAllTools({ Authorization: `Bearer ${token}` }));
     } catch (error) {
       console.error('[LoansPage] Failed to fetch tools:', error.response?.data || error.message);
     }
@@ -98,6 +94,19 @@ export default function LoansPage({ user }) {
     }
   };
 
+  const handleReturn = async (loanId) => {
+    try {
+      const token = localStorage.getItem('token');
+      await axios.post(`${API}/loans/${loanId}/return`, {}, {
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      toast.success('Loan marked as returned');
+      fetchLoans();
+    } catch (error) {
+      toast.error(error.response?.data?.detail || 'Failed to mark loan as returned');
+    }
+  };
+
   const handleDownloadDocument = async (loanId, borrowerName, loanDate) => {
     try {
       const token = localStorage.getItem('token');
@@ -199,6 +208,18 @@ export default function LoansPage({ user }) {
                         </Button>
                       </>
                     )}
+                    {loan.returned_at ? (
+                      <Badge className="bg-green-100 text-green-800 border-green-200">Returned</Badge>
+                    ) : (
+                      <Button
+                        onClick={() => handleReturn(loan.id)}
+                        size="sm"
+                        variant="outline"
+                        className="text-slate-600 hover:text-slate-800 hover:bg-slate-50 border-slate-200"
+                      >
+                        Mark Returned
+                      </Button>
+                    )}
                     <Button
                       onClick={() => handleDownloadDocument(loan.id, loan.borrower_name, loan.loan_date)}
                       size="sm"
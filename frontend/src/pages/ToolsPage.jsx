@@ -1,5 +1,6 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
+import { fetchAllTools } from '../lib/api';
 import { Button } from '../components/ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from '../components/ui/card';
 import { Badge } from '../components/ui/badge';
@@ -16,60 +17,95 @@ const API = `${BACKEND_URL}/api`;
 
 export default function ToolsPage({ user }) {
   const [tools, setTools] = useState([]);
-  const [filteredTools, setFilteredTools] = useState([]);
+  const [allTools, setAllTools] = useState([]);
+  const [equipmentNames, setEquipmentNames] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [searchTerm, setSearchTerm] = useState('');
   const [toolNameFilter, setToolNameFilter] = useState('All');
   const [conditionFilter, setConditionFilter] = useState('All');
   const [statusFilter, setStatusFilter] = useState('All');
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [toolDialogOpen, setToolDialogOpen] = useState(false);
   const [loanDialogOpen, setLoanDialogOpen] = useState(false);
   const [calibrationDialogOpen, setCalibrationDialogOpen] = useState(false);
   const [selectedTool, setSelectedTool] = useState(null);
+  const [importing, setImporting] = useState(false);
+  const importInputRef = useRef(null);
+  // Id of the latest /tools request; responses to older ones are dropped
+  const toolsRequestRef = useRef(0);
 
   const isAdmin = user.role === 'admin';
 
+  // Filtering happens server-side; refetch the first page whenever a filter changes
   useEffect(() => {
-    fetchTools();
-  }, []);
+    const timer = setTimeout(() => fetchTools(), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm, toolNameFilter, conditionFilter, statusFilter]);
 
-  // Get unique tool names for filter dropdown
-  const uniqueToolNames = ['All', ...new Set(tools.map(tool => tool.equipment_name))];
+  useEffect(() => {
+    fetchEquipmentNames();
+  }, []);
 
+  // The loan and calibration dialogs pick from the whole register
   useEffect(() => {
-    let filtered = tools.filter(tool => {
-      // Text search filter
-      const matchesSearch = 
-        tool.equipment_name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        tool.serial_no.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        tool.inventory_code.toLowerCase().includes(searchTerm.toLowerCase());
-      
-      // Tool name filter
-      const matchesToolName = toolNameFilter === 'All' || tool.equipment_name === toolNameFilter;
-      
-      // Condition filter
-      const matchesCondition = conditionFilter === 'All' || tool.condition === conditionFilter;
-      
-      // Status filter
-      const matchesStatus = statusFilter === 'All' || tool.status === statusFilter;
-      
-      return matchesSearch && matchesToolName && matchesCondition && matchesStatus;
-    });
-    setFilteredTools(filtered);
-  }, [searchTerm, toolNameFilter, conditionFilter, statusFilter, tools]);
+    if (!loanDialogOpen && !calibrationDialogOpen) return;
+    const token = localStorage.getItem('token');
+    fetchAllTools({ Authorization: `Bearer ${token}` })
+      .then(setAllTools)
+      .catch(() => toast.error('Failed to fetch tools'));
+  }, [loanDialogOpen, calibrationDialogOpen]);
+
+  // Filter options cover the whole register, not just the loaded pages
+  const uniqueToolNames = ['All', ...equipmentNames];
 
-  const fetchTools = async () => {
+  const fetchEquipmentNames = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await axios.get(`${API}/tools`, {
+      const response = await axios.get(`${API}/tools/equipment-names`, {
         headers: { Authorization: `Bearer ${token}` }
       });
-      setTools(response.data);
-      setFilteredTools(response.data);
+      setEquipmentNames(response.data);
+    } catch (error) {
+      toast.error('Failed to fetch equipment names');
+    }
+  };
+
+  // After a tool is added, edited, imported or deleted
+  const refreshTools = () => {
+    fetchTools();
+    fetchEquipmentNames();
+  };
+
+  const buildToolParams = () => {
+    const params = {};
+    if (searchTerm) params.search = searchTerm;
+    if (toolNameFilter !== 'All') params.equipment_name = toolNameFilter;
+    if (conditionFilter !== 'All') params.condition = conditionFilter;
+    if (statusFilter !== 'All') params.status = statusFilter;
+    return params;
+  };
+
+  const fetchTools = async (cursor = null) => {
+    const requestId = ++toolsRequestRef.current;
+    try {
+      const token = localStorage.getItem('token');
+      const params = { ...buildToolParams(), ...(cursor ? { cursor } : {}) };
+      if (cursor) setLoadingMore(true);
+      const response = await axios.get(`${API}/tools`, {
+        headers: { Authorization: `Bearer ${token}` },
+        params
+      });
+      if (requestId !== toolsRequestRef.current) return;
+      setTools(cursor ? [...tools, ...response.data.items] : response.data.items);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
-      toast.error('Failed to fetch tools');
+      if (requestId === toolsRequestRef.current) toast.error('Failed to fetch tools');
     } finally {
-      setLoading(false);
+      if (requestId === toolsRequestRef.current) {
+        setLoading(false);
+        setLoadingMore(false);
+      }
     }
   };
 
@@ -94,6 +130,36 @@ export default function ToolsPage({ user }) {
     }
   };
 
+  const handleImportTools = async (e) => {
+    const file = e.target.files[0];
+    e.target.value = '';
+    if (!file) {
+      return;
+    }
+
+    setImporting(true);
+    try {
+      const token = localStorage.getItem('token');
+      const formData = new FormData();
+      formData.append('file', file);
+      const response = await axios.post(`${API}/tools/import`, formData, {
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      const { imported, failed, errors } = response.data;
+      if (failed) {
+        const preview = errors.slice(0, 3).map((error) => `Row ${error.row}: ${error.errors.join(', ')}`).join('\n');
+        toast.warning(`Imported ${imported} tool(s); ${failed} row(s) skipped`, { description: preview });
+      } else {
+        toast.success(`Imported ${imported} tool(s)`);
+      }
+      refreshTools();
+    } catch (error) {
+      toast.error(error.response?.data?.detail || 'Failed to import tools');
+    } finally {
+      setImporting(false);
+    }
+  };
+
   const handleAddTool = () => {
     setSelectedTool(null);
     setToolDialogOpen(true);
@@ -113,7 +179,7 @@ export default function ToolsPage({ user }) {
         headers: { Authorization: `Bearer ${token}` }
       });
       toast.success('Tool deleted successfully');
-      fetchTools();
+      refreshTools();
     } catch (error) {
       toast.error('Failed to delete tool');
     }
@@ -249,6 +315,29 @@ export default function ToolsPage({ user }) {
               </Button>
             </>
           )}
+          {isAdmin && (
+            <>
+              <input
+                ref={importInputRef}
+                type="file"
+                accept=".xlsx,.csv"
+                onChange={handleImportTools}
+                className="hidden"
+              />
+              <Button
+                onClick={() => importInputRef.current?.click()}
+                disabled={importing}
+                data-testid="import-tools-btn"
+                variant="outline"
+                className="border-slate-300 text-slate-700 hover:bg-slate-50 font-semibold shadow-sm"
+              >
+                <svg className="w-4 h-4 mr-2" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                  <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M4 16v1a3 3 0 003 3h10a3 3 0 003-3v-1m-4-8l-4-4m0 0L8 8m4-4v12" />
+                </svg>
+                {importing ? 'Importing...' : 'Import Tools'}
+              </Button>
+            </>
+          )}
           <Button 
             onClick={handleExportExcel}
             data-testid="export-excel-btn"
@@ -366,7 +455,7 @@ export default function ToolsPage({ user }) {
                 
                 {/* Results Count */}
                 <div className="ml-auto text-sm text-slate-600">
-                  Showing <span className="font-semibold text-slate-800">{filteredTools.length}</span> of <span className="font-semibold text-slate-800">{tools.length}</span> tools
+                  Showing <span className="font-semibold text-slate-800">{tools.length}</span>{nextCursor ? '+' : ''} tools
                 </div>
               </div>
             </div>
@@ -381,7 +470,7 @@ export default function ToolsPage({ user }) {
           <CardContent className="p-0">
             {loading ? (
               <div className="p-8 text-center text-slate-500">Loading tools...</div>
-            ) : filteredTools.length === 0 ? (
+            ) : tools.length === 0 ? (
               <div className="p-8 text-center text-slate-500" data-testid="no-tools-message">No tools found</div>
             ) : (
               <div className="overflow-x-auto">
@@ -406,7 +495,7 @@ export default function ToolsPage({ user }) {
                     </tr>
                   </thead>
                   <tbody className="divide-y divide-slate-200 bg-white">
-                    {filteredTools.map((tool, index) => (
+                    {tools.map((tool, index) => (
                       <tr key={tool.id} className="hover:bg-slate-50 transition-colors" data-testid={`tool-row-${index}`}>
                         <td className="px-4 py-3 text-sm text-slate-700">{index + 1}</td>
                         <td className="px-4 py-3 text-sm font-medium text-slate-900">{tool.equipment_name}</td>
@@ -433,6 +522,16 @@ export default function ToolsPage({ user }) {
                               </svg>
                               QR Code
                             </Button>
+                            {tool.certificate_preview && (
+                              <img
+                                src={`${API}/tools/${tool.id}/certificate-preview?size=160`}
+                                alt={`${tool.equipment_name} certificate`}
+                                loading="lazy"
+                                onClick={() => window.open(`${API}/tools/${tool.id}/certificate-preview?size=1024`, '_blank')}
+                                data-testid={`cert-preview-${index}`}
+                                className="w-16 h-12 object-cover rounded border border-slate-200 cursor-pointer"
+                              />
+                            )}
                             {tool.calibration_certificate && (
                               <Button
                                 onClick={() => handleDownloadCertificate(tool.id, tool.equipment_name)}
@@ -491,6 +590,19 @@ export default function ToolsPage({ user }) {
                     ))}
                   </tbody>
                 </table>
+                {nextCursor && (
+                  <div className="p-4 flex justify-center border-t border-slate-200">
+                    <Button
+                      onClick={() => fetchTools(nextCursor)}
+                      disabled={loadingMore}
+                      variant="outline"
+                      data-testid="load-more-tools-btn"
+                      className="border-slate-300 text-slate-700 hover:bg-slate-50"
+                    >
+                      {loadingMore ? 'Loading...' : 'Load more'}
+                    </Button>
+                  </div>
+                )}
               </div>
             )}
           </CardContent>
@@ -501,17 +613,17 @@ export default function ToolsPage({ user }) {
         open={toolDialogOpen}
         onOpenChange={setToolDialogOpen}
         tool={selectedTool}
-        onSuccess={fetchTools}
+        onSuccess={refreshTools}
       />
       <LoanDialog
         open={loanDialogOpen}
         onOpenChange={setLoanDialogOpen}
-        tools={tools}
+        tools={allTools}
       />
       <CalibrationDialog
         open={calibrationDialogOpen}
         onOpenChange={setCalibrationDialogOpen}
-        tools={tools}
+        tools={allTools}
         onSuccess={fetchTools}
       />
     </div>
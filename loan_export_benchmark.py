@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Loan Export Benchmark
+Measures loan form exports per second for the previous renderer (docxtpl
+render, save, re-parse with python-docx, append rows) and the compiled
+template used by /api/loans/{id}/export. Renders run in-process, without
+the render pool, so the numbers are per worker.
+
+The previous renderer only handled single-item loans, so the head-to-head
+comparison uses one equipment; the compiled template is also timed with a
+full five-item loan. The backend no longer depends on docxtpl; install it
+(pip install docxtpl) to include the previous renderer.
+
+Usage: python loan_export_benchmark.py [--seconds 5]
+"""
+
+import argparse
+import importlib.util
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+def sample_loan(equipment_count):
+    return {
+        "borrower_name": "Budi Santoso",
+        "loan_date": "2026-03-02",
+        "return_date": "2026-03-16",
+        "project_name": "Offshore Platform Survey",
+        "wbs_project_no": "WBS-2026-0142",
+        "project_location": "Balikpapan",
+        "equipments": [
+            {"equipment_name": f"Ultrasonic Thickness Gauge {n}", "serial_no": f"UTG-{n:05d}", "condition": "Good"}
+            for n in range(1, equipment_count + 1)
+        ],
+    }
+
+def legacy_render(loan, template_path):
+    """The export as it was before the compiled template"""
+    from docxtpl import DocxTemplate
+    from docx import Document
+
+    doc = DocxTemplate(template_path)
+    items = [
+        {"no": idx, "equipment_name": equipment["equipment_name"], "serial_no": equipment["serial_no"],
+         "quantity": "1", "condition": equipment["condition"]}
+        for idx, equipment in enumerate(loan["equipments"], 1)
+    ]
+    context = {
+        "WBS": loan.get("wbs_project_no", "N/A"),
+        "project_name": loan["project_name"],
+        "project_location": loan["project_location"],
+        "loan_date": loan["loan_date"],
+        "return_date": loan["return_date"],
+        "borrower_name": loan["borrower_name"],
+        "items": items,
+    }
+    doc.render(context)
+    temp_buffer = io.BytesIO()
+    doc.save(temp_buffer)
+    temp_buffer.seek(0)
+    rendered_doc = Document(temp_buffer)
+    final_buffer = io.BytesIO()
+    rendered_doc.save(final_buffer)
+    return final_buffer.getvalue()
+
+def measure(name, render, seconds):
+    render()  # Warm-up: template parse, imports
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        render()
+        count += 1
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed
+    print(f"   {name}: {count} exports in {elapsed:.1f}s  {rate:.1f}/s  {elapsed / count * 1000:.1f}ms each")
+    return rate
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0, help="Time spent on each variant")
+    args = parser.parse_args()
+
+    import server
+
+    template_path = str(server.LOAN_TEMPLATE_PATH)
+    single, full = sample_loan(1), sample_loan(5)
+
+    print("=" * 60)
+    print("LOAN EXPORT BENCHMARK")
+    print("=" * 60)
+    print()
+    if importlib.util.find_spec("docxtpl") is None:
+        print("   legacy: skipped, docxtpl is not installed")
+        legacy = None
+    else:
+        legacy = measure("legacy, 1 item", lambda: legacy_render(single, template_path), args.seconds)
+    compiled = measure("compiled, 1 item", lambda: server.render_loan_document(single), args.seconds)
+    measure("compiled, 5 items", lambda: server.render_loan_document(full), args.seconds)
+
+    if legacy:
+        print(f"\n📈 Compiled template: {compiled / legacy:.1f}x the exports per second")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
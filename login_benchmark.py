@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Login Burst Benchmark
+Measures latency of a probe endpoint on its own and while a burst of
+concurrent logins is in flight. With bcrypt off the event loop the probe's
+p99 should stay close to its baseline during the burst.
+
+Usage: python login_benchmark.py [--base-url URL] [--logins 50]
+"""
+
+import argparse
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def probe_latencies(url, stop_event, min_samples=0):
+    """Hit the probe endpoint back to back until stopped, returning latencies in ms"""
+    session = requests.Session()
+    latencies = []
+    while not stop_event.is_set() or len(latencies) < min_samples:
+        start = time.perf_counter()
+        session.get(url, timeout=30)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def login(api_url, username, password):
+    start = time.perf_counter()
+    response = requests.post(
+        f"{api_url}/auth/login",
+        json={"username": username, "password": password},
+        timeout=60
+    )
+    return response.status_code, (time.perf_counter() - start) * 1000
+
+def report(name, latencies):
+    print(f"   {name}: n={len(latencies)}  "
+          f"p50={statistics.median(latencies):.1f}ms  "
+          f"p99={percentile(latencies, 99):.1f}ms  "
+          f"max={max(latencies):.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--probe", default="/health", help="Endpoint whose latency is tracked")
+    parser.add_argument("--logins", type=int, default=50, help="Concurrent logins in the burst")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin123")
+    parser.add_argument("--baseline-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    api_url = f"{args.base_url}/api"
+    probe_url = f"{args.base_url}{args.probe}"
+
+    print("=" * 60)
+    print("LOGIN BURST BENCHMARK")
+    print("=" * 60)
+
+    # Baseline: probe alone
+    print(f"\n[1/2] Baseline probe latency ({args.baseline_seconds:.0f}s)...")
+    stop = threading.Event()
+    timer = threading.Timer(args.baseline_seconds, stop.set)
+    timer.start()
+    baseline = probe_latencies(probe_url, stop)
+    report("probe", baseline)
+
+    # Burst: probe while N logins run concurrently
+    print(f"\n[2/2] Probe latency during {args.logins} concurrent logins...")
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=args.logins + 1) as pool:
+        probe_future = pool.submit(probe_latencies, probe_url, stop, 10)
+        burst_start = time.perf_counter()
+        login_futures = [
+            pool.submit(login, api_url, args.username, args.password)
+            for _ in range(args.logins)
+        ]
+        results = [future.result() for future in login_futures]
+        burst_seconds = time.perf_counter() - burst_start
+        stop.set()
+        during = probe_future.result()
+
+    failures = [code for code, _ in results if code != 200]
+    report("probe", during)
+    report("login", [elapsed for _, elapsed in results])
+    print(f"   login throughput: {len(results) / burst_seconds:.1f}/s  failures: {len(failures)}")
+
+    ratio = percentile(during, 99) / max(percentile(baseline, 99), 0.001)
+    print(f"\n📈 Probe p99 during burst is {ratio:.1f}x baseline")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
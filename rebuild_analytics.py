@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+Rebuild Analytics Rollup
+Recomputes the analytics_counters collection from tools, loans and stock items.
+Run after restoring a backup or editing collections outside the API.
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+import server
+
+async def main():
+    print(f"Rebuilding analytics rollup in database: {server.db.name}")
+    counters = await server.rebuild_analytics_counters()
+    print(f"\n✅ Rebuilt {counters} analytics counter(s)")
+    server.client.close()
+
+asyncio.run(main())
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+Rebuild Tool Bookings
+Recomputes the tool_bookings availability index from loans.
+Run after restoring a backup or editing loans outside the API.
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+import server
+
+async def main():
+    print(f"Rebuilding tool bookings in database: {server.db.name}")
+    bookings = await server.rebuild_tool_bookings()
+    print(f"\n✅ Rebuilt {bookings} tool booking(s)")
+    server.client.close()
+
+asyncio.run(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Stock Concurrency Stress Test
+Creates a throwaway stock item, hammers it with concurrent consumes and
+additions, then checks that the final quantity never went negative and
+equals the sum of its stock movement ledger.
+
+Usage: python stock_stress_test.py [--base-url URL] [--workers 32] [--operations 500]
+"""
+
+import argparse
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+def consume(api_url, item_id, quantity):
+    response = requests.post(
+        f"{api_url}/stock/consume",
+        json={"item_id": item_id, "quantity": quantity, "reason": "stress test"},
+        timeout=60
+    )
+    return "consume", response.status_code
+
+def add(api_url, item_id, quantity):
+    response = requests.put(
+        f"{api_url}/stock/{item_id}",
+        json={"available_quantity": quantity, "reason": "stress test"},
+        timeout=60
+    )
+    return "add", response.status_code
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--workers", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--operations", type=int, default=500, help="Total consumes and additions")
+    parser.add_argument("--initial-quantity", type=int, default=100)
+    parser.add_argument("--add-ratio", type=float, default=0.2, help="Share of operations that add stock")
+    args = parser.parse_args()
+
+    api_url = f"{args.base_url}/api"
+
+    print("=" * 60)
+    print("STOCK CONCURRENCY STRESS TEST")
+    print("=" * 60)
+
+    print("\n[1/3] Creating test item...")
+    response = requests.post(f"{api_url}/stock", json={
+        "item_name": f"Stress test {uuid.uuid4().hex[:8]}",
+        "brand_specifications": "stress test",
+        "available_quantity": args.initial_quantity,
+        "unit": "pcs"
+    }, timeout=30)
+    response.raise_for_status()
+    item_id = response.json()["id"]
+
+    try:
+        print(f"\n[2/3] Running {args.operations} operations on {args.workers} workers...")
+        rng = random.Random(0)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            futures = [
+                pool.submit(add, api_url, item_id, rng.randint(1, 5))
+                if rng.random() < args.add_ratio
+                else pool.submit(consume, api_url, item_id, rng.randint(1, 3))
+                for _ in range(args.operations)
+            ]
+            results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+
+        counts = {}
+        for kind, status in results:
+            counts[(kind, status)] = counts.get((kind, status), 0) + 1
+        for (kind, status), count in sorted(counts.items()):
+            print(f"   {kind} -> {status}: {count}")
+        print(f"   throughput: {len(results) / elapsed:.1f} ops/s")
+
+        print("\n[3/3] Verifying ledger...")
+        item = next(i for i in requests.get(f"{api_url}/stock", timeout=30).json() if i["id"] == item_id)
+        movements = requests.get(
+            f"{api_url}/stock/{item_id}/movements", params={"limit": 1000}, timeout=30
+        ).json()
+        ledger_total = sum(m["quantity"] for m in movements)
+        unexpected = [status for _, status in results if status not in (200, 400)]
+
+        print(f"   final quantity: {item['available_quantity']}")
+        print(f"   ledger sum:     {ledger_total} ({len(movements)} movements)")
+        ok = (
+            item["available_quantity"] >= 0
+            and item["available_quantity"] == ledger_total
+            and len(movements) < 1000
+            and not unexpected
+        )
+        if len(movements) >= 1000:
+            print("   ⚠️ Ledger exceeds one page; lower --operations to verify it")
+        print(f"\n{'✅ Consistent' if ok else '❌ Inconsistent'}")
+        return 0 if ok else 1
+    finally:
+        requests.delete(f"{api_url}/stock/{item_id}", timeout=30)
+
+if __name__ == "__main__":
+    sys.exit(main())
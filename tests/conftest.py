@@ -0,0 +1,33 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'tool_management_test')
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+import server
+
+@pytest.fixture(scope="session")
+def client():
+    """API client backed by an in-memory MongoDB, shared by the session since
+    app shutdown closes process-wide executors; tests use their own records"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from fastapi.testclient import TestClient
+
+    original_client, original_db = server.client, server.db
+    server.client = mongomock_motor.AsyncMongoMockClient()
+    server.db = server.client[os.environ['DB_NAME']]
+    server.user_cache.invalidate()
+    try:
+        with TestClient(server.app) as test_client:
+            yield test_client
+    finally:
+        server.client, server.db = original_client, original_db
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    response = client.post("/api/auth/login", json={"username": "admin", "password": "admin123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
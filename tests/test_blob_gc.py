@@ -0,0 +1,55 @@
+import asyncio
+import hashlib
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+def stored_blob(client, **fields):
+    """Blob record plus file for fresh content; returns its SHA-256"""
+    content = uuid.uuid4().bytes
+    sha256 = hashlib.sha256(content).hexdigest()
+    path = server.ROOT_DIR / server.blob_relative_path(sha256)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    client.portal.call(server.db.blobs.insert_one, {
+        "sha256": sha256, "size": len(content), "refcount": 0,
+        "released_at": "2000-01-01T00:00:00+00:00", **fields
+    })
+    return sha256
+
+def test_hash_attach_refuses_a_blob_being_collected(client):
+    sha256 = stored_blob(client, deleting=True)
+
+    with pytest.raises(HTTPException) as error:
+        client.portal.call(server.store_attachment, "certificate", None, sha256, None)
+    assert error.value.status_code == 404
+    blob = client.portal.call(server.db.blobs.find_one, {"sha256": sha256})
+    assert blob["refcount"] == 0
+
+def test_upload_waits_for_the_collector_to_drop_the_record(client):
+    sha256 = stored_blob(client, deleting=True)
+
+    async def collect_then_acquire():
+        async def collector():
+            await asyncio.sleep(0.05)
+            await server.db.blobs.delete_one({"sha256": sha256, "deleting": True})
+        await asyncio.gather(server.acquire_blob(sha256, 16), collector())
+
+    client.portal.call(collect_then_acquire)
+    blob = client.portal.call(server.db.blobs.find_one, {"sha256": sha256})
+    assert blob["refcount"] == 1
+    assert "deleting" not in blob
+
+def test_collector_skips_reacquired_blobs_and_finishes_interrupted_ones(client):
+    referenced = stored_blob(client, refcount=1)
+    interrupted = stored_blob(client, deleting=True)
+
+    client.portal.call(server.collect_blob_garbage, 0)
+
+    assert (server.ROOT_DIR / server.blob_relative_path(referenced)).exists()
+    assert client.portal.call(server.db.blobs.find_one, {"sha256": referenced}) is not None
+    assert not (server.ROOT_DIR / server.blob_relative_path(interrupted)).exists()
+    assert client.portal.call(server.db.blobs.find_one, {"sha256": interrupted}) is None
@@ -0,0 +1,54 @@
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from tests.test_tool_summaries import create_tool
+
+def test_single_ranges():
+    assert server.parse_byte_range("bytes=0-9", 100) == (0, 9)
+    assert server.parse_byte_range("bytes=90-", 100) == (90, 99)
+    assert server.parse_byte_range("bytes=90-500", 100) == (90, 99)
+
+def test_suffix_ranges():
+    assert server.parse_byte_range("bytes=-10", 100) == (90, 99)
+    # A suffix longer than the file is the whole file
+    assert server.parse_byte_range("bytes=-500", 100) == (0, 99)
+    with pytest.raises(HTTPException) as error:
+        server.parse_byte_range("bytes=-0", 100)
+    assert error.value.status_code == 416
+
+def test_start_past_the_end_is_unsatisfiable():
+    with pytest.raises(HTTPException) as error:
+        server.parse_byte_range("bytes=100-", 100)
+    assert error.value.status_code == 416
+    assert error.value.headers["Content-Range"] == "bytes */100"
+
+def test_multiple_and_malformed_ranges_send_the_whole_file():
+    assert server.parse_byte_range("bytes=0-9,20-29", 100) is None
+    assert server.parse_byte_range("items=0-9", 100) is None
+    assert server.parse_byte_range("bytes=abc-", 100) is None
+    assert server.parse_byte_range("bytes=20-10", 100) is None
+
+def test_range_requests_honour_if_range(client, auth_headers):
+    serial_no = f"SN-RANGE-{uuid.uuid4().hex[:8]}"
+    create_tool(client, auth_headers, "Oscilloscope", serial_no)
+    tool = next(t for t in client.get("/api/tools", params={"search": serial_no}, headers=auth_headers).json()["items"]
+                if t["serial_no"] == serial_no)
+    content = uuid.uuid4().hex.encode() * 4
+    response = client.post(f"/api/tools/{tool['id']}/upload-certificate",
+                           files={"file": ("certificate.pdf", content, "application/pdf")}, headers=auth_headers)
+    assert response.status_code == 200
+    url = f"/api/tools/{tool['id']}/download-certificate"
+    etag = client.get(url, headers=auth_headers).headers["etag"]
+
+    partial = client.get(url, headers={**auth_headers, "Range": "bytes=-8", "If-Range": etag})
+    assert partial.status_code == 206
+    assert partial.content == content[-8:]
+    assert partial.headers["content-range"] == f"bytes {len(content) - 8}-{len(content) - 1}/{len(content)}"
+
+    # A validator for other content means the client's copy is stale: send everything
+    stale = client.get(url, headers={**auth_headers, "Range": "bytes=-8", "If-Range": '"stale"'})
+    assert stale.status_code == 200
+    assert stale.content == content
@@ -0,0 +1,23 @@
+import base64
+import json
+
+import pytest
+
+import server
+
+def raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    raw_cursor({"created_at": "2026-01-01"}),
+    raw_cursor(["2026-01-01"]),
+    raw_cursor(["2026-01-01", "id", "extra"]),
+    raw_cursor([{"$gt": ""}, "id"]),
+])
+def test_malformed_cursor_is_a_bad_request(client, auth_headers, cursor):
+    assert client.get("/api/tools", params={"cursor": cursor}, headers=auth_headers).status_code == 400
+    assert client.get("/api/tools/calibration-due", params={"cursor": cursor}, headers=auth_headers).status_code == 400
+
+def test_cursor_round_trips():
+    assert server.decode_cursor(server.encode_cursor(None, "tool-1")) == [None, "tool-1"]
@@ -0,0 +1,33 @@
+import io
+import uuid
+import zipfile
+
+import server
+
+def create_tool(client, auth_headers, serial_no):
+    response = client.post("/api/tools", json={
+        "equipment_name": "Torque Wrench",
+        "serial_no": serial_no,
+        "inventory_code": f"INV-{serial_no}",
+        "brand_type": "Norbar",
+        "condition": "Good",
+        "equipment_location": "Workshop"
+    }, headers=auth_headers)
+    return response.json()["id"]
+
+def test_label_zip_holds_every_label(client, auth_headers):
+    tool_ids = [create_tool(client, auth_headers, f"SN-LABEL-{uuid.uuid4().hex[:8]}") for _ in range(2)]
+    response = client.post(
+        "/api/tools/labels/batch", json={"tool_ids": tool_ids, "format": "zip"}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert len(zipfile.ZipFile(io.BytesIO(response.content)).namelist()) == 2
+
+def test_label_zip_reports_a_full_render_queue(client, auth_headers, monkeypatch):
+    # A fresh serial, so the label is not in the cache and has to be rendered
+    tool_id = create_tool(client, auth_headers, f"SN-LABEL-{uuid.uuid4().hex[:8]}")
+    monkeypatch.setattr(server.render_pool, "max_pending", 0)
+    response = client.post(
+        "/api/tools/labels/batch", json={"tool_ids": [tool_id], "format": "zip"}, headers=auth_headers
+    )
+    assert response.status_code == 503
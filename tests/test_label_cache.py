@@ -0,0 +1,18 @@
+import asyncio
+import os
+
+import server
+
+def test_prune_keeps_most_recently_used_labels(tmp_path):
+    cache = server.LabelCache(tmp_path, max_entries=4, max_bytes=250)
+    for number, key in enumerate(("oldest", "middle", "newest")):
+        path = tmp_path / f"{key}.png"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (1_000_000 + number, 1_000_000 + number))
+
+    # Reading a label from disk counts as a use
+    assert asyncio.run(cache.get("oldest")) == b"x" * 100
+    removed = asyncio.run(cache.prune())
+
+    assert removed == {"files": 1, "bytes": 100}
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["newest.png", "oldest.png"]
@@ -0,0 +1,11 @@
+import server
+from tests.test_tool_bookings import loan_payload
+
+def test_loan_zip_reports_a_full_render_queue(client, auth_headers, monkeypatch):
+    payload = {**loan_payload("Ann", "2020-03-01", "2020-03-05", "SN-LOAN-EXPORT"), "project_name": "Export Queue"}
+    assert client.post("/api/loans", json=payload, headers=auth_headers).status_code == 200
+    monkeypatch.setattr(server.render_pool, "max_pending", 0)
+    response = client.post(
+        "/api/loans/export/batch", json={"project_name": "Export Queue", "format": "zip"}, headers=auth_headers
+    )
+    assert response.status_code == 503
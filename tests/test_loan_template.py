@@ -0,0 +1,48 @@
+import copy
+import io
+import zipfile
+
+from lxml import etree
+
+import server
+
+def split_template(path, marker):
+    """Copy of the loan template with each run holding `marker` split in two mid-marker"""
+    with zipfile.ZipFile(server.LOAN_TEMPLATE_PATH) as source, zipfile.ZipFile(path, "w") as target:
+        for info in source.infolist():
+            data = source.read(info)
+            if info.filename == "word/document.xml":
+                document = etree.fromstring(data)
+                for node in list(document.iter(f"{server.WORD_NS}t")):
+                    if node.text and marker in node.text:
+                        head, cut, tail = node.text.partition(marker)
+                        run = node.getparent()
+                        second = copy.deepcopy(run)
+                        run.addnext(second)
+                        node.text = head + marker[:len(marker) // 2]
+                        second.find(f"{server.WORD_NS}t").text = marker[len(marker) // 2:] + tail
+                data = etree.tostring(document, xml_declaration=True, encoding="UTF-8", standalone=True)
+            target.writestr(info, data)
+
+def document_text(docx: bytes) -> str:
+    with zipfile.ZipFile(io.BytesIO(docx)) as archive:
+        return "".join(etree.fromstring(archive.read("word/document.xml")).itertext())
+
+def test_markers_split_across_runs_are_filled(tmp_path):
+    for number, marker in enumerate(("{{ project_name }}", "{{ item.serial_no }}")):
+        template_path = tmp_path / f"split_{number}.docx"
+        split_template(template_path, marker)
+        text = document_text(server.LoanTemplate(template_path).render(
+            {"project_name": "Bridge Survey"},
+            [{"no": 1, "equipment_name": "Multimeter", "serial_no": "SN-SPLIT", "quantity": "1", "condition": "Good"}]
+        ))
+        assert "{{" not in text and "}}" not in text
+        assert "Bridge Survey" in text
+        assert "SN-SPLIT" in text
+
+def test_unsplit_template_is_unchanged():
+    original = server.LoanTemplate(server.LOAN_TEMPLATE_PATH)
+    _, document = original.compiled()
+    with zipfile.ZipFile(server.LOAN_TEMPLATE_PATH) as source:
+        pristine = etree.fromstring(source.read("word/document.xml"))
+    assert etree.tostring(document) == etree.tostring(pristine)
@@ -0,0 +1,20 @@
+from datetime import datetime, timedelta, timezone
+
+import server
+from tests.test_tool_bookings import loan_payload
+
+def test_report_keeps_counts_for_rows_past_the_cap(client, auth_headers, monkeypatch):
+    today = datetime.now(timezone.utc).date()
+    for days_overdue, serial_no in ((3, "SN-LOST-1"), (40, "SN-LOST-2")):
+        due = today - timedelta(days=days_overdue)
+        payload = loan_payload("Ann", (due - timedelta(days=5)).isoformat(), due.isoformat(), serial_no)
+        assert client.post("/api/loans", json=payload, headers=auth_headers).status_code == 200
+
+    monkeypatch.setattr(server, "LOST_TOOLS_REPORT_MAX_ROWS", 1)
+    client.portal.call(server.refresh_lost_tools_report)
+    report = client.get("/api/analysis/tools-lost", headers=auth_headers).json()
+
+    assert report["total"] >= 2 and report["truncated"]
+    assert len(report["potential_lost"]) == 1
+    assert report["potential_lost"][0]["days_overdue"] >= 40
+    assert sum(row["count"] for row in report["by_days_overdue"]) == report["total"]
@@ -0,0 +1,79 @@
+import uuid
+
+import server
+
+def create_stock_item(client, auth_headers, quantity):
+    response = client.post("/api/stock", json={
+        "item_name": f"Cable ties {uuid.uuid4().hex[:8]}",
+        "brand_specifications": "200 mm",
+        "available_quantity": quantity,
+        "unit": "pcs"
+    }, headers=auth_headers)
+    assert response.status_code == 200
+    return response.json()
+
+def movements(client, auth_headers, item_id):
+    response = client.get(f"/api/stock/{item_id}/movements", headers=auth_headers)
+    assert response.status_code == 200
+    return sorted(response.json(), key=lambda movement: movement["created_at"])
+
+def test_quantity_changes_are_recorded_in_the_ledger(client, auth_headers):
+    item = create_stock_item(client, auth_headers, 10)
+    assert client.post("/api/stock/consume", json={
+        "item_id": item["id"], "quantity": 4, "reason": "Site A"
+    }, headers=auth_headers).status_code == 200
+    assert client.put(f"/api/stock/{item['id']}", json={
+        "available_quantity": 5, "reason": "Delivery"
+    }, headers=auth_headers).status_code == 200
+
+    ledger = [(m["kind"], m["quantity"], m["balance_after"]) for m in movements(client, auth_headers, item["id"])]
+    assert ledger == [("add", 10, 10), ("consume", -4, 6), ("add", 5, 11)]
+
+def test_rejected_consume_leaves_no_ledger_entry(client, auth_headers):
+    item = create_stock_item(client, auth_headers, 2)
+    response = client.post("/api/stock/consume", json={"item_id": item["id"], "quantity": 3}, headers=auth_headers)
+    assert response.status_code == 400
+    assert len(movements(client, auth_headers, item["id"])) == 1
+
+def ledger_in_insert_order(client, item_ids):
+    async def fetch():
+        return await server.db.stock_movements.find({"item_id": {"$in": item_ids}}, {"_id": 0}).to_list(None)
+    return client.portal.call(fetch)
+
+def test_batch_is_rejected_as_a_whole(client, auth_headers):
+    plenty = create_stock_item(client, auth_headers, 10)
+    scarce = create_stock_item(client, auth_headers, 1)
+
+    response = client.post("/api/stock/batch", json={"lines": [
+        {"item_id": plenty["id"], "quantity": 3},
+        {"item_id": scarce["id"], "quantity": 2},
+        {"item_id": "missing", "quantity": 1}
+    ]}, headers=auth_headers)
+
+    assert response.status_code == 400
+    statuses = [line["status"] for line in response.json()["detail"]["lines"]]
+    assert statuses == ["ok", "error", "error"]
+    stock = {item["id"]: item["available_quantity"] for item in client.get("/api/stock", headers=auth_headers).json()}
+    assert stock[plenty["id"]] == 10 and stock[scarce["id"]] == 1
+    assert len(ledger_in_insert_order(client, [plenty["id"], scarce["id"]])) == 2
+
+def test_batch_checks_the_net_change_of_a_repeated_item(client, auth_headers):
+    item = create_stock_item(client, auth_headers, 7)
+
+    # 7 + 6 - 8 - 1 stays in stock even though 8 alone would not
+    response = client.post("/api/stock/batch", json={"reason": "Site B", "lines": [
+        {"item_id": item["id"], "kind": "add", "quantity": 6},
+        {"item_id": item["id"], "quantity": 8},
+        {"item_id": item["id"], "quantity": 1, "reason": "Spares"}
+    ]}, headers=auth_headers)
+
+    assert response.status_code == 200
+    assert [line["remaining_quantity"] for line in response.json()["lines"]] == [4, 4, 4]
+    ledger = [(m["kind"], m["quantity"], m["balance_after"], m["reason"])
+              for m in ledger_in_insert_order(client, [item["id"]])]
+    assert ledger == [
+        ("add", 7, 7, "Initial stock"),
+        ("add", 6, 13, "Site B"),
+        ("consume", -8, 5, "Site B"),
+        ("consume", -1, 4, "Spares")
+    ]
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta, timezone
+
+def loan_payload(borrower, loan_date, return_date, serial_no):
+    return {
+        "borrower_name": borrower,
+        "loan_date": loan_date,
+        "return_date": return_date,
+        "equipments": [{"equipment_name": "Multimeter", "serial_no": serial_no, "condition": "Good"}],
+        "project_name": "Project A",
+        "wbs_project_no": "WBS-1",
+        "project_location": "Site 1",
+    }
+
+def test_overlapping_loan_is_rejected(client, auth_headers):
+    today = datetime.now(timezone.utc).date()
+    first = loan_payload("Ann", today.isoformat(), (today + timedelta(days=5)).isoformat(), "SN-OVERLAP")
+    assert client.post("/api/loans", json=first, headers=auth_headers).status_code == 200
+
+    second = loan_payload("Bob", (today + timedelta(days=5)).isoformat(), (today + timedelta(days=7)).isoformat(), "SN-OVERLAP")
+    response = client.post("/api/loans", json=second, headers=auth_headers)
+    assert response.status_code == 409
+
+def test_tool_returned_today_can_be_lent_again_today(client, auth_headers):
+    today = datetime.now(timezone.utc).date()
+    first = loan_payload("Ann", (today - timedelta(days=3)).isoformat(), (today + timedelta(days=5)).isoformat(), "SN-RELEND")
+    loan = client.post("/api/loans", json=first, headers=auth_headers).json()
+
+    response = client.post(f"/api/loans/{loan['id']}/return", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["returned_at"]
+
+    bookings = client.get("/api/tools/bookings", params={"date_from": today.isoformat(), "serial_no": "SN-RELEND"}).json()
+    assert bookings == []
+
+    second = loan_payload("Bob", today.isoformat(), (today + timedelta(days=2)).isoformat(), "SN-RELEND")
+    assert client.post("/api/loans", json=second, headers=auth_headers).status_code == 200
+
+def test_loan_returned_on_its_first_day_holds_no_booking(client, auth_headers):
+    today = datetime.now(timezone.utc).date()
+    loan = client.post(
+        "/api/loans",
+        json=loan_payload("Ann", today.isoformat(), (today + timedelta(days=5)).isoformat(), "SN-SAMEDAY"),
+        headers=auth_headers
+    ).json()
+    client.post(f"/api/loans/{loan['id']}/return", headers=auth_headers)
+
+    bookings = client.get(
+        "/api/tools/bookings",
+        params={
+            "date_from": (today - timedelta(days=30)).isoformat(),
+            "date_to": (today + timedelta(days=30)).isoformat(),
+            "serial_no": "SN-SAMEDAY"
+        }
+    ).json()
+    assert bookings == []
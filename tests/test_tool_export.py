@@ -0,0 +1,31 @@
+import io
+
+from openpyxl import load_workbook
+
+import server
+
+def test_excel_export_lists_every_tool(client, auth_headers):
+    serials = [f"SN-EXPORT-{number}" for number in range(3)]
+    for serial_no in serials:
+        response = client.post("/api/tools", json={
+            "equipment_name": "Pressure Gauge",
+            "serial_no": serial_no,
+            "inventory_code": f"INV-{serial_no}",
+            "brand_type": "Wika",
+            "condition": "Good",
+            "equipment_location": "Workshop"
+        }, headers=auth_headers)
+        assert response.status_code == 200
+
+    response = client.get("/api/tools/export/excel", headers=auth_headers)
+    assert response.status_code == 200
+
+    rows = list(load_workbook(io.BytesIO(response.content), read_only=True).active.iter_rows(values_only=True))
+    assert rows[0][:4] == ("No.", "Equipment Name", "Brand/Type", "Serial No.")
+    assert [row[0] for row in rows[1:]] == list(range(1, len(rows)))
+    assert set(serials) <= {row[3] for row in rows[1:]}
+
+def test_excel_export_reports_a_full_render_queue(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(server.render_pool, "max_pending", 0)
+    response = client.get("/api/tools/export/excel", headers=auth_headers)
+    assert response.status_code == 503
@@ -0,0 +1,69 @@
+import csv
+import io
+import uuid
+
+import server
+from tests.test_tool_summaries import create_tool
+
+HEADERS = ["Equipment Name", "Brand/Type", "Serial No.", "Inventory Code", "Condition", "Equipment Location"]
+
+def import_csv(client, auth_headers, rows, dry_run=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADERS)
+    writer.writerows(rows)
+    response = client.post(
+        "/api/tools/import",
+        files={"file": ("tools.csv", buffer.getvalue().encode(), "text/csv")},
+        data={"dry_run": str(dry_run).lower()},
+        headers=auth_headers
+    )
+    assert response.status_code == 200
+    return response.json()
+
+def row(serial_no, inventory_code=None):
+    return ["Torque Wrench", "Norbar", serial_no, inventory_code or f"INV-{serial_no}", "Good", "Store"]
+
+def stored_serials(client, serials):
+    async def fetch():
+        return await server.db.tools.distinct("serial_no", {"serial_no": {"$in": serials}})
+    return set(client.portal.call(fetch))
+
+def test_duplicates_within_the_file_are_reported(client, auth_headers):
+    prefix = uuid.uuid4().hex[:8]
+    first, second = f"SN-{prefix}-1", f"SN-{prefix}-2"
+    result = import_csv(client, auth_headers, [
+        row(first),
+        row(first, f"INV-{prefix}-other"),
+        row(second, f"INV-{first}")
+    ])
+
+    assert (result["imported"], result["failed"]) == (1, 2)
+    assert [error["row"] for error in result["errors"]] == [3, 4]
+    assert result["errors"][0]["errors"] == [f"serial_no: {first} repeats row 2"]
+    assert result["errors"][1]["errors"] == [f"inventory_code: INV-{first} repeats row 2"]
+    assert stored_serials(client, [first, second]) == {first}
+
+def test_duplicates_of_the_register_are_reported(client, auth_headers):
+    prefix = uuid.uuid4().hex[:8]
+    existing, new = f"SN-{prefix}-1", f"SN-{prefix}-2"
+    create_tool(client, auth_headers, "Torque Wrench", existing)
+
+    result = import_csv(client, auth_headers, [row(existing, f"INV-{prefix}-other"), row(new)])
+
+    assert (result["imported"], result["failed"]) == (1, 1)
+    assert result["errors"][0]["row"] == 2
+    assert result["errors"][0]["errors"] == [f"serial_no: {existing} is already in the register"]
+    assert stored_serials(client, [existing, new]) == {existing, new}
+
+def test_dry_run_validates_without_inserting(client, auth_headers):
+    prefix = uuid.uuid4().hex[:8]
+    serials = [f"SN-{prefix}-1", f"SN-{prefix}-2"]
+    before = client.get("/api/tools/counts", headers=auth_headers).json()["total"]
+
+    result = import_csv(client, auth_headers, [row(serials[0]), row(serials[1]), row(serials[0])], dry_run=True)
+
+    assert result["dry_run"] is True
+    assert (result["imported"], result["failed"]) == (2, 1)
+    assert stored_serials(client, serials) == set()
+    assert client.get("/api/tools/counts", headers=auth_headers).json()["total"] == before
@@ -0,0 +1,27 @@
+def create_tool(client, auth_headers, equipment_name, serial_no, condition="Good"):
+    response = client.post("/api/tools", json={
+        "equipment_name": equipment_name,
+        "serial_no": serial_no,
+        "inventory_code": f"INV-{serial_no}",
+        "brand_type": "Fluke",
+        "condition": condition,
+        "equipment_location": "Workshop"
+    }, headers=auth_headers)
+    assert response.status_code == 200
+
+def test_equipment_names_cover_the_whole_register(client, auth_headers):
+    create_tool(client, auth_headers, "Zz Borescope", "SN-NAMES-1")
+    create_tool(client, auth_headers, "Zz Borescope", "SN-NAMES-2")
+
+    names = client.get("/api/tools/equipment-names", headers=auth_headers).json()
+    assert names.count("Zz Borescope") == 1
+    assert names == sorted(names)
+
+def test_tool_counts_match_the_register(client, auth_headers):
+    before = client.get("/api/tools/counts", headers=auth_headers).json()
+    create_tool(client, auth_headers, "Clamp Meter", "SN-COUNTS-1", condition="Damaged")
+    after = client.get("/api/tools/counts", headers=auth_headers).json()
+
+    assert after["total"] == before["total"] + 1
+    assert after["by_condition"]["Damaged"] == before["by_condition"].get("Damaged", 0) + 1
+    assert sum(after["by_status"].values()) == after["total"]
@@ -0,0 +1,37 @@
+import httpx
+
+import server
+
+def multipart_request(size):
+    return httpx.Request(
+        "POST", "http://testserver/api/tools/missing/upload-certificate",
+        files={"file": ("certificate.pdf", b"x" * size, "application/pdf")}
+    )
+
+def test_oversized_upload_is_refused_from_its_content_length(client, monkeypatch):
+    monkeypatch.setitem(server.UPLOAD_MAX_BYTES, "certificate", 1024)
+    request = multipart_request(server.UPLOAD_FORM_OVERHEAD_BYTES + 4096)
+    response = client.post(request.url.path, content=request.read(), headers={
+        "content-type": request.headers["content-type"]
+    })
+    assert response.status_code == 413
+
+def test_oversized_chunked_upload_is_cut_off(client, monkeypatch):
+    monkeypatch.setitem(server.UPLOAD_MAX_BYTES, "certificate", 1024)
+    request = multipart_request(server.UPLOAD_FORM_OVERHEAD_BYTES + 4096)
+    body = request.read()
+    # A generator body is sent chunked, without a Content-Length
+    response = client.post(
+        request.url.path,
+        content=(body[start:start + 8192] for start in range(0, len(body), 8192)),
+        headers={"content-type": request.headers["content-type"]}
+    )
+    assert "content-length" not in response.request.headers
+    assert response.status_code == 413
+
+def test_upload_under_the_cap_reaches_the_endpoint(client):
+    request = multipart_request(16)
+    response = client.post(request.url.path, content=request.read(), headers={
+        "content-type": request.headers["content-type"]
+    })
+    assert response.status_code == 404